@@ -11,6 +11,7 @@ urlpatterns = [
     path('api/logs/', views.admin_logs_api, name='logs_api'),
     path('logout/', views.admin_logout, name='logout'),
     path('test-erp/', views.admin_test_erp, name='test_erp'),
+    path('api/erp-stats/', views.admin_erp_stats_api, name='erp_stats_api'),
 
     # User Management
     path('users/', views.admin_users_page, name='users_page'),
@@ -211,6 +211,21 @@ def admin_test_erp(request):
     })
 
 
+@require_http_methods(["GET"])
+def admin_erp_stats_api(request):
+    """ERP client runtime stats (endpoint latency, pool, caches) for this worker"""
+    if not request.session.get('admin_logged_in'):
+        return JsonResponse({'error': 'Not authenticated'}, status=401)
+
+    return JsonResponse({
+        'endpoints': erp_client.metrics.snapshot()['endpoints'],
+        'pool': erp_client.get_pool_stats(),
+        'resilience': erp_client.get_resilience_stats(),
+        'cache': erp_client.response_cache.get_stats(),
+        'tokens': erp_client.token_cache.get_stats()
+    })
+
+
 # ============================================================================
 # USER MANAGEMENT
 # ============================================================================
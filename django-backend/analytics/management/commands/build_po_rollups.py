@@ -0,0 +1,44 @@
+"""
+Django management command to rebuild the daily purchase order rollups
+
+Imports keep the rollups current. Run this once for data imported before
+the rollups existed, or after an import logged a rollup failure. Existing
+rollups (of --company, or all) are replaced in one commit. Run it while no
+imports are in progress.
+
+Usage: python manage.py build_po_rollups [--company=heritage]
+"""
+
+import logging
+from django.core.management.base import BaseCommand
+
+from analytics.views_parquet_import import get_dataset
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the daily purchase order rollups from the Parquet dataset'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--company',
+            type=str,
+            help='Rebuild only this company (e.g., heritage, metro)',
+        )
+
+    def handle(self, *args, **options):
+        """Main command handler"""
+        dataset = get_dataset()
+        self.stdout.write(f'[PO Rollups] Rebuilding {dataset.rollups.uri} from {dataset.uri}')
+
+        stats = dataset.rollups.rebuild(dataset, company_code=options.get('company'))
+        self.stdout.write(
+            f"[PO Rollups] Aggregated {stats['rows_read']:,} purchase orders into "
+            f"{stats['rollup_rows']:,} rollup rows in {stats['partitions']} partitions"
+        )
+
+        from services.duckdb_client import duckdb_client
+        duckdb_client.invalidate_results(dataset.rollups.uri)
+
+        self.stdout.write(self.style.SUCCESS('[PO Rollups] Done'))
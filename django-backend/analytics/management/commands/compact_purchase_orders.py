@@ -0,0 +1,82 @@
+"""
+Django management command to compact the purchase orders Parquet dataset
+
+Every CSV import adds one small fragment per company/month it touches.
+This merges the small fragments of each partition into one file and deletes
+files that were replaced (by compaction or a replace import) more than
+--grace-minutes ago. The daily rollups get the same treatment.
+
+Run it on a schedule (e.g. hourly via Railway cron or system cron). It is
+safe next to running imports and other compactions: a compaction commit
+whose source fragments were removed meanwhile (by a replace import or
+another compaction) has no effect.
+
+Usage: python manage.py compact_purchase_orders [--company=heritage] [--min-fragments=4]
+"""
+
+import logging
+from django.core.management.base import BaseCommand
+from decouple import config
+
+from analytics.views_parquet_import import get_dataset
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Merge small purchase order Parquet fragments and delete replaced files'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--company',
+            type=str,
+            help='Compact only this company (e.g., heritage, metro)',
+        )
+        parser.add_argument(
+            '--min-fragments',
+            type=int,
+            default=config('PO_COMPACT_MIN_FRAGMENTS', default=4, cast=int),
+            help='Compact a partition once it has this many small fragments',
+        )
+        parser.add_argument(
+            '--small-mb',
+            type=int,
+            default=config('PO_COMPACT_SMALL_MB', default=64, cast=int),
+            help='Fragments below this size (MB) are merged',
+        )
+        parser.add_argument(
+            '--grace-minutes',
+            type=int,
+            default=config('PO_COMPACT_GRACE_MINUTES', default=60, cast=int),
+            help='Keep replaced files this long for readers with an older file list',
+        )
+        parser.add_argument(
+            '--skip-vacuum',
+            action='store_true',
+            help='Only merge fragments; do not delete replaced files',
+        )
+
+    def handle(self, *args, **options):
+        """Main command handler"""
+        dataset = get_dataset()
+        for target in (dataset, dataset.rollups):
+            self.stdout.write(f'[PO Compaction] Compacting {target.uri}')
+
+            stats = target.compact(
+                min_fragments=options['min_fragments'],
+                small_bytes=options['small_mb'] * 1024 * 1024,
+                company_code=options.get('company')
+            )
+            self.stdout.write(
+                f"[PO Compaction] Merged {stats['fragments_merged']} fragments "
+                f"in {stats['partitions_compacted']} partitions ({stats['rows']:,} rows)"
+            )
+
+            if not options['skip_vacuum']:
+                vacuum = target.vacuum(grace_seconds=options['grace_minutes'] * 60)
+                self.stdout.write(
+                    f"[PO Compaction] Deleted {vacuum['deleted_files']} replaced files, "
+                    f"{vacuum['deleted_manifests']} old manifests"
+                )
+
+        self.stdout.write(self.style.SUCCESS('[PO Compaction] Done'))
@@ -0,0 +1,33 @@
+"""
+Django management command to remove duplicate purchase orders from MongoDB
+
+Imports upsert on (company_code, po_number), backed by a unique index.
+Imports from before that could store the same PO number twice, which
+keeps the index from being created. This keeps the most recently imported
+copy of each PO and then creates the index.
+
+Usage: python manage.py dedupe_purchase_orders
+"""
+
+import logging
+from django.core.management.base import BaseCommand
+
+from services.analytics_mongodb_service import analytics_mongodb
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Remove duplicate (company_code, po_number) purchase orders and create the unique index'
+
+    def handle(self, *args, **options):
+        """Main command handler"""
+        self.stdout.write('[PO Dedupe] Looking for duplicate PO numbers...')
+        deleted = analytics_mongodb.remove_duplicate_purchase_orders()
+        self.stdout.write(f'[PO Dedupe] Deleted {deleted:,} duplicate purchase orders')
+
+        analytics_mongodb.create_indexes()
+        if 'company_po_number' in analytics_mongodb.purchase_orders.index_information():
+            self.stdout.write(self.style.SUCCESS('[PO Dedupe] Unique (company_code, po_number) index in place'))
+        else:
+            self.stdout.write(self.style.ERROR('[PO Dedupe] Unique index still missing; see the log for details'))
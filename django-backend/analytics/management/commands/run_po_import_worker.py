@@ -0,0 +1,154 @@
+"""
+Django management command to run the PO CSV import workers
+
+Runs --processes worker processes that claim jobs from the po_import_jobs
+queue (services/po_import_queue.py), download the CSV from GridFS and
+stream it into purchase_orders, checkpointing after every batch. Run it as
+its own long-lived service next to gunicorn (on Railway: a second service
+using railway.worker.toml, see PO_IMPORT_WORKER.md); more instances can run
+on other hosts.
+
+SIGTERM/SIGINT stop the workers after their current batch. The job is put
+back in the queue and the next worker resumes it from that batch.
+
+Usage: python manage.py run_po_import_worker [--processes=2] [--once]
+"""
+
+import logging
+import multiprocessing
+import os
+import signal
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand
+from decouple import config
+
+from analytics.views import process_csv_import
+from services.analytics_mongodb_service import analytics_mongodb
+from services.po_import_queue import JobLeaseLost, import_job_queue
+
+logger = logging.getLogger(__name__)
+
+
+class WorkerStopping(Exception):
+    """Raised at a checkpoint once the worker has been asked to stop"""
+
+
+def run_job(job, stop_event):
+    """Download and import one claimed job, then complete, release or fail it"""
+    fd, path = tempfile.mkstemp(prefix='po-import-', suffix='.csv')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            import_job_queue.download(job, f)
+
+        def on_checkpoint(state):
+            import_job_queue.checkpoint(job, state)
+            if stop_event.is_set():
+                raise WorkerStopping()
+
+        process_csv_import(
+            path, job['file_size'], job['skip_rows'], job['overwrite_mode'], job['_id'],
+            job['company_code'], job['user_email'], job['filename'],
+            checkpoint=job.get('checkpoint'), on_checkpoint=on_checkpoint
+        )
+        import_job_queue.complete(job)
+
+    except WorkerStopping:
+        import_job_queue.release(job)
+    except JobLeaseLost as e:
+        logger.warning(str(e))
+    except Exception as e:
+        try:
+            import_job_queue.fail(job, e)
+        except JobLeaseLost as lost:
+            logger.warning(str(lost))
+    finally:
+        os.unlink(path)
+
+
+def worker_loop(stop_event, poll_interval, once=False):
+    """Claim and run jobs until stop_event is set (or the queue is empty, with once)"""
+    while not stop_event.is_set():
+        import_job_queue.fail_abandoned()
+        job = import_job_queue.claim()
+        if job is None:
+            if once:
+                return
+            stop_event.wait(poll_interval)
+            continue
+        run_job(job, stop_event)
+
+
+def _process_main(stop_event, poll_interval, once):
+    # MongoClient is not fork-safe; each process opens its own connection.
+    # The parent handles SIGINT/SIGTERM and sets stop_event.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    analytics_mongodb.connect()
+    worker_loop(stop_event, poll_interval, once)
+
+
+class Command(BaseCommand):
+    help = 'Run worker processes that import queued PO CSV files into MongoDB'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--processes',
+            type=int,
+            default=config('PO_IMPORT_WORKERS', default=2, cast=int),
+            help='Number of worker processes',
+        )
+        parser.add_argument(
+            '--poll-interval',
+            type=float,
+            default=2.0,
+            help='Seconds to wait between polls when the queue is empty',
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Exit once no job is ready instead of polling',
+        )
+
+    def handle(self, *args, **options):
+        """Main command handler"""
+        stop_event = multiprocessing.Event()
+
+        def stop(signum, frame):
+            self.stdout.write('[PO Import Worker] Stopping after the current batch...')
+            stop_event.set()
+
+        signal.signal(signal.SIGINT, stop)
+        signal.signal(signal.SIGTERM, stop)
+
+        processes = [
+            multiprocessing.Process(
+                target=_process_main,
+                args=(stop_event, options['poll_interval'], options['once']),
+                name=f'po-import-worker-{n}'
+            )
+            for n in range(max(options['processes'], 1))
+        ]
+        for process in processes:
+            process.start()
+        self.stdout.write(f'[PO Import Worker] Started {len(processes)} worker processes')
+
+        while any(process.is_alive() for process in processes):
+            for process in processes:
+                process.join(timeout=1)
+            # Restart processes that died unexpectedly; their jobs are
+            # reclaimed once the lease expires
+            if not stop_event.is_set() and not options['once']:
+                for n, process in enumerate(processes):
+                    if not process.is_alive():
+                        logger.error(f'{process.name} exited with code {process.exitcode}; restarting')
+                        processes[n] = multiprocessing.Process(
+                            target=_process_main,
+                            args=(stop_event, options['poll_interval'], False),
+                            name=process.name
+                        )
+                        processes[n].start()
+                        time.sleep(1)
+
+        self.stdout.write(self.style.SUCCESS('[PO Import Worker] Stopped'))
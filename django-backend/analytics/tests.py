@@ -0,0 +1,987 @@
+"""
+PO analytics (DuckDB) tests
+
+Queries run against in-memory DuckDB data, so these run without Wasabi access:
+    python manage.py test analytics
+"""
+
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+import io
+import json
+from datetime import datetime, timezone
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+
+import pandas as pd
+import pyarrow.parquet as pq
+
+import duckdb
+from django.test import TestCase, Client
+
+from services.duckdb_client import DuckDBClient, DuckDBConnectionPool
+from services.parquet_cache import ParquetMirrorCache
+from services.parquet_writer import write_parquet
+from services.duckdb_query import read_parquet_sql
+from services.po_dataset import PO_PARTITIONING, PurchaseOrderDataset
+from services.po_import_queue import ImportJobQueue, JobLeaseLost
+from services.po_rollups import PO_ROLLUP_PARTITIONING, PurchaseOrderRollups
+
+
+class DuckDBConnectionPoolTestCase(TestCase):
+    """Pooled cursors share one configured database and are reused"""
+
+    def setUp(self):
+        self.setup_calls = 0
+
+        def setup(conn):
+            self.setup_calls += 1
+            conn.execute("SET default_order='desc'")
+
+        self.pool = DuckDBConnectionPool(setup=setup, size=2, max_uses=3)
+
+    def test_setup_runs_once_and_settings_are_shared(self):
+        self.pool.warm_up()
+
+        def work():
+            for _ in range(10):
+                with self.pool.connection() as conn:
+                    self.assertEqual(conn.execute("SELECT current_setting('default_order')").fetchone()[0], 'desc')
+
+        threads = [threading.Thread(target=work) for _ in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        stats = self.pool.get_stats()
+        self.assertEqual(self.setup_calls, 1)
+        self.assertGreater(stats['reused'], 0)
+        self.assertGreater(stats['recycled'], 0)
+        self.assertLessEqual(stats['idle'], 2)
+
+    def test_reset_rebuilds_database(self):
+        with self.pool.connection() as conn:
+            conn.execute("SELECT 1")
+
+        self.pool.reset()
+
+        with self.pool.connection() as conn:
+            self.assertEqual(conn.execute("SELECT 1").fetchone()[0], 1)
+        self.assertEqual(self.setup_calls, 2)
+
+
+class FakeS3:
+    """The boto3 S3 calls used by the Parquet services, over a local 'bucket' directory"""
+
+    class NoSuchKey(Exception):
+        pass
+
+    exceptions = SimpleNamespace(NoSuchKey=NoSuchKey)
+
+    def __init__(self, root):
+        self.root = root
+        self.downloads = 0
+
+    def head_object(self, Bucket, Key):
+        stat = os.stat(os.path.join(self.root, Key))
+        return {'ETag': f'"{stat.st_mtime_ns}"', 'ContentLength': stat.st_size, 'LastModified': None}
+
+    def get_object(self, Bucket, Key, IfMatch=None):
+        path = os.path.join(self.root, Key)
+        if not os.path.exists(path):
+            raise self.NoSuchKey(Key)
+        if IfMatch is not None:
+            self.downloads += 1
+            if IfMatch != str(os.stat(path).st_mtime_ns):
+                raise RuntimeError('PreconditionFailed')
+        with open(path, 'rb') as f:
+            return {'Body': io.BytesIO(f.read())}
+
+    def put_object(self, Bucket, Key, Body, ContentType=None):
+        path = os.path.join(self.root, Key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(Body)
+        return {'ETag': f'"{os.stat(path).st_mtime_ns}"'}
+
+    def list_objects_v2(self, Bucket, Prefix='', ContinuationToken=None):
+        contents = []
+        for dirpath, _, names in os.walk(self.root):
+            for name in names:
+                key = os.path.relpath(os.path.join(dirpath, name), self.root).replace(os.sep, '/')
+                if key.startswith(Prefix):
+                    stat = os.stat(os.path.join(dirpath, name))
+                    contents.append({
+                        'Key': key,
+                        'ETag': f'"{stat.st_mtime_ns}"',
+                        'Size': stat.st_size,
+                        'LastModified': datetime.fromtimestamp(stat.st_mtime, timezone.utc)
+                    })
+        return {'Contents': sorted(contents, key=lambda obj: obj['Key']), 'IsTruncated': False}
+
+    def delete_objects(self, Bucket, Delete):
+        for obj in Delete['Objects']:
+            os.remove(os.path.join(self.root, obj['Key']))
+
+
+class ParquetMirrorCacheTestCase(TestCase):
+    """S3 Parquet objects are mirrored locally and refreshed when the ETag changes"""
+
+    def setUp(self):
+        self.bucket_dir = tempfile.mkdtemp()
+        self.cache_dir = tempfile.mkdtemp()
+        self.s3 = FakeS3(self.bucket_dir)
+        self.uri = 's3://emp54/purchase_orders.parquet'
+        self.cache = ParquetMirrorCache(lambda: self.s3, self.cache_dir, validate_interval=0)
+        self._write_parquet(3)
+
+    def tearDown(self):
+        shutil.rmtree(self.bucket_dir, ignore_errors=True)
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+
+    def _write_parquet(self, rows):
+        path = os.path.join(self.bucket_dir, 'purchase_orders.parquet')
+        duckdb.execute(f"COPY (SELECT range AS po FROM range({rows})) TO '{path}' (FORMAT PARQUET)")
+
+    def _resolve_when_downloaded(self):
+        for _ in range(100):
+            path = self.cache.resolve(self.uri)
+            if path != self.uri:
+                return path
+            time.sleep(0.01)
+        self.fail('mirror download did not finish')
+
+    def test_local_copy_served_and_replaced_on_change(self):
+        # First resolve reads S3 while the mirror downloads in the background
+        self.assertEqual(self.cache.resolve(self.uri), self.uri)
+        local = self._resolve_when_downloaded()
+        self.assertEqual(duckdb.execute(f"SELECT COUNT(*) FROM '{local}'").fetchone()[0], 3)
+        self.assertEqual(self.s3.downloads, 1)
+
+        self._write_parquet(5)
+        os.utime(os.path.join(self.bucket_dir, 'purchase_orders.parquet'), ns=(1, 1))
+
+        refreshed = self._resolve_when_downloaded()
+        self.assertNotEqual(refreshed, local)
+        self.assertFalse(os.path.exists(local))
+        self.assertEqual(duckdb.execute(f"SELECT COUNT(*) FROM '{refreshed}'").fetchone()[0], 5)
+
+    def test_dataset_resolves_to_local_partition_files(self):
+        PurchaseOrderDataset(self.s3, 'emp54').write(PO_ROWS)
+        uri = 's3://emp54/analytics/purchase_orders/'
+
+        # Until the copies are ready each partition is read from S3
+        self.assertTrue(all(path.startswith('s3://') for path in self.cache.resolve(uri)))
+        for _ in range(100):
+            paths = self.cache.resolve(uri)
+            if not any(path.startswith('s3://') for path in paths):
+                break
+            time.sleep(0.01)
+
+        self.assertEqual(len(paths), 2)
+        sql = f"SELECT company_code, month, COUNT(*) FROM {read_parquet_sql(paths, PO_PARTITIONING)} GROUP BY ALL ORDER BY month"
+        self.assertEqual(duckdb.execute(sql).fetchall(), [('emp54', 1, 1), ('emp54', 2, 2)])
+
+        version = self.cache.version(uri)
+        PurchaseOrderDataset(self.s3, 'emp54').write(PO_ROWS.iloc[[0]])
+        self.assertNotEqual(self.cache.version(uri), version)
+
+    def test_lru_eviction_respects_size_cap(self):
+        other_uri = 's3://emp54/other.parquet'
+        shutil.copyfile(os.path.join(self.bucket_dir, 'purchase_orders.parquet'), os.path.join(self.bucket_dir, 'other.parquet'))
+        size = os.path.getsize(os.path.join(self.bucket_dir, 'other.parquet'))
+        self.cache.max_bytes = size + size // 2
+
+        first = self._resolve_when_downloaded()
+        self.cache.resolve(other_uri)
+        for _ in range(100):
+            if self.cache.get_stats()['downloads'] == 2:
+                break
+            time.sleep(0.01)
+
+        # Only one file fits; the least recently used one is gone
+        stats = self.cache.get_stats()
+        self.assertEqual(stats['files'], 1)
+        self.assertEqual(stats['evictions'], 1)
+        self.assertFalse(os.path.exists(first))
+
+
+class ParquetMirrorDownloadTestCase(TestCase):
+    """Mirror downloads go through a real boto3 S3 client (stubbed responses)"""
+
+    def setUp(self):
+        import boto3
+        from botocore.stub import Stubber
+
+        self.cache_dir = tempfile.mkdtemp()
+        self.s3 = boto3.client('s3', region_name='us-east-1', aws_access_key_id='test', aws_secret_access_key='test')
+        self.stubber = Stubber(self.s3)
+        self.stubber.activate()
+        self.cache = ParquetMirrorCache(lambda: self.s3, self.cache_dir)
+        self.path = os.path.join(self.cache_dir, 'copy-abc.parquet')
+
+    def tearDown(self):
+        self.stubber.deactivate()
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+
+    def test_download_is_conditional_on_etag(self):
+        from botocore.response import StreamingBody
+
+        data = b'PAR1' + b'x' * 100
+        self.stubber.add_response(
+            'get_object',
+            {'Body': StreamingBody(io.BytesIO(data), len(data)), 'ETag': '"abc"'},
+            {'Bucket': 'emp54', 'Key': 'po.parquet', 'IfMatch': 'abc'}
+        )
+        self.cache._download('s3://emp54/po.parquet', 'abc', self.path)
+
+        self.stubber.assert_no_pending_responses()
+        with open(self.path, 'rb') as f:
+            self.assertEqual(f.read(), data)
+        self.assertEqual(self.cache.get_stats()['downloads'], 1)
+
+    def test_changed_object_is_not_stored(self):
+        self.stubber.add_client_error(
+            'get_object', service_error_code='PreconditionFailed', http_status_code=412,
+            expected_params={'Bucket': 'emp54', 'Key': 'po.parquet', 'IfMatch': 'abc'}
+        )
+        self.cache._download('s3://emp54/po.parquet', 'abc', self.path)
+
+        self.assertFalse(os.path.exists(self.path))
+        self.assertEqual(self.cache.get_stats()['download_errors'], 1)
+        self.assertEqual([name for name in os.listdir(self.cache_dir) if name.endswith('.part')], [])
+
+
+class DuckDBResultCacheTestCase(TestCase):
+    """Cached results are reused until the source Parquet file changes"""
+
+    def setUp(self):
+        self.data_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.data_dir, 'purchase_orders.parquet')
+        self.client = DuckDBClient()
+        self._write_parquet(3)
+
+    def tearDown(self):
+        shutil.rmtree(self.data_dir, ignore_errors=True)
+
+    def _write_parquet(self, rows):
+        duckdb.execute(f"COPY (SELECT range AS po FROM range({rows})) TO '{self.path}' (FORMAT PARQUET)")
+
+    def _count(self):
+        sql = f"SELECT COUNT(*) AS n FROM '{self.path}'"
+        return self.client.query(sql, cache_sources=[self.path])[0]['n']
+
+    def test_hit_until_source_changes(self):
+        self.assertEqual(self._count(), 3)
+        self.assertEqual(self._count(), 3)
+        self.assertEqual(self.client.result_cache.get_stats()['hits'], 1)
+
+        self._write_parquet(5)
+        os.utime(self.path, ns=(1, 1))
+        self.assertEqual(self._count(), 5)
+
+    def test_invalidate_and_memory_bound(self):
+        self._count()
+        self.client.invalidate_results(self.path)
+        self.assertEqual(self.client.result_cache.get_stats()['entries'], 0)
+
+        self.client.result_cache.max_bytes = 1
+        self._count()
+        self.assertEqual(self.client.result_cache.get_stats()['entries'], 0)
+
+
+PO_ROWS = pd.DataFrame({
+    'po_number': ['PO-1', 'PO-2', 'PO-3'],
+    'po_payto_id': ['V1', 'V1', 'V2'],
+    'po_payto_name': ['ACME SUPPLY', 'ACME SUPPLY', "O'BRIEN 100%"],
+    'po_company': ['EMP', 'EMP', 'EMP'],
+    'po_branch': ['100', '100', '200'],
+    'order_total': [250.0, 750.0, 100.0],
+    'order_date': pd.to_datetime(['2025-01-05', '2025-02-10', '2025-02-11']),
+    'company_code': ['emp54', 'emp54', 'emp54'],
+})
+
+
+def write_po_dataset(root, rows=PO_ROWS, mode='append', rollup_root=None):
+    """Write purchase orders into a local company/year/month partitioned dataset (and rollups)"""
+    rollups = PurchaseOrderRollups(FakeS3(rollup_root), 'emp54', prefix='') if rollup_root else None
+    return PurchaseOrderDataset(FakeS3(root), 'emp54', prefix='', rollups=rollups).write(rows, mode=mode)
+
+
+class PurchaseOrderDatasetTestCase(TestCase):
+    """Imports add fragments committed by manifests; compaction merges them"""
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.dataset = PurchaseOrderDataset(FakeS3(self.root), 'emp54', prefix='')
+
+    def tearDown(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def _count(self, where='true'):
+        paths = [os.path.join(self.root, entry['key']) for entry in self.dataset.files()]
+        return duckdb.execute(f"SELECT COUNT(*) FROM {read_parquet_sql(paths, PO_PARTITIONING)} WHERE {where}").fetchone()[0]
+
+    def test_append_writes_new_fragments_only(self):
+        self.assertEqual(self.dataset.write(PO_ROWS)['fragments_written'], 2)
+        before = {entry['key']: os.stat(os.path.join(self.root, entry['key'])).st_mtime_ns for entry in self.dataset.files()}
+
+        february_order = PO_ROWS.iloc[[1]].assign(po_number='PO-4', po_branch='0100')
+        result = self.dataset.write(february_order)
+
+        self.assertEqual(result['fragments_written'], 1)
+        self.assertEqual(result['rows_written'], 1)
+        for key, mtime in before.items():
+            self.assertEqual(os.stat(os.path.join(self.root, key)).st_mtime_ns, mtime)
+        self.assertEqual(self._count("month = 2"), 3)
+        self.assertEqual(self._count("po_branch = '0100'"), 1)
+
+    def test_uncommitted_fragments_are_not_live(self):
+        self.dataset.write(PO_ROWS)
+        with patch.object(self.dataset.log, 'commit', side_effect=RuntimeError('S3 down')):
+            with self.assertRaises(RuntimeError):
+                self.dataset.write(PO_ROWS)
+        self.assertEqual(self._count(), 3)
+
+    def test_replace_compact_and_vacuum(self):
+        self.dataset.write(PO_ROWS)
+        self.dataset.write(PO_ROWS.assign(company_code='other'))
+        self.dataset.write(PO_ROWS.assign(company_code='other'))
+
+        result = self.dataset.write(PO_ROWS.iloc[[0]], mode='replace')
+        self.assertEqual(result['fragments_removed'], 2)
+        self.assertEqual(self._count("company_code = 'emp54'"), 1)
+
+        stats = self.dataset.compact(min_fragments=2)
+        self.assertEqual(stats['partitions_compacted'], 2)
+        self.assertEqual(self._count("company_code = 'other'"), 6)
+        self.assertEqual(len(self.dataset.files()), 3)
+
+        # Replaced files stay readable until the grace period has passed
+        self.assertEqual(self.dataset.vacuum(grace_seconds=3600)['deleted_files'], 0)
+        vacuum = self.dataset.vacuum(grace_seconds=0)
+        self.assertEqual(vacuum['deleted_files'], 6)
+        self.assertEqual(len(self.dataset.log.list_data_files()), 3)
+        self.assertEqual(self._count(), 7)
+
+        with self.assertRaises(ValueError):
+            self.dataset.write(PO_ROWS.assign(company_code='../x'))
+
+
+class ConcurrentCompactionTestCase(TestCase):
+    """A replace import racing a compaction never brings the replaced rows back"""
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.importer = PurchaseOrderDataset(FakeS3(self.root), 'emp54', prefix='')
+        self.compactor = PurchaseOrderDataset(FakeS3(self.root), 'emp54', prefix='')
+        self.importer.write(PO_ROWS)
+        self.importer.write(PO_ROWS)
+
+    def tearDown(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def _count(self):
+        paths = [os.path.join(self.root, entry['key']) for entry in self.importer.files()]
+        return duckdb.execute(f"SELECT COUNT(*) FROM {read_parquet_sql(paths, PO_PARTITIONING)}").fetchone()[0]
+
+    def _run_paused(self, target, obj, method, resume):
+        """Run target in a thread that stops in obj.method until resume is set"""
+        paused = threading.Event()
+        original = getattr(obj, method)
+
+        def wait_then_call(*args, **kwargs):
+            paused.set()
+            resume.wait(5)
+            return original(*args, **kwargs)
+
+        result = {}
+        thread = threading.Thread(target=lambda: result.update(value=target()))
+        with patch.object(obj, method, side_effect=wait_then_call):
+            thread.start()
+            self.assertTrue(paused.wait(5))
+            return thread, result
+
+    def test_replace_commits_while_compaction_merges(self):
+        resume = threading.Event()
+        thread, result = self._run_paused(lambda: self.compactor.compact(min_fragments=2), self.compactor.log, 'commit', resume)
+        self.importer.write(PO_ROWS.iloc[[0]], mode='replace')
+        resume.set()
+        thread.join()
+
+        self.assertEqual(result['value']['partitions_compacted'], 0)
+        self.assertEqual(self._count(), 1)
+        self.assertEqual(self.importer.vacuum(grace_seconds=0)['deleted_files'], 6)
+        self.assertEqual(len(self.importer.log.list_data_files()), 1)
+
+    def test_compaction_commits_while_replace_is_pending(self):
+        resume = threading.Event()
+        thread, _ = self._run_paused(lambda: self.importer.write(PO_ROWS.iloc[[0]], mode='replace'), self.importer.log, 'commit', resume)
+        self.assertEqual(self.compactor.compact(min_fragments=2)['partitions_compacted'], 2)
+        resume.set()
+        thread.join()
+
+        self.assertEqual(self._count(), 1)
+        self.assertEqual(self.importer.vacuum(grace_seconds=0)['deleted_files'], 6)
+        self.assertEqual(len(self.importer.log.list_data_files()), 1)
+
+
+class PurchaseOrderRollupsTestCase(TestCase):
+    """Imports, replace, compaction and rebuild keep the daily rollups equal to the raw totals"""
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.rollup_root = tempfile.mkdtemp()
+        self.rollups = PurchaseOrderRollups(FakeS3(self.rollup_root), 'emp54', prefix='')
+        self.dataset = PurchaseOrderDataset(FakeS3(self.root), 'emp54', prefix='', rollups=self.rollups)
+
+    def tearDown(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+        shutil.rmtree(self.rollup_root, ignore_errors=True)
+
+    def _vendor_totals(self):
+        paths = [os.path.join(self.rollup_root, entry['key']) for entry in self.rollups.files()]
+        return duckdb.execute(f"""
+            SELECT company_code, po_payto_id, SUM(order_count), SUM(total_spent), MIN(first_order_date)
+            FROM {read_parquet_sql(paths, PO_ROLLUP_PARTITIONING)}
+            GROUP BY ALL ORDER BY ALL
+        """).fetchall()
+
+    def test_rollups_follow_writes(self):
+        result = self.dataset.write(PO_ROWS)
+        self.assertIsNotNone(result['rollup_manifest'])
+        self.dataset.write(PO_ROWS.iloc[[2]].assign(po_number='PO-4', order_date=pd.Timestamp('2025-02-11 15:30')))
+        self.dataset.write(PO_ROWS.assign(company_code='other'))
+
+        self.assertEqual(self._vendor_totals(), [
+            ('emp54', 'V1', 2, 1000.0, datetime(2025, 1, 5)),
+            ('emp54', 'V2', 2, 200.0, datetime(2025, 2, 11)),
+            ('other', 'V1', 2, 1000.0, datetime(2025, 1, 5)),
+            ('other', 'V2', 1, 100.0, datetime(2025, 2, 11)),
+        ])
+
+        # Merged fragments are re-aggregated to one row per key
+        self.assertEqual(self.rollups.compact(min_fragments=2)['partitions_compacted'], 1)
+        february = [entry for entry in self.rollups.files() if 'company_code=emp54/year=2025/month=2/' in entry['key']]
+        self.assertEqual([entry['rows'] for entry in february], [2])
+
+        self.dataset.write(PO_ROWS.iloc[[0]], mode='replace')
+        self.assertEqual(self._vendor_totals()[0], ('emp54', 'V1', 1, 250.0, datetime(2025, 1, 5)))
+        self.assertEqual(len(self._vendor_totals()), 3)
+
+    def test_rebuild_from_raw_dataset(self):
+        PurchaseOrderDataset(FakeS3(self.root), 'emp54', prefix='').write(PO_ROWS)
+        self.assertEqual(self.rollups.files(), [])
+
+        stats = self.rollups.rebuild(self.dataset)
+        self.assertEqual((stats['partitions'], stats['rows_read'], stats['rollup_rows']), (2, 3, 3))
+        expected = self._vendor_totals()
+
+        self.rollups.rebuild(self.dataset, company_code='emp54')
+        self.assertEqual(self._vendor_totals(), expected)
+        self.assertEqual(expected[0], ('emp54', 'V1', 2, 1000.0, datetime(2025, 1, 5)))
+
+
+class ParquetWriterTestCase(TestCase):
+    """Shared writer sorts rows and only dictionary-encodes low-cardinality columns"""
+
+    def test_layout(self):
+        rows = pd.DataFrame({
+            'po_number': [f'PO-{n}' for n in range(200)],
+            'po_branch': ['100', '200'] * 100,
+            'order_date': pd.date_range('2025-01-01', periods=200, freq='D')[::-1],
+            'company_code': ['emp54'] * 200,
+        }, index=range(1000, 1200))
+        buffer = io.BytesIO()
+        write_parquet(rows, buffer, row_group_size=50)
+
+        parquet = pq.ParquetFile(io.BytesIO(buffer.getvalue()))
+        self.assertEqual(parquet.metadata.num_row_groups, 4)
+        self.assertNotIn('__index_level_0__', parquet.schema_arrow.names)
+
+        first_group = parquet.metadata.row_group(0)
+        columns = {first_group.column(i).path_in_schema: first_group.column(i) for i in range(first_group.num_columns)}
+        self.assertEqual(columns['po_branch'].compression, 'ZSTD')
+        self.assertIn('RLE_DICTIONARY', columns['po_branch'].encodings)
+        self.assertNotIn('RLE_DICTIONARY', columns['po_number'].encodings)
+        self.assertEqual(columns['order_date'].statistics.min, pd.Timestamp('2025-01-01'))
+        self.assertTrue(columns['order_date'].has_offset_index)
+
+
+class DuckDBAnalyticsViewsTestCase(TestCase):
+    """views_duckdb endpoints run parameterized queries over a local partitioned dataset"""
+
+    def setUp(self):
+        self.data_dir = tempfile.mkdtemp()
+        self.rollup_dir = tempfile.mkdtemp()
+        self.path = self.data_dir + '/'
+        write_po_dataset(self.data_dir, rollup_root=self.rollup_dir)
+
+        self.client = Client()
+        session = self.client.session
+        session['admin_logged_in'] = True
+        session.save()
+
+        for name, value in (('PO_DATASET_PATH', self.path), ('PO_ROLLUP_PATH', self.rollup_dir + '/'), ('PO_ROLLUPS_ENABLED', True)):
+            patcher = patch(f'analytics.views_duckdb.{name}', value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        shutil.rmtree(self.data_dir, ignore_errors=True)
+        shutil.rmtree(self.rollup_dir, ignore_errors=True)
+
+    def _get(self, url, **params):
+        response = self.client.get(url, params)
+        return response.status_code, json.loads(response.content)
+
+    def test_search_binds_filter_values(self):
+        status, body = self._get('/analytics/duckdb/search/', vendor="O'BRIEN 100%", min_amount='50')
+        self.assertEqual(status, 200)
+        self.assertEqual([row['po_number'] for row in body['data']], ['PO-3'])
+        self.assertEqual(body['data'][0]['order_date'], '2025-02-11T00:00:00')
+        self.assertEqual(body['data'][0]['order_total'], 100.0)
+
+        # Injection attempts are just values that match nothing
+        status, body = self._get('/analytics/duckdb/search/', branch="100' OR '1'='1")
+        self.assertEqual(status, 200)
+        self.assertEqual(body['count'], 0)
+
+        status, _ = self._get('/analytics/duckdb/search/', start_date='2025-13-45')
+        self.assertEqual(status, 400)
+
+    def test_date_filters_skip_other_months(self):
+        # An unreadable file in a month outside the range is never opened
+        march = os.path.join(self.data_dir, 'company_code=emp54', 'year=2025', 'month=3')
+        os.makedirs(march)
+        with open(os.path.join(march, 'data.parquet'), 'w') as f:
+            f.write('not parquet')
+
+        status, body = self._get('/analytics/duckdb/search/', start_date='2025-02-01', end_date='2025-02-28')
+        self.assertEqual(status, 200)
+        self.assertEqual([row['po_number'] for row in body['data']], ['PO-3', 'PO-2'])
+        self.assertEqual(body['data'][0]['company_code'], 'emp54')
+
+        status, _ = self._get('/analytics/duckdb/search/')
+        self.assertEqual(status, 500)
+
+    def test_aggregate_endpoints(self):
+        status, body = self._get('/analytics/duckdb/vendors/', sort_by='order_count; DROP TABLE x')
+        self.assertEqual(status, 200)
+        self.assertEqual(body['data'][0]['vendor'], 'ACME SUPPLY')
+        self.assertEqual(body['filters']['sort_by'], 'total_spent')
+
+        status, body = self._get('/analytics/duckdb/top-by-branch/', top_n='1', min_total='200')
+        self.assertEqual(status, 200)
+        self.assertEqual(list(body['data']), ['100'])
+
+        status, body = self._get('/analytics/duckdb/summary/')
+        self.assertEqual(body['data']['total_orders'], 3)
+
+        status, body = self._get('/analytics/duckdb/branches/', limit='1')
+        self.assertEqual(body['data'][0]['branch'], '100')
+
+    def test_rollups_match_raw_rows(self):
+        endpoints = [
+            ('/analytics/duckdb/vendors/', {'min_orders': '1'}),
+            ('/analytics/duckdb/branches/', {}),
+            ('/analytics/duckdb/trends/', {'months': '1200'}),
+            ('/analytics/duckdb/trends/', {'months': '1200', 'branch': '100', 'vendor': 'ACME'}),
+            ('/analytics/duckdb/top-by-branch/', {'top_n': '2'}),
+            ('/analytics/duckdb/summary/', {}),
+        ]
+        for url, params in endpoints:
+            with self.subTest(url=url, params=params):
+                status, from_rollups = self._get(url, **params)
+                self.assertEqual(status, 200)
+                with patch('analytics.views_duckdb.PO_ROLLUPS_ENABLED', False):
+                    _, from_rows = self._get(url, **params)
+                self.assertEqual(from_rollups, from_rows)
+                self.assertTrue(from_rollups['data'])
+
+        # Aggregates never open the raw files
+        shutil.rmtree(self.data_dir)
+        status, body = self._get('/analytics/duckdb/summary/')
+        self.assertEqual(status, 200)
+        self.assertEqual(body['data']['total_value'], 1100.0)
+
+    def test_export_streams_each_format(self):
+        response = self.client.get('/analytics/duckdb/export/', {'format': 'csv', 'branch': '100'})
+        self.assertEqual(response.status_code, 200)
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(len(lines), 3)
+        self.assertIn('po_number', lines[0])
+
+        response = self.client.get('/analytics/duckdb/export/', {'format': 'ndjson'})
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+        self.assertEqual([row['po_number'] for row in rows], ['PO-3', 'PO-2', 'PO-1'])
+
+        response = self.client.get('/analytics/duckdb/export/', {'format': 'parquet', 'limit': '2'})
+        table = pq.read_table(io.BytesIO(b''.join(response.streaming_content)))
+        self.assertEqual(table.num_rows, 2)
+
+        status, _ = self._get('/analytics/duckdb/export/', format='xlsx')
+        self.assertEqual(status, 400)
+
+    def test_empty_export_keeps_header_and_schema(self):
+        response = self.client.get('/analytics/duckdb/export/', {'format': 'csv', 'branch': 'none'})
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(len(lines), 1)
+        self.assertIn('po_number', lines[0])
+
+        response = self.client.get('/analytics/duckdb/export/', {'format': 'parquet', 'branch': 'none'})
+        table = pq.read_table(io.BytesIO(b''.join(response.streaming_content)))
+        self.assertEqual(table.num_rows, 0)
+        self.assertIn('po_number', table.column_names)
+
+        response = self.client.get('/analytics/duckdb/export/', {'format': 'ndjson', 'branch': 'none'})
+        self.assertEqual(b''.join(response.streaming_content), b'')
+
+    def test_open_export_does_not_hold_a_pool_slot(self):
+        from analytics.views_duckdb import duckdb_client
+
+        pool = DuckDBConnectionPool(setup=lambda conn: None, size=1)
+        with patch.object(duckdb_client, 'pool', pool):
+            response = self.client.get('/analytics/duckdb/export/', {'format': 'csv'})
+            chunks = iter(response.streaming_content)
+            next(chunks)  # Client has started, but not finished, the download
+
+            acquired = pool._available.acquire(timeout=1)
+            self.assertTrue(acquired)
+            pool._available.release()
+            self.assertEqual(pool.get_stats()['dedicated'], 1)
+            response.close()
+
+
+class FakePurchaseOrders:
+    """The parts of analytics_mongodb the CSV importer uses, backed by a dict keyed like the unique index"""
+
+    def __init__(self):
+        self.documents = {}
+        self.logs = []
+
+    def bulk_upsert_purchase_orders(self, po_list, overwrite=False):
+        counts = {'inserted': 0, 'replaced': 0, 'skipped': 0}
+        for po in po_list:
+            key = (po['company_code'], po['po_number'])
+            if key not in self.documents:
+                counts['inserted'] += 1
+            elif overwrite:
+                counts['replaced'] += 1
+            else:
+                counts['skipped'] += 1
+                continue
+            self.documents[key] = po
+        return counts
+
+    def update_import_log(self, batch_id, updates):
+        self.logs.append(updates)
+
+
+class StreamingCSVImportTestCase(TestCase):
+    """process_csv_import streams a CSV file in batches, reports byte progress and resumes from checkpoints"""
+
+    def setUp(self):
+        lines = ['Exported by ERP', 'PO_PAYTO_ID,PO_PAYTO_NAME,PO_COMPANY,PO_BRANCH,PO_NUMBER,ORDER_TOTAL,ORDER_DATE']
+        lines += [f'V{n % 7},"VENDOR {n % 7},\r\nINC",EMP,100,PO-{n},"1,{n % 1000:03d}.50",01/{n % 28 + 1:02d}/2025' for n in range(2500)]
+        lines.append('V1,VENDOR 1,EMP,100,PO-BAD,12.00,2025-01-01')
+        fd, self.path = tempfile.mkstemp(suffix='.csv')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(('\r\n'.join(lines) + '\r\n').encode())
+        self.size = os.path.getsize(self.path)
+
+        from analytics import views
+        self.views = views
+        self.mongo = FakePurchaseOrders()
+        patcher = patch.object(views, 'analytics_mongodb', self.mongo)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        os.unlink(self.path)
+
+    def _run(self, overwrite_mode=False, **kwargs):
+        self.views.process_csv_import(self.path, self.size, 1, overwrite_mode, 'batch-1', 'emp54', 'user@emp54', 'pos.csv', **kwargs)
+
+    def test_batches_and_progress(self):
+        self.mongo.documents[('emp54', 'PO-5')] = {'po_number': 'PO-5'}
+        self._run()
+
+        self.assertEqual(len(self.mongo.documents), 2500)
+        self.assertEqual(self.mongo.documents[('emp54', 'PO-2499')]['order_total'], 1499.5)
+        self.assertEqual(self.mongo.documents[('emp54', 'PO-2499')]['po_payto_name'], 'VENDOR 0,\r\nINC')
+
+        progress = [log['progress_percent'] for log in self.mongo.logs if 'progress_percent' in log]
+        self.assertEqual(progress, sorted(progress))
+        self.assertEqual(len(progress), 4)
+        self.assertEqual(progress[-1], 100)
+
+        final = self.mongo.logs[-1]
+        self.assertEqual(final['status'], 'completed_with_errors')
+        self.assertEqual((final['total_rows'], final['imported_rows'], final['skipped_rows'], final['error_rows']), (2501, 2499, 1, 1))
+        self.assertIn('Row 2502: Invalid date format', final['error_message'])
+
+    def test_resume_from_checkpoint(self):
+        checkpoints = []
+
+        def crash_after_first_batch(state):
+            checkpoints.append(state)
+            raise RuntimeError('worker killed')
+
+        with self.assertRaises(RuntimeError):
+            self._run(on_checkpoint=crash_after_first_batch)
+        self.assertEqual(checkpoints[0]['row_num'], 1001)
+        # Writers may have finished later batches before the crash
+        written_before_crash = len(self.mongo.documents)
+        self.assertGreaterEqual(written_before_crash, 1000)
+
+        self._run(checkpoint=checkpoints[0])
+
+        self.assertEqual(sorted(po_number for _, po_number in self.mongo.documents), sorted(f'PO-{n}' for n in range(2500)))
+        final = self.mongo.logs[-1]
+        self.assertEqual((final['total_rows'], final['imported_rows'], final['error_rows']), (2501, 2500 - (written_before_crash - 1000), 1))
+        self.assertEqual(final['imported_rows'] + final['skipped_rows'], 2500)
+
+    def test_checkpoints_follow_file_order(self):
+        write = self.mongo.bulk_upsert_purchase_orders
+
+        def first_batch_slowest(po_list, overwrite=False):
+            if po_list[0]['po_number'] == 'PO-0':
+                time.sleep(0.3)
+            return write(po_list, overwrite)
+
+        self.mongo.bulk_upsert_purchase_orders = first_batch_slowest
+        checkpoints = []
+        self._run(on_checkpoint=checkpoints.append, writers=3)
+
+        self.assertEqual([state['row_num'] for state in checkpoints], [1001, 2001, 2502])
+        self.assertEqual([state['imported_rows'] for state in checkpoints], [1000, 2000, 2500])
+        offsets = [state['offset'] for state in checkpoints]
+        self.assertEqual(offsets, sorted(offsets))
+        self.assertEqual(self.mongo.logs[-1]['imported_rows'], 2500)
+
+    def test_writer_error_stops_import(self):
+        write = self.mongo.bulk_upsert_purchase_orders
+
+        def fail_second_batch(po_list, overwrite=False):
+            if po_list[0]['po_number'] == 'PO-1000':
+                raise RuntimeError('connection reset')
+            return write(po_list, overwrite)
+
+        self.mongo.bulk_upsert_purchase_orders = fail_second_batch
+        checkpoints = []
+        with self.assertRaisesMessage(RuntimeError, 'connection reset'):
+            self._run(on_checkpoint=checkpoints.append, writers=2)
+        # Nothing after the failed batch is checkpointed
+        self.assertIn([state['row_num'] for state in checkpoints], ([], [1001]))
+
+    def test_column_validation(self):
+        header = ['PO_PAYTO_ID', 'PO_PAYTO_NAME', 'PO_COMPANY', 'PO_BRANCH', 'PO_NUMBER', 'ORDER_TOTAL', 'ORDER_DATE', 'NOTES']
+        records = [
+            [' V1 ', 'ACME', 'EMP', '100', 'PO-1', ' 1,234.50 ', '1/5/2025', 'x'],
+            ['V1', 'ACME', 'EMP', '100', 'PO-2', '12.00'],
+            ['V1', 'ACME', 'EMP', '100', 'PO-3', 'twelve', '01/05/2025'],
+            ['V1', 'ACME', 'EMP', '100', 'PO-4', '12.00', '02/30/2025'],
+            ['V1', 'ACME', 'EMP', '100', 'PO-5', '7', '07/04/1650'],
+            ['V1', 'ACME', 'EMP', ' ', 'PO-6', 'twelve', 'never'],
+        ]
+        documents, messages = self.views._parse_import_records(records, header, 2, {'company_code': 'emp54'})
+
+        self.assertEqual(messages, [
+            'Row 3: Missing required fields',
+            'Row 4: Invalid order total: twelve',
+            'Row 5: Invalid date format: 02/30/2025 (expected MM/DD/YYYY)',
+            'Row 7: Missing required fields',
+        ])
+        self.assertEqual([doc['po_number'] for doc in documents], ['PO-1', 'PO-5'])
+        self.assertEqual(documents[0]['po_payto_id'], 'V1')
+        self.assertEqual(documents[0]['order_total'], 1234.5)
+        self.assertEqual(documents[0]['order_date'], datetime(2025, 1, 5))
+        self.assertEqual(documents[1]['order_date'], datetime(1650, 7, 4))
+        self.assertEqual(documents[1]['company_code'], 'emp54')
+
+    def test_duplicates_skipped_or_replaced(self):
+        self._run()
+        self._run()
+        self.assertEqual((self.mongo.logs[-1]['imported_rows'], self.mongo.logs[-1]['skipped_rows']), (0, 2500))
+
+        self._run(overwrite_mode=True)
+        self.assertEqual((self.mongo.logs[-1]['imported_rows'], self.mongo.logs[-1]['skipped_rows']), (2500, 0))
+        self.assertEqual(len(self.mongo.documents), 2500)
+
+
+class ImportJobQueueTestCase(TestCase):
+    """Claiming, leases, release and failure of queued imports against a mocked collection"""
+
+    def setUp(self):
+        self.mongodb = SimpleNamespace(import_jobs=MagicMock(), import_files=MagicMock(), update_import_log=MagicMock())
+        self.queue = ImportJobQueue(mongodb=self.mongodb)
+        self.queue.company_limit = 2
+        self.queue.max_attempts = 3
+        self.queue.retry_delay = 30
+        self.jobs = self.mongodb.import_jobs
+
+    def _candidates(self, *jobs):
+        self.jobs.find.return_value.sort.return_value.limit.return_value = list(jobs)
+
+    def _running(self, attempts=1):
+        return {'_id': 'batch-1', 'status': 'running', 'lease_id': 'lease-1', 'slot': 0, 'attempts': attempts}
+
+    def test_claim_falls_through_taken_slots(self):
+        from pymongo.errors import DuplicateKeyError
+
+        self._candidates({'_id': 'batch-1', 'status': 'queued'})
+        claimed = {'_id': 'batch-1', 'status': 'running', 'slot': 1, 'attempts': 1}
+        self.jobs.find_one_and_update.side_effect = [DuplicateKeyError('slot 0 taken'), claimed]
+
+        self.assertEqual(self.queue.claim(), claimed)
+        calls = self.jobs.find_one_and_update.call_args_list
+        self.assertEqual([call.args[1]['$set']['slot'] for call in calls], [0, 1])
+        self.assertEqual(calls[0].args[0], {'_id': 'batch-1', 'status': 'queued'})
+        self.assertEqual(calls[0].args[1]['$inc'], {'attempts': 1})
+
+    def test_claim_returns_none_when_all_slots_taken(self):
+        from pymongo.errors import DuplicateKeyError
+
+        self._candidates({'_id': 'batch-1', 'status': 'queued'})
+        self.jobs.find_one_and_update.side_effect = DuplicateKeyError('taken')
+        self.assertIsNone(self.queue.claim())
+        self.assertEqual(self.jobs.find_one_and_update.call_count, 2)
+
+    def test_expired_lease_is_reclaimed_in_its_slot(self):
+        self._candidates(self._running())
+        self.jobs.find_one_and_update.return_value = {'_id': 'batch-1', 'attempts': 2}
+
+        self.assertEqual(self.queue.claim()['attempts'], 2)
+        match, update = self.jobs.find_one_and_update.call_args.args
+        self.assertEqual(match, {'_id': 'batch-1', 'status': 'running', 'lease_id': 'lease-1'})
+        self.assertEqual(update['$set']['slot'], 0)
+        self.assertNotEqual(update['$set']['lease_id'], 'lease-1')
+        self.assertEqual(self.jobs.find_one_and_update.call_count, 1)
+
+    def test_lost_lease_raises(self):
+        job = self._running()
+        self.jobs.update_one.return_value = SimpleNamespace(matched_count=0)
+
+        with self.assertRaises(JobLeaseLost):
+            self.queue.checkpoint(job, {'offset': 10})
+        self.assertEqual(self.jobs.update_one.call_args.args[0], {'_id': 'batch-1', 'status': 'running', 'lease_id': 'lease-1'})
+        self.assertNotIn('checkpoint', job)
+
+    def test_release_undoes_the_attempt(self):
+        self.jobs.update_one.return_value = SimpleNamespace(matched_count=1)
+        self.queue.release(self._running(attempts=2))
+
+        update = self.jobs.update_one.call_args.args[1]
+        self.assertEqual(update['$set']['status'], 'queued')
+        self.assertEqual(update['$inc'], {'attempts': -1})
+        self.assertIn('lease_id', update['$unset'])
+
+    def test_fail_retries_with_backoff_then_fails(self):
+        self.jobs.update_one.return_value = SimpleNamespace(matched_count=1)
+
+        before = datetime.now(timezone.utc)
+        self.queue.fail(self._running(attempts=2), RuntimeError('boom'))
+        update = self.jobs.update_one.call_args.args[1]
+        self.assertEqual(update['$set']['status'], 'queued')
+        self.assertGreaterEqual((update['$set']['run_after'] - before).total_seconds(), 60)
+        self.mongodb.update_import_log.assert_called_with('batch-1', {'status': 'retrying', 'error_message': 'boom'})
+
+        self.queue.fail(self._running(attempts=3), RuntimeError('boom'))
+        update = self.jobs.update_one.call_args.args[1]
+        self.assertEqual(update['$set']['status'], 'failed')
+        self.assertIn('finished_at', update['$set'])
+        self.assertNotIn('run_after', update['$set'])
+        self.mongodb.update_import_log.assert_called_with('batch-1', {'status': 'failed', 'error_message': 'boom'})
+
+    def test_fail_abandoned_marks_exhausted_jobs_failed(self):
+        self.jobs.find.return_value = [self._running(attempts=3)]
+        self.jobs.update_one.return_value = SimpleNamespace(matched_count=1)
+
+        self.assertEqual(self.queue.fail_abandoned(), 1)
+        self.assertEqual(self.jobs.update_one.call_args.args[1]['$set']['status'], 'failed')
+
+
+class BulkUpsertPurchaseOrdersTestCase(TestCase):
+    """bulk_upsert_purchase_orders result accounting against a mocked collection"""
+
+    def setUp(self):
+        from services.analytics_mongodb_service import AnalyticsMongoDBService
+
+        self.service = AnalyticsMongoDBService.__new__(AnalyticsMongoDBService)
+        self.service.purchase_orders = MagicMock()
+        self.pos = [{'company_code': 'heritage', 'po_number': f'PO-{i}'} for i in range(5)]
+
+    def _bulk_write_error(self, *codes, n_upserted=0, n_matched=0):
+        from pymongo.errors import BulkWriteError
+
+        return BulkWriteError({
+            'writeErrors': [{'index': i, 'code': code, 'errmsg': 'error'} for i, code in enumerate(codes)],
+            'nUpserted': n_upserted,
+            'nMatched': n_matched,
+        })
+
+    def test_insert_only_counts_existing_as_skipped(self):
+        from pymongo import UpdateOne
+
+        self.service.purchase_orders.bulk_write.return_value.bulk_api_result = {'nUpserted': 3, 'nMatched': 2}
+
+        result = self.service.bulk_upsert_purchase_orders(self.pos)
+
+        self.assertEqual(result, {'inserted': 3, 'replaced': 0, 'skipped': 2})
+        operations = self.service.purchase_orders.bulk_write.call_args.args[0]
+        self.assertEqual(len(operations), 5)
+        self.assertTrue(all(isinstance(op, UpdateOne) for op in operations))
+        self.assertFalse(self.service.purchase_orders.bulk_write.call_args.kwargs['ordered'])
+
+    def test_overwrite_counts_matched_as_replaced(self):
+        from pymongo import ReplaceOne
+
+        self.service.purchase_orders.bulk_write.return_value.bulk_api_result = {'nUpserted': 1, 'nMatched': 4}
+
+        result = self.service.bulk_upsert_purchase_orders(self.pos, overwrite=True)
+
+        self.assertEqual(result, {'inserted': 1, 'replaced': 4, 'skipped': 0})
+        operations = self.service.purchase_orders.bulk_write.call_args.args[0]
+        self.assertTrue(all(isinstance(op, ReplaceOne) for op in operations))
+
+    def test_duplicate_key_races_are_skipped(self):
+        self.service.purchase_orders.bulk_write.side_effect = self._bulk_write_error(11000, 11000, n_upserted=3)
+
+        result = self.service.bulk_upsert_purchase_orders(self.pos)
+
+        self.assertEqual(result, {'inserted': 3, 'replaced': 0, 'skipped': 2})
+
+    def test_overwrite_races_are_retried_as_replaces(self):
+        from pymongo import ReplaceOne
+
+        error = self._bulk_write_error(11000, 11000, n_upserted=1, n_matched=2)
+        error.details['writeErrors'][0]['index'] = 1
+        error.details['writeErrors'][1]['index'] = 3
+        self.service.purchase_orders.bulk_write.side_effect = [error, SimpleNamespace(matched_count=2)]
+
+        result = self.service.bulk_upsert_purchase_orders(self.pos, overwrite=True)
+
+        self.assertEqual(result, {'inserted': 1, 'replaced': 4, 'skipped': 0})
+        retry = self.service.purchase_orders.bulk_write.call_args_list[1].args[0]
+        self.assertEqual(retry, [
+            ReplaceOne({'company_code': 'heritage', 'po_number': 'PO-1'}, self.pos[1]),
+            ReplaceOne({'company_code': 'heritage', 'po_number': 'PO-3'}, self.pos[3]),
+        ])
+
+    def test_other_write_errors_are_raised(self):
+        from pymongo.errors import BulkWriteError
+
+        self.service.purchase_orders.bulk_write.side_effect = self._bulk_write_error(11000, 121, n_upserted=3)
+
+        with self.assertRaises(BulkWriteError):
+            self.service.bulk_upsert_purchase_orders(self.pos)
+
+    def test_empty_batch_skips_write(self):
+        self.assertEqual(self.service.bulk_upsert_purchase_orders([]), {'inserted': 0, 'replaced': 0, 'skipped': 0})
+        self.service.purchase_orders.bulk_write.assert_not_called()
@@ -45,6 +45,7 @@ urlpatterns = [
     path('duckdb/branches/', views_duckdb.po_branch_analysis, name='duckdb_branches'),
     path('duckdb/trends/', views_duckdb.po_monthly_trends, name='duckdb_trends'),
     path('duckdb/search/', views_duckdb.po_search, name='duckdb_search'),
+    path('duckdb/export/', views_duckdb.po_export, name='duckdb_export'),
     path('duckdb/top-by-branch/', views_duckdb.po_top_vendors_by_branch, name='duckdb_top_by_branch'),
     path('duckdb/summary/', views_duckdb.po_summary_stats, name='duckdb_summary'),
 
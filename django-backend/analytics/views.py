@@ -5,171 +5,371 @@ Handles CSV import, analytics queries, and reporting.
 """
 
 import csv
-import io
-import uuid
+import queue
 import threading
+import uuid
 from datetime import datetime
 from decimal import Decimal, InvalidOperation
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+from decouple import config
 from django.http import JsonResponse, HttpResponse
 from django.shortcuts import render, redirect
 from django.views.decorators.http import require_http_methods
 from services.analytics_mongodb_service import analytics_mongodb
+from services.po_import_queue import import_job_queue
 import logging
 
 logger = logging.getLogger(__name__)
 
 
-def process_csv_import(file_data, skip_rows, overwrite_mode, import_batch_id, company_code, user_email, filename):
+IMPORT_BATCH_SIZE = 1000  # Insert 1000 records at a time
+MAX_IMPORT_ERRORS = 10  # Error messages kept for the import log
+IMPORT_WRITERS = config('PO_IMPORT_WRITER_THREADS', default=4, cast=int)  # Concurrent bulk writes per import
+IMPORT_COLUMNS = ('PO_PAYTO_ID', 'PO_PAYTO_NAME', 'PO_COMPANY', 'PO_BRANCH', 'PO_NUMBER', 'ORDER_TOTAL', 'ORDER_DATE')
+
+
+class _CSVLines:
+    """Decoded lines of a binary file, tracking the byte offset after the last line read"""
+
+    def __init__(self, raw):
+        self.raw = raw
+        self.offset = raw.tell()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        line = self.raw.readline()
+        if not line:
+            raise StopIteration
+        self.offset += len(line)
+        return line.decode('utf-8')
+
+    def seek(self, offset):
+        self.raw.seek(offset)
+        self.offset = offset
+
+
+def _parse_import_records(records, header, first_row_num, metadata):
     """
-    Background worker function to process CSV import with progress updates.
-    Uses bulk insert optimization for 10-50x faster imports.
+    Validate a chunk of CSV records column by column
+
+    Same rules and messages as parsing row by row: all IMPORT_COLUMNS are
+    required (stripped; missing cells count as empty), ORDER_TOTAL is a
+    number with optional thousands separators and ORDER_DATE is MM/DD/YYYY.
+    Each invalid row gets one error, for the first rule it breaks.
+
+    Args:
+        records: csv.reader rows (lists of strings), without blank lines
+        header: The CSV header row
+        first_row_num: Row number of records[0] in error messages
+        metadata: Fields added to every document (company_code, import_batch_id, ...)
+
+    Returns:
+        tuple: (documents ready to insert, error messages in row order)
     """
-    BATCH_SIZE = 1000  # Insert 1000 records at a time
+    width = len(header)
+    count = len(records)
+    columns = list(zip(*(record if len(record) == width else (record + [''] * width)[:width] for record in records)))
+    positions = {name: position for position, name in enumerate(header)}  # Last duplicate wins, like DictReader
+    fields = {
+        name: pc.utf8_trim_whitespace(pa.array(columns[positions[name]], pa.string()))
+        if name in positions else pa.array([''] * count, pa.string())
+        for name in IMPORT_COLUMNS
+    }
+
+    errors = {}
+    missing = np.logical_or.reduce([pc.equal(values, '').to_numpy(zero_copy_only=False) for values in fields.values()])
+    for position in np.flatnonzero(missing):
+        errors[position] = 'Missing required fields'
 
+    # Parse order totals; Arrow's cast accepts a subset of what Decimal does,
+    # so only a chunk with an invalid total is parsed row by row
+    totals = np.full(count, np.nan)
+    checked = ~missing
+    total_text = pc.filter(pc.replace_substring(fields['ORDER_TOTAL'], ',', ''), pa.array(checked))
     try:
-        lines = file_data.splitlines()
+        totals[checked] = pc.cast(total_text, pa.float64()).to_numpy()
+    except pa.ArrowInvalid:
+        # Some total is invalid; find it row by row
+        for position, value in zip(np.flatnonzero(checked), total_text.to_pylist()):
+            try:
+                totals[position] = float(Decimal(value))
+            except InvalidOperation:
+                errors[position] = f"Invalid order total: {fields['ORDER_TOTAL'][position].as_py()}"
+            except ValueError as e:
+                errors[position] = str(e)
+        checked[list(errors)] = False
+
+    # Parse order dates (format: MM/DD/YYYY) once per distinct value
+    distinct_dates = pc.unique(fields['ORDER_DATE'])
+    parsed_dates = []
+    for value in distinct_dates.to_pylist():
+        try:
+            parsed_dates.append(datetime.strptime(value, '%m/%d/%Y'))
+        except ValueError:
+            parsed_dates.append(None)
+    order_dates = np.array(parsed_dates, dtype=object)[pc.index_in(fields['ORDER_DATE'], distinct_dates).to_numpy()]
+    for position in np.flatnonzero(checked & pd.isna(order_dates)):
+        errors[position] = f"Invalid date format: {fields['ORDER_DATE'][position].as_py()} (expected MM/DD/YYYY)"
+        checked[position] = False
+
+    valid = np.flatnonzero(checked)
+    imported_at = datetime.now()
+    documents = [
+        {
+            'po_payto_id': po_payto_id,
+            'po_payto_name': po_payto_name,
+            'po_company': po_company,
+            'po_branch': po_branch,
+            'po_number': po_number,
+            'order_total': order_total,
+            'order_date': order_date,
+            **metadata,
+            'imported_at': imported_at
+        }
+        for po_payto_id, po_payto_name, po_company, po_branch, po_number, order_total, order_date in zip(
+            *(fields[name].to_numpy(zero_copy_only=False)[valid].tolist() for name in IMPORT_COLUMNS[:5]),
+            totals[valid].tolist(),
+            order_dates[valid].tolist()
+        )
+    ]
+    messages = [f"Row {first_row_num + position}: {errors[position]}" for position in sorted(errors)]
+    return documents, messages
 
-        # Skip the specified number of rows before headers
-        if skip_rows > 0:
-            lines = lines[skip_rows:]
 
-        csv_reader = csv.DictReader(lines)
+def _write_import_batch(batch, overwrite_mode):
+    """Upsert one batch of PO documents; returns (imported, skipped as duplicates)"""
+    # One unordered bulk_write per batch; the server dedupes on (company_code, po_number)
+    result = analytics_mongodb.bulk_upsert_purchase_orders(batch, overwrite=overwrite_mode)
+    return result['inserted'] + result['replaced'], result['skipped']
 
-        imported_count = 0
-        skipped_count = 0
-        error_count = 0
-        errors = []
-        total_rows = 0
 
-        # First pass: count total rows
-        rows_list = list(csv_reader)
-        total_rows = len(rows_list)
+class _BatchWriters:
+    """
+    Writer threads for process_csv_import
+
+    submit() hands a batch to the threads through a bounded queue of
+    2 * writers batches and blocks while it is full, so parsing never runs
+    more than that far ahead of MongoDB. Batches finish in any order;
+    submit() and finish() return (mark, result) of finished batches in
+    submission order, only once every earlier batch is written too. A
+    failed write is raised from the next submit() or finish() and stops
+    the remaining queued batches.
+    """
 
-        # Update log with total
-        analytics_mongodb.update_import_log(import_batch_id, {
-            'total_rows': total_rows,
-            'status': 'processing'
-        })
+    def __init__(self, write, writers):
+        self._write = write
+        self._pending = queue.Queue(maxsize=2 * writers)
+        self._done = queue.Queue()
+        self._finished = {}
+        self._submitted = 0
+        self._reported = 0
+        self._stopping = threading.Event()
+        self._threads = [
+            threading.Thread(target=self._run, name=f'po-import-writer-{n}', daemon=True)
+            for n in range(writers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def _run(self):
+        while True:
+            item = self._pending.get()
+            if item is None:
+                return
+            seq, batch, mark = item
+            if self._stopping.is_set():
+                continue  # A write failed; drop what is still queued
+            try:
+                result = self._write(batch)
+            except Exception as e:
+                result = e
+            self._done.put((seq, mark, result))
+
+    def _collect(self, block):
+        try:
+            while True:
+                seq, mark, result = self._done.get(block=block)
+                block = False
+                if isinstance(result, Exception):
+                    raise result
+                self._finished[seq] = (mark, result)
+        except queue.Empty:
+            pass
+
+        ready = []
+        while self._reported in self._finished:
+            ready.append(self._finished.pop(self._reported))
+            self._reported += 1
+        return ready
+
+    def submit(self, batch, mark):
+        """Queue a batch, waiting while the queue is full; returns newly finished batches"""
+        item = (self._submitted, batch, mark)
+        self._submitted += 1
+        ready = []
+        while True:
+            ready += self._collect(block=False)
+            try:
+                self._pending.put(item, timeout=0.1)
+                return ready
+            except queue.Full:
+                continue
+
+    def finish(self):
+        """Wait for every submitted batch; returns the ones not reported yet"""
+        ready = []
+        while self._reported < self._submitted:
+            ready += self._collect(block=True)
+        return ready
+
+    def close(self):
+        """Stop the threads (dropping queued batches if finish() was not reached)"""
+        if self._reported < self._submitted:
+            self._stopping.set()
+        for _ in self._threads:
+            self._pending.put(None)
+        for thread in self._threads:
+            thread.join()
+
+
+def process_csv_import(file_path, file_size, skip_rows, overwrite_mode, import_batch_id, company_code, user_email, filename,
+                       checkpoint=None, on_checkpoint=None, writers=None):
+    """
+    Stream a CSV file into purchase_orders with progress updates.
+
+    Rows are read IMPORT_BATCH_SIZE at a time, validated column by column
+    (_parse_import_records) and bulk written, so memory stays flat however
+    large the file is. Progress is reported from the byte offset
+    (progress_percent) instead of a pre-count; total_rows is the number of
+    rows read so far.
+
+    Batches are written by `writers` threads (PO_IMPORT_WRITER_THREADS)
+    while parsing continues, see _BatchWriters. With several writers, a
+    PO number repeated within one overwrite-mode file keeps whichever of
+    its rows is written last.
+
+    Run by the import worker (run_po_import_worker). Once a batch and all
+    batches before it are written, on_checkpoint(state) receives the byte
+    offset and counters; passing that state back as checkpoint resumes the
+    import after that batch. Errors propagate to the caller, which decides
+    whether to retry.
+    """
+    # state only covers written batches; parsed runs ahead of it
+    state = dict(checkpoint or {
+        'offset': 0,
+        'row_num': 1,
+        'total_rows': 0,
+        'imported_rows': 0,
+        'skipped_rows': 0,
+        'error_rows': 0,
+        'errors': [],
+    })
+    parsed = {key: state[key] for key in ('row_num', 'total_rows', 'error_rows')}
+    errors = list(state['errors'])
+
+    metadata = {
+        'company_code': company_code,
+        'import_batch_id': import_batch_id,
+        'imported_by_email': user_email,
+        'source_file': filename,
+    }
 
-        # Batch processing
-        batch = []
-        batch_po_numbers = []
+    def record_error(message):
+        parsed['error_rows'] += 1
+        if len(errors) < MAX_IMPORT_ERRORS:
+            errors.append(message)
+
+    def progress():
+        return {
+            'total_rows': state['total_rows'],
+            'imported_rows': state['imported_rows'],
+            'skipped_rows': state['skipped_rows'],
+            'error_rows': state['error_rows'],
+            'bytes_processed': state['offset'],
+            'progress_percent': round(100 * state['offset'] / file_size, 1) if file_size else 100
+        }
 
-        for row_num, row in enumerate(rows_list, start=2):
-            try:
-                # Parse and validate data
-                po_payto_id = row.get('PO_PAYTO_ID', '').strip()
-                po_payto_name = row.get('PO_PAYTO_NAME', '').strip()
-                po_company = row.get('PO_COMPANY', '').strip()
-                po_branch = row.get('PO_BRANCH', '').strip()
-                po_number = row.get('PO_NUMBER', '').strip()
-                order_total_str = row.get('ORDER_TOTAL', '').strip()
-                order_date_str = row.get('ORDER_DATE', '').strip()
-
-                # Validate required fields
-                if not all([po_payto_id, po_payto_name, po_company, po_branch, po_number, order_total_str, order_date_str]):
-                    error_count += 1
-                    errors.append(f"Row {row_num}: Missing required fields")
-                    continue
-
-                # Parse order total
-                try:
-                    order_total = Decimal(order_total_str.replace(',', ''))
-                except (InvalidOperation, ValueError):
-                    error_count += 1
-                    errors.append(f"Row {row_num}: Invalid order total: {order_total_str}")
-                    continue
-
-                # Parse order date (format: MM/DD/YYYY)
-                try:
-                    order_date = datetime.strptime(order_date_str, '%m/%d/%Y').date()
-                except ValueError:
-                    error_count += 1
-                    errors.append(f"Row {row_num}: Invalid date format: {order_date_str} (expected MM/DD/YYYY)")
-                    continue
-
-                # Add to batch
-                po_doc = {
-                    'po_payto_id': po_payto_id,
-                    'po_payto_name': po_payto_name,
-                    'po_company': po_company,
-                    'po_branch': po_branch,
-                    'po_number': po_number,
-                    'order_total': float(order_total),
-                    'order_date': datetime.combine(order_date, datetime.min.time()),
-                    'company_code': company_code,
-                    'import_batch_id': import_batch_id,
-                    'imported_by_email': user_email,
-                    'source_file': filename,
-                    'imported_at': datetime.now()
-                }
-                batch.append(po_doc)
-                batch_po_numbers.append(po_number)
-
-                # Process batch when it reaches BATCH_SIZE or end of file
-                if len(batch) >= BATCH_SIZE or row_num == len(rows_list) + 1:
-                    # Handle duplicates
-                    if overwrite_mode:
-                        # Delete all existing POs in this batch
-                        analytics_mongodb.purchase_orders.delete_many({
-                            'po_number': {'$in': batch_po_numbers},
-                            'company_code': company_code
-                        })
-                        # Insert all records in batch
-                        inserted_count = analytics_mongodb.insert_many_purchase_orders(batch)
-                        imported_count += inserted_count
-                    else:
-                        # Find existing PO numbers in batch
-                        existing_pos = analytics_mongodb.purchase_orders.find(
-                            {
-                                'po_number': {'$in': batch_po_numbers},
-                                'company_code': company_code
-                            },
-                            {'po_number': 1}
-                        )
-                        existing_po_numbers = {po['po_number'] for po in existing_pos}
-
-                        # Filter out existing records
-                        new_records = [doc for doc in batch if doc['po_number'] not in existing_po_numbers]
-                        skipped_count += len(batch) - len(new_records)
-
-                        # Bulk insert only new records
-                        if new_records:
-                            inserted_count = analytics_mongodb.insert_many_purchase_orders(new_records)
-                            imported_count += inserted_count
-
-                    # Update progress
-                    analytics_mongodb.update_import_log(import_batch_id, {
-                        'imported_rows': imported_count,
-                        'skipped_rows': skipped_count,
-                        'error_rows': error_count
-                    })
-
-                    # Clear batch
-                    batch = []
-                    batch_po_numbers = []
+    def batches_written(finished):
+        for mark, (inserted, skipped) in finished:
+            state.update(mark)
+            state['imported_rows'] += inserted
+            state['skipped_rows'] += skipped
 
-            except Exception as e:
-                error_count += 1
-                errors.append(f"Row {row_num}: {str(e)}")
-
-        # Final update
-        analytics_mongodb.update_import_log(import_batch_id, {
-            'imported_rows': imported_count,
-            'skipped_rows': skipped_count,
-            'error_rows': error_count,
-            'status': 'completed' if error_count == 0 else 'completed_with_errors',
-            'error_message': '\n'.join(errors[:10]) if errors else None
-        })
+            # Update progress and hand out a resume point after this batch
+            analytics_mongodb.update_import_log(import_batch_id, progress())
+            if on_checkpoint:
+                on_checkpoint(dict(state))
 
-        logger.info(f"Import {import_batch_id} completed: {imported_count} imported, {skipped_count} skipped, {error_count} errors")
+    analytics_mongodb.update_import_log(import_batch_id, {
+        'bytes_total': file_size,
+        'status': 'processing',
+        **(progress() if checkpoint else {})
+    })
 
-    except Exception as e:
-        logger.error(f"Import {import_batch_id} failed: {str(e)}")
-        analytics_mongodb.update_import_log(import_batch_id, {
-            'status': 'failed',
-            'error_message': str(e)
-        })
+    writer_pool = _BatchWriters(lambda batch: _write_import_batch(batch, overwrite_mode), max(writers or IMPORT_WRITERS, 1))
+    try:
+        with open(file_path, 'rb') as raw:
+            lines = _CSVLines(raw)
+
+            # Skip the specified number of rows before headers
+            for _ in range(skip_rows):
+                next(lines, None)
+
+            reader = csv.reader(lines)
+            header = next(reader, None)
+
+            if checkpoint:
+                lines.seek(checkpoint['offset'])
+                logger.info(f"Import {import_batch_id} resuming at byte {checkpoint['offset']:,} (row {checkpoint['row_num'] + 1})")
+
+            records = []
+
+            def submit_records():
+                documents, messages = _parse_import_records(records, header, parsed['row_num'] + 1, metadata)
+                parsed['row_num'] += len(records)
+                parsed['total_rows'] += len(records)
+                for message in messages:
+                    record_error(message)
+                if documents:
+                    mark = {'offset': lines.offset, **parsed, 'errors': list(errors)}
+                    batches_written(writer_pool.submit(documents, mark))
+
+            for record in (reader if header is not None else ()):
+                if not record:
+                    continue  # Blank line
+                records.append(record)
+                if len(records) >= IMPORT_BATCH_SIZE:
+                    submit_records()
+                    records = []
+
+            # Process the remaining records at end of file
+            if records:
+                submit_records()
+
+        batches_written(writer_pool.finish())
+    finally:
+        writer_pool.close()
+
+    # Rows after the last batch may only have had errors
+    state.update(parsed, errors=errors)
+
+    # Final update
+    state['offset'] = file_size
+    analytics_mongodb.update_import_log(import_batch_id, {
+        **progress(),
+        'status': 'completed' if state['error_rows'] == 0 else 'completed_with_errors',
+        'error_message': '\n'.join(errors) if errors else None
+    })
+
+    logger.info(
+        f"Import {import_batch_id} completed: {state['imported_rows']} imported, "
+        f"{state['skipped_rows']} skipped, {state['error_rows']} errors"
+    )
 
 
 def po_insights(request):
@@ -234,7 +434,7 @@ def import_csv(request):
             'file_key': f"companies/{company_code}/po-imports/{filename}",
             'company_code': company_code,
             'imported_by_email': user_email,
-            'status': 'processing',
+            'status': 'queued',
             'total_rows': 0,
             'imported_rows': 0,
             'skipped_rows': 0,
@@ -242,22 +442,23 @@ def import_csv(request):
             'imported_at': datetime.now()
         })
 
-        # Read CSV into memory
-        file_data = uploaded_file.read().decode('utf-8')
-
-        # Start background thread for processing
-        thread = threading.Thread(
-            target=process_csv_import,
-            args=(file_data, skip_rows, overwrite_mode, import_batch_id, company_code, user_email, filename)
+        # Store the upload in GridFS and queue it for the import workers
+        # (python manage.py run_po_import_worker)
+        import_job_queue.enqueue(
+            uploaded_file.chunks(),
+            import_batch_id=import_batch_id,
+            company_code=company_code,
+            user_email=user_email,
+            filename=filename,
+            skip_rows=skip_rows,
+            overwrite_mode=overwrite_mode
         )
-        thread.daemon = True
-        thread.start()
 
         # Return immediately with batch ID - frontend will poll for progress
         return JsonResponse({
             'success': True,
             'import_batch_id': import_batch_id,
-            'message': 'Import started in background. Refresh to see progress.'
+            'message': 'Import queued. Refresh to see progress.'
         })
 
     except Exception as e:
@@ -3,18 +3,63 @@ Purchase Order Analytics Views using DuckDB
 
 High-performance analytical queries on Parquet files.
 Queries 111K+ records in milliseconds directly from Wasabi S3.
+
+The vendor, branch, monthly, top-by-branch and summary endpoints read the
+daily rollups maintained at import time (services/po_rollups.py); search
+and export filter individual rows and read the raw dataset.
 """
 
+import json
 import logging
-from django.http import JsonResponse
+from datetime import date, datetime
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
 from django.views.decorators.http import require_http_methods
 from services.duckdb_client import duckdb_client
+from services.duckdb_query import ParquetQuery, months_before
+from services.po_dataset import PO_DATASET_PREFIX, PO_PARTITIONING
+from services.po_rollups import PO_AGGREGATES, PO_ROLLUP_PARTITIONING, PO_ROLLUP_PREFIX, ROLLUP_AGGREGATES
 from decouple import config
 
 logger = logging.getLogger(__name__)
 
-# S3 path to purchase orders Parquet file
-PO_PARQUET_PATH = 's3://emp54/analytics/purchase_orders.parquet'
+# S3 path to the purchase orders dataset (hive-partitioned by company_code/year/month)
+PO_DATASET_PATH = f's3://emp54/{PO_DATASET_PREFIX}'
+
+# Daily rollups of the same data (company_code/year/month partitioned).
+# Off by default: turn PO_ROLLUPS_ENABLED on only after
+# `manage.py build_po_rollups` has run, or the endpoints read an empty prefix.
+PO_ROLLUP_PATH = f's3://emp54/{PO_ROLLUP_PREFIX}'
+PO_ROLLUPS_ENABLED = config('PO_ROLLUPS_ENABLED', default=False, cast=bool)
+
+
+def po_query():
+    """New parameterized query over the purchase orders dataset"""
+    return ParquetQuery(PO_DATASET_PATH, PO_PARTITIONING)
+
+
+def aggregate_query():
+    """
+    New query for aggregate endpoints, with the SQL for its measures
+
+    Returns:
+        (ParquetQuery over the daily rollups, ROLLUP_AGGREGATES), or the raw
+        dataset and PO_AGGREGATES when rollups are disabled
+    """
+    if PO_ROLLUPS_ENABLED:
+        return ParquetQuery(PO_ROLLUP_PATH, PO_ROLLUP_PARTITIONING), ROLLUP_AGGREGATES
+    return po_query(), PO_AGGREGATES
+
+
+def json_data_response(data_json, **fields):
+    """
+    JSON response with a pre-rendered array (from duckdb_client.run_json) as 'data'
+
+    Only the small envelope goes through the Python JSON encoder; the rows
+    are spliced in as bytes.
+    """
+    envelope = json.dumps({'success': True, **fields}, cls=DjangoJSONEncoder)
+    return HttpResponse(envelope[:-1].encode() + b', "data": ' + data_json + b'}', content_type='application/json')
 
 
 @require_http_methods(["GET"])
@@ -42,11 +87,12 @@ def duckdb_diagnostics(request):
 
     # Check 2: DuckDB connection
     try:
-        conn = duckdb_client.get_connection()
-        conn.close()
+        with duckdb_client.connection() as conn:
+            conn.execute("SELECT 1").fetchone()
         diagnostics['checks']['duckdb_connection'] = {
             'success': True,
-            'error': None
+            'error': None,
+            'pool': duckdb_client.get_pool_stats()
         }
     except Exception as e:
         diagnostics['checks']['duckdb_connection'] = {
@@ -56,26 +102,28 @@ def duckdb_diagnostics(request):
 
     # Check 3: Parquet file accessibility
     try:
-        count_result = duckdb_client.query(f"SELECT COUNT(*) as count FROM '{PO_PARQUET_PATH}'")
+        count_result = duckdb_client.run(po_query().select('COUNT(*) as count'), cache=False)
         record_count = count_result[0]['count'] if count_result else 0
 
         diagnostics['checks']['parquet_file'] = {
             'accessible': True,
-            'path': PO_PARQUET_PATH,
+            'path': PO_DATASET_PATH,
             'record_count': record_count,
-            'error': None
+            'error': None,
+            'local_mirror': duckdb_client.parquet_cache.get_stats(),
+            'result_cache': duckdb_client.result_cache.get_stats()
         }
     except Exception as e:
         diagnostics['checks']['parquet_file'] = {
             'accessible': False,
-            'path': PO_PARQUET_PATH,
+            'path': PO_DATASET_PATH,
             'record_count': 0,
             'error': str(e)
         }
 
     # Check 4: Sample query
     try:
-        sample = duckdb_client.query(f"SELECT * FROM '{PO_PARQUET_PATH}' LIMIT 1")
+        sample = duckdb_client.run(po_query().limit(1), cache=False)
         diagnostics['checks']['sample_query'] = {
             'success': True,
             'columns': list(sample[0].keys()) if sample else [],
@@ -122,38 +170,41 @@ def po_vendor_analysis(request):
         if sort_by not in ['total_spent', 'order_count']:
             sort_by = 'total_spent'
 
-        sql = f"""
-            SELECT
-                po_payto_name as vendor,
-                po_payto_id as vendor_id,
-                COUNT(*) as order_count,
-                SUM(order_total) as total_spent,
-                AVG(order_total) as avg_order_value,
-                MIN(order_total) as min_order,
-                MAX(order_total) as max_order,
-                MIN(order_date) as first_order_date,
-                MAX(order_date) as last_order_date
-            FROM '{PO_PARQUET_PATH}'
-            WHERE po_payto_name IS NOT NULL
-            GROUP BY po_payto_name, po_payto_id
-            HAVING COUNT(*) >= {min_orders}
-            ORDER BY {sort_by} DESC
-            LIMIT {limit}
-        """
-
-        results = duckdb_client.query(sql)
-
-        return JsonResponse({
-            'success': True,
-            'data': results,
-            'count': len(results),
-            'filters': {
+        query, agg = aggregate_query()
+        query = (
+            query
+            .select(
+                'po_payto_name as vendor',
+                'po_payto_id as vendor_id',
+                f'{agg.order_count} as order_count',
+                f'{agg.total} as total_spent',
+                f'{agg.average} as avg_order_value',
+                f'{agg.min_total} as min_order',
+                f'{agg.max_total} as max_order',
+                f'{agg.first_date} as first_order_date',
+                f'{agg.last_date} as last_order_date'
+            )
+            .where_not_null('po_payto_name')
+            .group_by('po_payto_name', 'po_payto_id')
+            .having(f'{agg.order_count} >= ?', min_orders)
+            .order_by(sort_by, descending=True, allowed=['total_spent', 'order_count'])
+            .limit(limit)
+        )
+
+        data_json, count = duckdb_client.run_json(query)
+
+        return json_data_response(
+            data_json,
+            count=count,
+            filters={
                 'limit': limit,
                 'min_orders': min_orders,
                 'sort_by': sort_by
             }
-        })
+        )
 
+    except ValueError as e:
+        return JsonResponse({'error': f'Invalid parameter: {e}'}, status=400)
     except Exception as e:
         logger.error(f"Vendor analysis error: {e}")
         return JsonResponse({'error': str(e)}, status=500)
@@ -173,30 +224,30 @@ def po_branch_analysis(request):
     try:
         limit = int(request.GET.get('limit', 20))
 
-        sql = f"""
-            SELECT
-                po_branch as branch,
-                COUNT(*) as order_count,
-                SUM(order_total) as total_value,
-                AVG(order_total) as avg_order_value,
-                COUNT(DISTINCT po_payto_id) as unique_vendors,
-                MIN(order_date) as earliest_order,
-                MAX(order_date) as latest_order
-            FROM '{PO_PARQUET_PATH}'
-            WHERE po_branch IS NOT NULL
-            GROUP BY po_branch
-            ORDER BY order_count DESC
-            LIMIT {limit}
-        """
-
-        results = duckdb_client.query(sql)
+        query, agg = aggregate_query()
+        query = (
+            query
+            .select(
+                'po_branch as branch',
+                f'{agg.order_count} as order_count',
+                f'{agg.total} as total_value',
+                f'{agg.average} as avg_order_value',
+                'COUNT(DISTINCT po_payto_id) as unique_vendors',
+                f'{agg.first_date} as earliest_order',
+                f'{agg.last_date} as latest_order'
+            )
+            .where_not_null('po_branch')
+            .group_by('po_branch')
+            .order_by('order_count', descending=True)
+            .limit(limit)
+        )
 
-        return JsonResponse({
-            'success': True,
-            'data': results,
-            'count': len(results)
-        })
+        data_json, count = duckdb_client.run_json(query)
+
+        return json_data_response(data_json, count=count)
 
+    except ValueError as e:
+        return JsonResponse({'error': f'Invalid parameter: {e}'}, status=400)
     except Exception as e:
         logger.error(f"Branch analysis error: {e}")
         return JsonResponse({'error': str(e)}, status=500)
@@ -220,49 +271,109 @@ def po_monthly_trends(request):
         branch = request.GET.get('branch', '')
         vendor = request.GET.get('vendor', '')
 
-        # Build WHERE clause
-        where_clauses = ["order_date IS NOT NULL"]
+        query, agg = aggregate_query()
+        month = f"DATE_TRUNC('month', CAST({agg.date_column} AS DATE))"
+        query = (
+            query
+            .select(
+                f"{month} as month",
+                f'{agg.order_count} as order_count',
+                f'{agg.total} as monthly_total',
+                f'{agg.average} as avg_order_value',
+                'COUNT(DISTINCT po_payto_id) as unique_vendors'
+            )
+            .where_not_null(agg.date_column)
+        )
 
         if branch:
-            where_clauses.append(f"po_branch = '{branch}'")
+            query.where_equals('po_branch', branch)
         if vendor:
-            where_clauses.append(f"po_payto_name LIKE '%{vendor}%'")
-
-        where_clause = ' AND '.join(where_clauses)
-
-        sql = f"""
-            SELECT
-                DATE_TRUNC('month', CAST(order_date AS DATE)) as month,
-                COUNT(*) as order_count,
-                SUM(order_total) as monthly_total,
-                AVG(order_total) as avg_order_value,
-                COUNT(DISTINCT po_payto_id) as unique_vendors
-            FROM '{PO_PARQUET_PATH}'
-            WHERE {where_clause}
-                AND order_date >= CURRENT_DATE - INTERVAL '{months} months'
-            GROUP BY DATE_TRUNC('month', CAST(order_date AS DATE))
-            ORDER BY month DESC
-            LIMIT {months}
-        """
-
-        results = duckdb_client.query(sql)
-
-        return JsonResponse({
-            'success': True,
-            'data': results,
-            'count': len(results),
-            'filters': {
+            query.where_contains('po_payto_name', vendor)
+
+        # A bound start date (rather than CURRENT_DATE - to_months(?)) lets
+        # the builder prune partitions outside the requested months
+        query = (
+            query
+            .where_on_or_after(agg.date_column, months_before(date.today(), months))
+            .group_by(month)
+            .order_by('month', descending=True)
+            .limit(months)
+        )
+
+        data_json, count = duckdb_client.run_json(query)
+
+        return json_data_response(
+            data_json,
+            count=count,
+            filters={
                 'months': months,
                 'branch': branch or 'all',
                 'vendor': vendor or 'all'
             }
-        })
+        )
 
+    except ValueError as e:
+        return JsonResponse({'error': f'Invalid parameter: {e}'}, status=400)
     except Exception as e:
         logger.error(f"Monthly trends error: {e}")
         return JsonResponse({'error': str(e)}, status=500)
 
 
+def po_search_query(params):
+    """
+    Build the filtered PO query shared by po_search and the export endpoint
+
+    Args:
+        params: Request query dict (po_number, vendor, branch, min_amount,
+            max_amount, start_date, end_date)
+
+    Returns:
+        (ParquetQuery without LIMIT, dict of applied filters)
+
+    Raises:
+        ValueError: If a numeric or date filter is malformed
+    """
+    filters = {
+        'po_number': params.get('po_number', ''),
+        'vendor': params.get('vendor', ''),
+        'branch': params.get('branch', ''),
+        'min_amount': params.get('min_amount', ''),
+        'max_amount': params.get('max_amount', ''),
+        'start_date': params.get('start_date', ''),
+        'end_date': params.get('end_date', '')
+    }
+
+    query = po_query().select(
+        'po_number',
+        'po_payto_name as vendor',
+        'po_payto_id as vendor_id',
+        'po_branch as branch',
+        'po_company as company',
+        'order_total',
+        'order_date',
+        'company_code'
+    )
+
+    if filters['po_number']:
+        query.where_contains('po_number', filters['po_number'])
+    if filters['vendor']:
+        query.where_contains('po_payto_name', filters['vendor'])
+    if filters['branch']:
+        query.where_equals('po_branch', filters['branch'])
+    if filters['min_amount']:
+        query.where_at_least('order_total', filters['min_amount'])
+    if filters['max_amount']:
+        query.where_at_most('order_total', filters['max_amount'])
+    if filters['start_date']:
+        query.where_on_or_after('order_date', filters['start_date'])
+    if filters['end_date']:
+        query.where_on_or_before('order_date', filters['end_date'])
+
+    query.order_by('order_date', descending=True)
+
+    return query, filters
+
+
 @require_http_methods(["GET"])
 def po_search(request):
     """
@@ -282,73 +393,155 @@ def po_search(request):
         return JsonResponse({'error': 'Not authenticated'}, status=401)
 
     try:
-        po_number = request.GET.get('po_number', '')
-        vendor = request.GET.get('vendor', '')
-        branch = request.GET.get('branch', '')
-        min_amount = request.GET.get('min_amount', '')
-        max_amount = request.GET.get('max_amount', '')
-        start_date = request.GET.get('start_date', '')
-        end_date = request.GET.get('end_date', '')
         limit = int(request.GET.get('limit', 100))
+        query, filters = po_search_query(request.GET)
+        query.limit(limit)
 
-        # Build WHERE clause
-        where_clauses = []
+        # Free-form searches rarely repeat, so they skip the result cache.
+        # Rows are rendered to JSON by DuckDB straight from Arrow batches.
+        data_json, count = duckdb_client.run_json(query, cache=False)
 
-        if po_number:
-            where_clauses.append(f"po_number LIKE '%{po_number}%'")
-        if vendor:
-            where_clauses.append(f"po_payto_name LIKE '%{vendor}%'")
-        if branch:
-            where_clauses.append(f"po_branch = '{branch}'")
-        if min_amount:
-            where_clauses.append(f"order_total >= {float(min_amount)}")
-        if max_amount:
-            where_clauses.append(f"order_total <= {float(max_amount)}")
-        if start_date:
-            where_clauses.append(f"order_date >= '{start_date}'")
-        if end_date:
-            where_clauses.append(f"order_date <= '{end_date}'")
-
-        where_clause = ' AND '.join(where_clauses) if where_clauses else '1=1'
-
-        sql = f"""
-            SELECT
-                po_number,
-                po_payto_name as vendor,
-                po_payto_id as vendor_id,
-                po_branch as branch,
-                po_company as company,
-                order_total,
-                order_date,
-                company_code
-            FROM '{PO_PARQUET_PATH}'
-            WHERE {where_clause}
-            ORDER BY order_date DESC
-            LIMIT {limit}
-        """
-
-        results = duckdb_client.query(sql)
-
-        return JsonResponse({
-            'success': True,
-            'data': results,
-            'count': len(results),
-            'filters': {
-                'po_number': po_number,
-                'vendor': vendor,
-                'branch': branch,
-                'min_amount': min_amount,
-                'max_amount': max_amount,
-                'start_date': start_date,
-                'end_date': end_date
-            }
-        })
+        return json_data_response(data_json, count=count, filters=filters)
 
+    except ValueError as e:
+        return JsonResponse({'error': f'Invalid parameter: {e}'}, status=400)
     except Exception as e:
         logger.error(f"PO search error: {e}")
         return JsonResponse({'error': str(e)}, status=500)
 
 
+class _ChunkedSink:
+    """Write-only file object that hands out whatever has been written so far"""
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+        self.closed = False
+
+    def write(self, data):
+        data = bytes(data)
+        self._chunks.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def _stream_csv(batches):
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+
+    include_header = True
+    for batch in batches:
+        buffer = pa.BufferOutputStream()
+        pa_csv.write_csv(batch, buffer, write_options=pa_csv.WriteOptions(include_header=include_header))
+        include_header = False
+        yield buffer.getvalue().to_pybytes()
+
+
+def _stream_ndjson(sql, params):
+    for chunk, _ in duckdb_client.iter_json_batches(sql, params, separator='\n', dedicated=True):
+        yield chunk + b'\n'
+
+
+def _stream_parquet(batches):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    sink = _ChunkedSink()
+    writer = None
+    for batch in batches:
+        if writer is None:
+            writer = pq.ParquetWriter(pa.PythonFile(sink, mode='w'), batch.schema, compression='zstd')
+        # One row group per batch; flush the finished row group to the client.
+        # An empty result is a single empty batch: a valid file with no rows.
+        if batch.num_rows:
+            writer.write_batch(batch)
+        yield sink.drain()
+    if writer is not None:
+        writer.close()
+        yield sink.drain()
+
+
+def _prepend(first, chunks):
+    # A generator (unlike itertools.chain) forwards close() when the client disconnects
+    if first is not None:
+        yield first
+    yield from chunks
+
+
+EXPORT_FORMATS = {
+    'csv': ('text/csv', 'csv'),
+    'ndjson': ('application/x-ndjson', 'ndjson'),
+    'parquet': ('application/vnd.apache.parquet', 'parquet'),
+}
+
+
+@require_http_methods(["GET"])
+def po_export(request):
+    """
+    Stream filtered purchase orders as CSV, NDJSON or Parquet
+
+    Takes the same filters as po_search and has no row cap. Rows are read
+    from DuckDB in Arrow record batches and written to the response batch
+    by batch, so memory stays constant however large the export is.
+
+    Query params:
+        - format: csv | ndjson | parquet (default: csv)
+        - limit: Optional maximum number of rows
+        - po_search filters (po_number, vendor, branch, min_amount,
+          max_amount, start_date, end_date)
+    """
+    if not request.session.get('customer_logged_in') and not request.session.get('admin_logged_in'):
+        return JsonResponse({'error': 'Not authenticated'}, status=401)
+
+    export_format = request.GET.get('format', 'csv').lower()
+    if export_format not in EXPORT_FORMATS:
+        return JsonResponse({'error': f'Unsupported format: {export_format}. Use csv, ndjson or parquet.'}, status=400)
+
+    try:
+        query, filters = po_search_query(request.GET)
+        if request.GET.get('limit'):
+            query.limit(request.GET['limit'])
+
+        sql, params = query.build(duckdb_client.resolve_path)
+
+        if export_format == 'ndjson':
+            chunks = _stream_ndjson(sql, params)
+        else:
+            batches = duckdb_client.iter_record_batches(sql, params)
+            chunks = _stream_csv(batches) if export_format == 'csv' else _stream_parquet(batches)
+
+        # Run the query before the response starts so errors still get a status code
+        first = next(chunks, None)
+        chunks = _prepend(first, chunks)
+
+    except ValueError as e:
+        return JsonResponse({'error': f'Invalid parameter: {e}'}, status=400)
+    except Exception as e:
+        logger.error(f"PO export error: {e}")
+        return JsonResponse({'error': str(e)}, status=500)
+
+    logger.info(f"[PO Export] Streaming {export_format} export with filters {filters}")
+
+    content_type, extension = EXPORT_FORMATS[export_format]
+    response = StreamingHttpResponse(chunks, content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="po_export_{datetime.now().strftime("%Y%m%d_%H%M%S")}.{extension}"'
+    return response
+
+
 @require_http_methods(["GET"])
 def po_top_vendors_by_branch(request):
     """
@@ -365,34 +558,31 @@ def po_top_vendors_by_branch(request):
         top_n = int(request.GET.get('top_n', 5))
         min_total = float(request.GET.get('min_total', 0))
 
-        sql = f"""
-            WITH vendor_stats AS (
-                SELECT
-                    po_branch as branch,
-                    po_payto_name as vendor,
-                    COUNT(*) as order_count,
-                    SUM(order_total) as total_spent,
-                    AVG(order_total) as avg_order_value,
-                    RANK() OVER (PARTITION BY po_branch ORDER BY SUM(order_total) DESC) as rank
-                FROM '{PO_PARQUET_PATH}'
-                WHERE po_branch IS NOT NULL
-                    AND po_payto_name IS NOT NULL
-                GROUP BY po_branch, po_payto_name
-                HAVING SUM(order_total) >= {min_total}
+        vendor_stats, agg = aggregate_query()
+        vendor_stats = (
+            vendor_stats
+            .select(
+                'po_branch as branch',
+                'po_payto_name as vendor',
+                f'{agg.order_count} as order_count',
+                f'{agg.total} as total_spent',
+                f'{agg.average} as avg_order_value',
+                f'RANK() OVER (PARTITION BY po_branch ORDER BY {agg.total} DESC) as rank'
             )
-            SELECT
-                branch,
-                vendor,
-                order_count,
-                total_spent,
-                avg_order_value,
-                rank
-            FROM vendor_stats
-            WHERE rank <= {top_n}
-            ORDER BY branch, rank
-        """
-
-        results = duckdb_client.query(sql)
+            .where_not_null('po_branch', 'po_payto_name')
+            .group_by('po_branch', 'po_payto_name')
+            .having(f'{agg.total} >= ?', min_total)
+        )
+
+        query = (
+            po_query()
+            .with_cte('vendor_stats', vendor_stats)
+            .select('branch', 'vendor', 'order_count', 'total_spent', 'avg_order_value', 'rank')
+            .where('rank <= ?', top_n)
+            .order_by_expression('branch, rank')
+        )
+
+        results = duckdb_client.run(query)
 
         # Group by branch for easier frontend consumption
         grouped = {}
@@ -412,6 +602,8 @@ def po_top_vendors_by_branch(request):
             }
         })
 
+    except ValueError as e:
+        return JsonResponse({'error': f'Invalid parameter: {e}'}, status=400)
     except Exception as e:
         logger.error(f"Top vendors by branch error: {e}")
         return JsonResponse({'error': str(e)}, status=500)
@@ -428,21 +620,20 @@ def po_summary_stats(request):
         return JsonResponse({'error': 'Not authenticated'}, status=401)
 
     try:
-        sql = f"""
-            SELECT
-                COUNT(*) as total_orders,
-                COUNT(DISTINCT po_payto_id) as unique_vendors,
-                COUNT(DISTINCT po_branch) as unique_branches,
-                SUM(order_total) as total_value,
-                AVG(order_total) as avg_order_value,
-                MIN(order_total) as min_order,
-                MAX(order_total) as max_order,
-                MIN(order_date) as earliest_order,
-                MAX(order_date) as latest_order
-            FROM '{PO_PARQUET_PATH}'
-        """
-
-        results = duckdb_client.query(sql)
+        query, agg = aggregate_query()
+        query = query.select(
+            f'{agg.order_count} as total_orders',
+            'COUNT(DISTINCT po_payto_id) as unique_vendors',
+            'COUNT(DISTINCT po_branch) as unique_branches',
+            f'{agg.total} as total_value',
+            f'{agg.average} as avg_order_value',
+            f'{agg.min_total} as min_order',
+            f'{agg.max_total} as max_order',
+            f'{agg.first_date} as earliest_order',
+            f'{agg.last_date} as latest_order'
+        )
+
+        results = duckdb_client.run(query)
 
         return JsonResponse({
             'success': True,
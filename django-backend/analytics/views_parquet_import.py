@@ -4,7 +4,10 @@ Parquet-based CSV Import for Purchase Orders
 This replaces the MongoDB import flow with a Parquet-based approach:
 1. Upload CSV
 2. Convert to Parquet
-3. Upload to Wasabi S3
+3. Upload to Wasabi S3 as new fragments in the company/month partitions of
+   the purchase orders dataset (services/po_dataset.py), committed with a
+   manifest; existing data is never downloaded or rewritten
+   (the daily rollups the dashboard reads are updated the same way)
 4. Optionally append to existing data or replace
 
 Benefits:
@@ -14,12 +17,9 @@ Benefits:
 - ~$0.01/month storage cost
 """
 
-import os
 import io
 import uuid
 import pandas as pd
-import pyarrow as pa
-import pyarrow.parquet as pq
 from datetime import datetime
 from decimal import Decimal
 import logging
@@ -29,6 +29,9 @@ from django.views.decorators.http import require_http_methods
 from decouple import config
 import boto3
 
+from services.po_dataset import PO_SCHEMA, PurchaseOrderDataset
+from services.po_rollups import PurchaseOrderRollups
+
 logger = logging.getLogger(__name__)
 
 # Wasabi S3 configuration with defaults
@@ -38,8 +41,6 @@ WASABI_ACCESS_KEY = config('WASABI_ACCESS_KEY', default='')
 WASABI_SECRET_KEY = config('WASABI_SECRET_KEY', default='')
 WASABI_REGION = config('WASABI_REGION', default='us-central-1')
 
-PARQUET_PATH = 'analytics/purchase_orders.parquet'
-
 
 def get_s3_client():
     """Get configured Wasabi S3 client"""
@@ -56,6 +57,12 @@ def get_s3_client():
     )
 
 
+def get_dataset(s3_client=None):
+    """Purchase orders dataset in the configured bucket, with its daily rollups"""
+    s3_client = s3_client or get_s3_client()
+    return PurchaseOrderDataset(s3_client, WASABI_BUCKET, rollups=PurchaseOrderRollups(s3_client, WASABI_BUCKET))
+
+
 @require_http_methods(["POST"])
 def import_csv_to_parquet(request):
     """
@@ -64,15 +71,17 @@ def import_csv_to_parquet(request):
     POST params:
         - file: CSV file upload
         - skip_rows: Number of rows to skip before headers (default: 0)
-        - mode: 'replace' or 'append' (default: 'append')
+        - mode: 'replace' (the company's existing purchase orders) or
+          'append' (default: 'append')
         - batch_name: Optional name for this import (default: filename)
 
     Returns:
         - success: bool
         - import_id: Unique import ID
         - records_imported: Number of records
-        - file_size_mb: Parquet file size
-        - s3_path: S3 location
+        - partitions_written: Company/month partitions that received a fragment
+        - file_size_mb: Size of the new fragments
+        - s3_path: S3 location of the dataset
     """
     try:
         # Check authentication
@@ -105,10 +114,13 @@ def import_csv_to_parquet(request):
 
         # Step 1: Read CSV into DataFrame
         try:
+            # Text columns stay text (branch '0100', not 100.0); numeric and
+            # date columns are converted explicitly below
             df = pd.read_csv(
                 io.BytesIO(uploaded_file.read()),
                 skiprows=skip_rows,
-                encoding='utf-8'
+                encoding='utf-8',
+                dtype=str
             )
         except Exception as e:
             return JsonResponse({'success': False, 'error': f'CSV parsing error: {str(e)}'}, status=400)
@@ -174,74 +186,49 @@ def import_csv_to_parquet(request):
         record_count = len(df)
         logger.info(f"Processed {record_count} valid records from CSV")
 
-        # Step 4: Handle append mode - merge with existing Parquet
-        s3_client = get_s3_client()
-
-        if mode == 'append':
-            # Try to read existing Parquet file
-            try:
-                response = s3_client.get_object(Bucket=WASABI_BUCKET, Key=PARQUET_PATH)
-                existing_df = pd.read_parquet(io.BytesIO(response['Body'].read()))
-
-                logger.info(f"Found existing Parquet with {len(existing_df)} records")
-
-                # Append new data
-                df = pd.concat([existing_df, df], ignore_index=True)
-
-                logger.info(f"Combined: {len(df)} total records")
-
-            except s3_client.exceptions.NoSuchKey:
-                logger.info("No existing Parquet file found, creating new one")
-            except Exception as e:
-                logger.warning(f"Could not read existing Parquet: {e}, creating new file")
-
-        # Step 5: Write to Parquet
-        logger.info("Converting to Parquet with Snappy compression...")
-
-        # Create temporary file
-        temp_file = f'/tmp/po_import_{import_id}.parquet'
-
-        table = pa.Table.from_pandas(df)
-        pq.write_table(
-            table,
-            temp_file,
-            compression='snappy',
-            row_group_size=100000
+        # Step 4: Write one new fragment per partition these rows fall into
+        # and commit them in a manifest. Nothing existing is read, so the
+        # cost depends only on this CSV, and concurrent imports both land.
+        dataset = get_dataset()
+        ignored_columns = [col for col in df.columns if col not in PO_SCHEMA.names and col != 'company_code']
+
+        result = dataset.write(
+            df,
+            mode='replace' if mode == 'replace' else 'append',
+            batch_id=import_id,
+            imported_by=user_email,
+            batch_name=batch_name
         )
+        file_size_mb = result['bytes_written'] / (1024 * 1024)
+        s3_path = dataset.uri
 
-        file_size_mb = os.path.getsize(temp_file) / (1024 * 1024)
-
-        logger.info(f"Parquet file created: {file_size_mb:.2f} MB")
-
-        # Step 6: Upload to Wasabi
-        logger.info(f"Uploading to s3://{WASABI_BUCKET}/{PARQUET_PATH}")
-
-        s3_client.upload_file(
-            temp_file,
-            WASABI_BUCKET,
-            PARQUET_PATH,
-            ExtraArgs={'ContentType': 'application/octet-stream'}
+        logger.info(
+            f"Import complete: {result['fragments_written']} fragments written, "
+            f"{result['fragments_removed']} replaced under {s3_path}"
         )
 
-        # Clean up temp file
-        os.remove(temp_file)
-
-        s3_path = f"s3://{WASABI_BUCKET}/{PARQUET_PATH}"
-
-        logger.info(f"Upload complete: {s3_path}")
+        # Drop cached analytics results and relist the local Parquet mirror
+        # now (other workers pick up the new files on their next check)
+        from services.duckdb_client import duckdb_client
+        duckdb_client.invalidate_results(s3_path)
+        duckdb_client.invalidate_results(dataset.rollups.uri)
 
-        # Step 7: Return success response
+        # Step 5: Return success response
         return JsonResponse({
             'success': True,
             'import_id': import_id,
             'message': f'Successfully imported {record_count} records to Parquet',
             'records_imported': record_count,
-            'total_records': len(df),
+            'partitions_written': result['fragments_written'],
+            'fragments_replaced': result['fragments_removed'],
+            'manifest': result['manifest'],
+            'rollup_manifest': result['rollup_manifest'],
             'file_size_mb': round(file_size_mb, 2),
             's3_path': s3_path,
             'mode': mode,
             'batch_name': batch_name,
-            'columns': list(df.columns),
+            'columns': PO_SCHEMA.names + ['company_code'],
+            'ignored_columns': ignored_columns,
             'duckdb_endpoint': '/analytics/duckdb/summary/'
         })
 
@@ -253,33 +240,33 @@ def import_csv_to_parquet(request):
 @require_http_methods(["GET"])
 def parquet_file_info(request):
     """
-    Get information about the current Parquet file
+    Get information about the purchase orders Parquet dataset
 
     Returns:
         - exists: bool
-        - file_size_mb: float
-        - last_modified: ISO timestamp
+        - file_size_mb: float (all live fragments)
+        - fragments: Number of live fragment files
+        - last_modified: ISO timestamp of the newest partition
         - s3_path: string
     """
     try:
-        s3_client = get_s3_client()
+        dataset = get_dataset()
+        info = dataset.describe()
 
-        # Get file metadata
-        response = s3_client.head_object(Bucket=WASABI_BUCKET, Key=PARQUET_PATH)
+        if not info['files']:
+            return JsonResponse({
+                'success': True,
+                'exists': False,
+                'message': 'No Parquet file found'
+            })
 
         return JsonResponse({
             'success': True,
             'exists': True,
-            'file_size_mb': round(response['ContentLength'] / (1024 * 1024), 2),
-            'last_modified': response['LastModified'].isoformat(),
-            's3_path': f"s3://{WASABI_BUCKET}/{PARQUET_PATH}"
-        })
-
-    except s3_client.exceptions.NoSuchKey:
-        return JsonResponse({
-            'success': True,
-            'exists': False,
-            'message': 'No Parquet file found'
+            'file_size_mb': round(info['bytes'] / (1024 * 1024), 2),
+            'fragments': info['files'],
+            'last_modified': info['last_modified'].isoformat() if info['last_modified'] else None,
+            's3_path': dataset.uri
         })
 
     except Exception as e:
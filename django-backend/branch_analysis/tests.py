@@ -1,3 +1,99 @@
-from django.test import TestCase
+"""
+Branch transfer analysis API tests
 
-# Create your tests here.
+The ERP HTTP layer is mocked, so these run without network access:
+    python manage.py test branch_analysis
+"""
+
+import json
+from unittest.mock import patch, MagicMock
+
+from django.test import TestCase, Client
+
+from services.erp_client import erp_client
+
+
+def erp_response(payload):
+    """Build a fake requests.Response for a successful ERP call"""
+    response = MagicMock()
+    response.status_code = 200
+    response.content = json.dumps(payload).encode()
+    response.json.return_value = payload
+    response.raise_for_status.return_value = None
+    return response
+
+
+class CustomerLookupCacheTestCase(TestCase):
+    """Repeated /Customers/{id} lookups are served from the ERP response cache"""
+
+    def setUp(self):
+        self.client = Client()
+        session = self.client.session
+        session['customer_logged_in'] = True
+        session['customer_user_id'] = 'test-user-123'
+        session['customer_company_api_base'] = 'https://erp.example.com'
+        session['customer_last_port'] = 5000
+        session.save()
+
+        erp_client.response_cache.invalidate()
+
+    def tearDown(self):
+        erp_client.response_cache.invalidate()
+
+    def test_customer_fetched_once_then_invalidated_by_update(self):
+        session = MagicMock()
+        session.request.side_effect = lambda **kwargs: erp_response({'id': 'C1', 'name': 'ACME'})
+
+        with patch.object(erp_client, 'get_erp_token', return_value='token'), \
+                patch.object(erp_client, '_get_session', return_value=session):
+            first = self.client.get('/branch/api/customers/C1/')
+            second = self.client.get('/branch/api/customers/C1/')
+
+            self.assertEqual(first.status_code, 200)
+            self.assertEqual(json.loads(second.content), {'id': 'C1', 'name': 'ACME'})
+            self.assertEqual(session.request.call_count, 1)
+
+            erp_client.update_entity('test-user-123', 'https://erp.example.com', '/Customers/C1', {'name': 'ACME'}, port=5000)
+            self.client.get('/branch/api/customers/C1/')
+
+        # GET, PUT, then a fresh GET after invalidation
+        self.assertEqual(session.request.call_count, 3)
+
+
+class ERPCircuitBreakerTestCase(TestCase):
+    """A failing ERP host opens its circuit and later calls fail fast"""
+
+    def setUp(self):
+        self.client = Client()
+        session = self.client.session
+        session['customer_logged_in'] = True
+        session['customer_user_id'] = 'test-user-123'
+        session['customer_company_api_base'] = 'https://down.example.com'
+        session['customer_last_port'] = 5000
+        session.save()
+
+        erp_client._circuit_breakers.clear()
+        erp_client.response_cache.invalidate()
+
+    def tearDown(self):
+        erp_client._circuit_breakers.clear()
+
+    def test_open_circuit_rejects_without_network_call(self):
+        import requests
+
+        session = MagicMock()
+        session.request.side_effect = requests.exceptions.ConnectionError('connection refused')
+
+        with patch.object(erp_client, 'get_erp_token', return_value='token'), \
+                patch.object(erp_client, '_get_session', return_value=session), \
+                patch.object(erp_client, 'circuit_failure_threshold', 2), \
+                patch('services.erp_client.time.sleep'):
+            first = self.client.get('/branch/api/branches/100/')
+            calls_after_first = session.request.call_count
+            second = self.client.get('/branch/api/branches/100/')
+
+        self.assertEqual(first.status_code, 500)
+        self.assertEqual(calls_after_first, 2)
+        self.assertEqual(second.status_code, 500)
+        self.assertIn('circuit open', json.loads(second.content)['error'])
+        self.assertEqual(session.request.call_count, calls_after_first)
@@ -0,0 +1,546 @@
+"""
+Shared service tests (ERP client plumbing)
+
+No network access is needed; ERP responses are built in-process and Redis
+is replaced by fakeredis (installed from requirements-dev.txt):
+    pip install -r requirements-dev.txt
+    python manage.py test core
+"""
+
+import json
+import logging
+import os
+import time
+from unittest.mock import MagicMock, patch
+
+import fakeredis
+import redis
+import requests
+from django.test import SimpleTestCase, TestCase, Client
+
+from services.erp_client import ERPClient, ERPClientError, ERPDeadlineExceeded, ERPTokenCache
+from services.erp_metrics import ERPMetrics, endpoint_template
+from services.erp_resilience import CircuitBreaker, RetryBudget, parse_retry_after
+from services.erp_tracing import ERPRequestTracer, REDACTED, redact
+from services.token_store import NativeRedisTokenStore, TokenStore
+
+
+def make_response(status_code=200, body=b'', headers=None):
+    """Build a requests.Response without going over the wire"""
+    response = requests.Response()
+    response.status_code = status_code
+    response._content = body
+    response.headers.update(headers or {})
+    response.encoding = 'utf-8'
+    return response
+
+
+class ERPTraceRedactionTestCase(SimpleTestCase):
+    """Sensitive headers and body fields never reach the trace log"""
+
+    def setUp(self):
+        self.tracer = ERPRequestTracer(level='body', sample_rate=1.0)
+
+    def test_redact_matches_name_fragments(self):
+        redacted = redact({
+            'erpToken': 'abc',
+            'x-api-key': 'k',
+            'user_password': 'p',
+            'Authorization': 'Bearer x',
+            'clientSecret': 's',
+            'orders': [{'refresh_token': 'r', 'orderNumber': 'S100'}],
+            'userName': 'jdoe',
+        })
+        self.assertEqual(redacted['erpToken'], REDACTED)
+        self.assertEqual(redacted['x-api-key'], REDACTED)
+        self.assertEqual(redacted['user_password'], REDACTED)
+        self.assertEqual(redacted['Authorization'], REDACTED)
+        self.assertEqual(redacted['clientSecret'], REDACTED)
+        self.assertEqual(redacted['orders'], [{'refresh_token': REDACTED, 'orderNumber': 'S100'}])
+        self.assertEqual(redacted['userName'], 'jdoe')
+
+    def test_request_headers_and_body_redacted(self):
+        with self.assertLogs('services.erp_client.trace', level=logging.INFO) as logs:
+            self.tracer.trace_request(
+                'POST', 'https://erp.example/Login',
+                headers={'x-api-key': 'key-123', 'Content-Type': 'application/json'},
+                data={'userName': 'jdoe', 'user_password': 'hunter2'}
+            )
+        output = '\n'.join(logs.output)
+        self.assertNotIn('key-123', output)
+        self.assertNotIn('hunter2', output)
+        self.assertIn('application/json', output)
+        self.assertIn('jdoe', output)
+
+    def test_response_headers_and_json_body_redacted(self):
+        body = json.dumps({'erpToken': 'tok-secret-1', 'sessionToken': 'tok-2', 'expiresIn': 3600}).encode()
+        response = make_response(body=body, headers={'Set-Cookie': 'sid=cookie-1', 'X-Request-Id': 'req-9'})
+        with self.assertLogs('services.erp_client.trace', level=logging.INFO) as logs:
+            self.tracer.trace_response('POST', 'https://erp.example/Login', response, 12.0)
+        output = '\n'.join(logs.output)
+        self.assertNotIn('tok-secret-1', output)
+        self.assertNotIn('tok-2', output)
+        self.assertNotIn('cookie-1', output)
+        self.assertIn('req-9', output)
+        self.assertIn('3600', output)
+
+    def test_non_json_response_body_not_logged(self):
+        response = make_response(body=b'token=raw-token-value&expires=3600')
+        with self.assertLogs('services.erp_client.trace', level=logging.INFO) as logs:
+            self.tracer.trace_response('POST', 'https://erp.example/Login', response, 5.0)
+        output = '\n'.join(logs.output)
+        self.assertNotIn('raw-token-value', output)
+        self.assertIn('non-JSON body omitted', output)
+
+
+class DictTokenStore(TokenStore):
+    """In-memory fallback store recording which keys it served"""
+
+    name = 'dict'
+
+    def __init__(self):
+        self.values = {}
+
+    @property
+    def configured(self) -> bool:
+        return True
+
+    def get(self, key):
+        return self.values.get(key)
+
+    def set(self, key, value, ttl=3600):
+        self.values[key] = value
+        return True
+
+    def delete(self, key):
+        self.values.pop(key, None)
+        return True
+
+
+class NativeRedisTokenStoreTestCase(SimpleTestCase):
+    """NativeRedisTokenStore against fakeredis, falling back on any Redis error"""
+
+    def setUp(self):
+        self.server = fakeredis.FakeServer()
+        self.fallback = DictTokenStore()
+        # from_url only builds the pool; no connection is made until a command runs
+        self.store = NativeRedisTokenStore('redis://localhost:6379/0', fallback=self.fallback)
+        self.store.client = fakeredis.FakeRedis(server=self.server, decode_responses=True)
+
+    def test_set_get_delete(self):
+        self.assertTrue(self.store.set('erpToken:u1', 'tok-1', ttl=60))
+        self.assertEqual(self.store.get('erpToken:u1'), 'tok-1')
+        self.assertLessEqual(self.store.client.ttl('erpToken:u1'), 60)
+        self.assertTrue(self.store.delete('erpToken:u1'))
+        self.assertIsNone(self.store.get('erpToken:u1'))
+        self.assertEqual(self.fallback.values, {})
+
+    def test_connection_error_falls_back(self):
+        self.fallback.values['erpToken:u1'] = 'from-upstash'
+        self.server.connected = False
+        self.assertEqual(self.store.get('erpToken:u1'), 'from-upstash')
+        self.assertTrue(self.store.set('erpToken:u2', 'tok-2'))
+        self.assertEqual(self.fallback.values['erpToken:u2'], 'tok-2')
+
+    def test_server_error_replies_fall_back(self):
+        self.store.client = MagicMock()
+        self.store.client.get.side_effect = redis.ResponseError('NOAUTH Authentication required.')
+        self.store.client.setex.side_effect = redis.ResponseError('OOM command not allowed')
+        self.store.client.delete.side_effect = redis.ReadOnlyError('READONLY You can\'t write against a read only replica.')
+        self.fallback.values['erpToken:u1'] = 'from-upstash'
+
+        self.assertEqual(self.store.get('erpToken:u1'), 'from-upstash')
+        self.assertTrue(self.store.set('erpToken:u2', 'tok-2'))
+        self.assertTrue(self.store.delete('erpToken:u1'))
+        self.assertEqual(self.fallback.values, {'erpToken:u2': 'tok-2'})
+
+    def test_get_many_uses_one_mget(self):
+        self.store.client.set('erpToken:u1', 'tok-1')
+        self.store.client.set('erpToken:u2', 'tok-2')
+        self.store.client = MagicMock(wraps=self.store.client)
+
+        tokens = self.store.get_many(['erpToken:u1', 'erpToken:u2', 'erpToken:u3'])
+
+        self.assertEqual(tokens, {'erpToken:u1': 'tok-1', 'erpToken:u2': 'tok-2', 'erpToken:u3': None})
+        self.store.client.mget.assert_called_once_with(['erpToken:u1', 'erpToken:u2', 'erpToken:u3'])
+        self.store.client.get.assert_not_called()
+
+    def test_set_many_pipelines_setex(self):
+        self.assertTrue(self.store.set_many({'erpToken:u1': 'tok-1', 'erpToken:u2': 'tok-2'}, ttl=60))
+        self.assertEqual(self.store.client.mget(['erpToken:u1', 'erpToken:u2']), ['tok-1', 'tok-2'])
+        self.assertTrue(0 < self.store.client.ttl('erpToken:u2') <= 60)
+        self.assertTrue(self.store.set_many({}))
+
+    def test_client_token_load_and_save_use_multi_key_ops(self):
+        erp = ERPClient()
+        erp.token_store = self.store
+        self.store.client = MagicMock(wraps=self.store.client)
+
+        self.assertTrue(erp._redis_set('erpToken:u1', 'tok-1', 7200))
+        erp.invalidate_erp_token('u1')
+        self.assertEqual(erp.get_erp_token('u1'), 'tok-1')
+
+        self.store.client.pipeline.assert_called_once_with(transaction=False)
+        self.store.client.mget.assert_called_once_with(['erpToken:u1'])
+        self.store.client.setex.assert_not_called()
+        self.store.client.get.assert_not_called()
+
+    def test_multi_key_errors_fall_back(self):
+        self.fallback.values['erpToken:u1'] = 'from-upstash'
+        self.server.connected = False
+
+        self.assertEqual(self.store.get_many(['erpToken:u1', 'erpToken:u2']), {'erpToken:u1': 'from-upstash', 'erpToken:u2': None})
+        self.assertTrue(self.store.set_many({'erpToken:u2': 'tok-2', 'erpToken:u3': 'tok-3'}))
+        self.assertEqual(self.fallback.values['erpToken:u3'], 'tok-3')
+
+    def test_error_without_fallback_returns_miss(self):
+        store = NativeRedisTokenStore('redis://localhost:6379/0')
+        store.client = fakeredis.FakeRedis(server=self.server, decode_responses=True)
+        self.server.connected = False
+        self.assertIsNone(store.get('erpToken:u1'))
+        self.assertFalse(store.set('erpToken:u1', 'tok-1'))
+        self.assertEqual(store.get_many(['erpToken:u1']), {'erpToken:u1': None})
+        self.assertFalse(store.set_many({'erpToken:u1': 'tok-1'}))
+
+
+class ERPMetricsTestCase(SimpleTestCase):
+    """Endpoint templating and the ERPMetrics registry"""
+
+    def test_endpoint_template_labels(self):
+        self.assertEqual(endpoint_template('/SalesOrders/S105418530'), '/SalesOrders/{id}')
+        self.assertEqual(endpoint_template('/SalesOrders/S1/PrintInvoice'), '/SalesOrders/{id}/PrintInvoice')
+        self.assertEqual(endpoint_template('/Users/jsmith'), '/Users/{id}')
+        self.assertEqual(endpoint_template('/UserDefined/PRINT.REVIEW?id=S1.0001'), '/UserDefined/PRINT.REVIEW?id')
+        self.assertEqual(endpoint_template('/Vendors?limit=5&active=true'), '/Vendors?active&limit')
+        self.assertEqual(endpoint_template('/Vendors'), '/Vendors')
+
+    def test_observations_grouped_by_template(self):
+        metrics = ERPMetrics()
+        metrics.observe('get', '/SalesOrders/S1', 0.1, bytes_received=100)
+        metrics.observe('GET', '/SalesOrders/S2', 0.3, bytes_received=50)
+        metrics.record_retry('GET', '/SalesOrders/S3')
+        metrics.record_error('GET', '/SalesOrders/S3', 'timeout')
+
+        [endpoint] = metrics.snapshot()['endpoints']
+        self.assertEqual((endpoint['method'], endpoint['endpoint']), ('GET', '/SalesOrders/{id}'))
+        self.assertEqual(endpoint['count'], 2)
+        self.assertEqual(endpoint['total_ms'], 400.0)
+        self.assertEqual(endpoint['p99_ms'], 300.0)
+        self.assertEqual(endpoint['retries'], 1)
+        self.assertEqual(endpoint['errors'], {'timeout': 1})
+        self.assertEqual(endpoint['bytes_received'], 150)
+
+    def test_snapshot_sorted_by_total_latency(self):
+        metrics = ERPMetrics()
+        metrics.observe('GET', '/Vendors', 0.05)
+        metrics.observe('GET', '/SalesOrders/S1', 2.0)
+        endpoints = [e['endpoint'] for e in metrics.snapshot()['endpoints']]
+        self.assertEqual(endpoints, ['/SalesOrders/{id}', '/Vendors'])
+
+    def test_prometheus_histogram_is_cumulative(self):
+        metrics = ERPMetrics()
+        metrics.observe('GET', '/SalesOrders/S1', 0.004)
+        metrics.observe('GET', '/SalesOrders/S2', 0.2)
+        metrics.observe('GET', '/SalesOrders/S3', 60)
+        metrics.record_error('GET', '/SalesOrders/S3', 'http_500')
+        lines = metrics.prometheus_lines()
+
+        labels = 'method="GET",endpoint="/SalesOrders/{id}"'
+        self.assertIn(f'erp_request_duration_seconds_bucket{{{labels},le="0.005"}} 1', lines)
+        self.assertIn(f'erp_request_duration_seconds_bucket{{{labels},le="0.25"}} 2', lines)
+        self.assertIn(f'erp_request_duration_seconds_bucket{{{labels},le="30"}} 2', lines)
+        self.assertIn(f'erp_request_duration_seconds_bucket{{{labels},le="+Inf"}} 3', lines)
+        self.assertIn(f'erp_request_duration_seconds_count{{{labels}}} 3', lines)
+        self.assertIn(f'erp_request_errors_total{{{labels},error_class="http_500"}} 1', lines)
+
+
+class MetricsEndpointTestCase(TestCase):
+    """/metrics access control"""
+
+    def setUp(self):
+        self.client = Client()
+
+    @patch.dict(os.environ, {'METRICS_TOKEN': 'scrape-token'})
+    def test_bearer_token(self):
+        response = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer scrape-token')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'erp_request_duration_seconds', response.content)
+
+        response = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer wrong-token')
+        self.assertEqual(response.status_code, 401)
+
+    @patch.dict(os.environ, {'METRICS_TOKEN': ''})
+    def test_empty_token_never_matches(self):
+        response = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer ')
+        self.assertEqual(response.status_code, 401)
+
+    def test_admin_session(self):
+        session = self.client.session
+        session['admin_logged_in'] = True
+        session.save()
+        self.assertEqual(self.client.get('/metrics').status_code, 200)
+
+    def test_get_only(self):
+        self.assertEqual(self.client.post('/metrics').status_code, 405)
+
+
+class CircuitBreakerProbeTestCase(SimpleTestCase):
+    """Half-open probes are released however they end"""
+
+    def setUp(self):
+        self.breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30)
+        self.breaker.record_failure()
+        self.breaker._opened_at -= 30
+
+    def test_single_probe_while_half_open(self):
+        self.assertTrue(self.breaker.allow_request())
+        self.assertFalse(self.breaker.allow_request())
+
+    def test_probe_without_verdict_is_released(self):
+        self.assertTrue(self.breaker.allow_request())
+        self.breaker.end_probe()
+        self.assertEqual(self.breaker.state, CircuitBreaker.HALF_OPEN)
+        self.assertTrue(self.breaker.allow_request())
+
+    def test_end_probe_ignores_other_threads(self):
+        import threading
+
+        self.assertTrue(self.breaker.allow_request())
+        other = threading.Thread(target=self.breaker.end_probe)
+        other.start()
+        other.join()
+        self.assertFalse(self.breaker.allow_request())
+
+
+class RetryBudgetTestCase(SimpleTestCase):
+    """Retry token bucket and Retry-After parsing"""
+
+    def test_budget_runs_out_and_refills_with_requests(self):
+        budget = RetryBudget(ratio=0.5, min_per_second=0, max_balance=1)
+        self.assertTrue(budget.try_spend())
+        self.assertFalse(budget.try_spend())
+
+        budget.record_request()
+        budget.record_request()
+        self.assertTrue(budget.try_spend())
+        self.assertEqual(budget.get_stats()['granted'], 2)
+        self.assertEqual(budget.get_stats()['denied'], 1)
+
+    def test_parse_retry_after(self):
+        self.assertEqual(parse_retry_after('3'), 3.0)
+        self.assertEqual(parse_retry_after('-5'), 0.0)
+        self.assertEqual(parse_retry_after('Wed, 21 Oct 2015 07:28:00 GMT'), 0.0)
+        self.assertIsNone(parse_retry_after('soon'))
+        self.assertIsNone(parse_retry_after(None))
+
+
+class ERPClientTestCase(SimpleTestCase):
+    """ERPClient against an in-memory token store and a mocked host session"""
+
+    base = 'https://erp.example'
+
+    def setUp(self):
+        self.erp = ERPClient()
+        self.erp.token_store = DictTokenStore()
+        self.erp.token_store.values['erpToken:u1'] = 'session-token'
+        self.session = MagicMock()
+        self.erp._sessions[(self.base, 5000)] = self.session
+
+    def test_write_with_empty_body_invalidates_cache(self):
+        key = self.erp.response_cache.key_for('GET', self.base, 5000, '/Customers/C1')
+        self.erp.response_cache.set(key, {'id': 'C1', 'name': 'Old name'})
+        self.session.request.return_value = make_response(status_code=204)
+
+        result = self.erp.make_erp_request('u1', self.base, 'PUT', '/Customers/C1', data={'name': 'New name'})
+
+        self.assertEqual(result, {})
+        self.assertIsNone(self.erp.response_cache.get(key))
+
+    def test_get_caches_entity_lookup(self):
+        self.session.request.return_value = make_response(body=b'{"id": "C1"}')
+
+        first = self.erp.make_erp_request('u1', self.base, 'GET', '/Customers/C1')
+        second = self.erp.make_erp_request('u1', self.base, 'GET', '/Customers/C1')
+
+        self.assertEqual(first, second)
+        self.assertEqual(self.session.request.call_count, 1)
+
+    def test_429_honors_retry_after(self):
+        self.session.request.side_effect = [
+            make_response(status_code=429, headers={'Retry-After': '3'}),
+            make_response(body=b'[{"id": "V1"}]'),
+        ]
+
+        with patch('services.erp_client.time.sleep') as sleep:
+            result = self.erp.make_erp_request('u1', self.base, 'GET', '/Vendors')
+
+        self.assertEqual(result, [{'id': 'V1'}])
+        sleep.assert_called_once_with(3.0)
+        self.assertEqual(self.session.request.call_count, 2)
+
+    def test_exhausted_retry_budget_fails_without_retrying(self):
+        self.erp.retry_budget = RetryBudget(ratio=0, min_per_second=0, max_balance=0)
+        self.session.request.return_value = make_response(status_code=503)
+
+        with patch('services.erp_client.time.sleep') as sleep:
+            with self.assertRaises(ERPClientError):
+                self.erp.make_erp_request('u1', self.base, 'GET', '/Vendors')
+
+        self.assertEqual(self.session.request.call_count, 1)
+        sleep.assert_not_called()
+        self.assertEqual(self.erp.retry_budget.get_stats()['denied'], 1)
+
+    def test_probe_cut_short_by_budget_is_released(self):
+        breaker = self.erp._get_circuit_breaker(self.base, 5000)
+        for _ in range(self.erp.circuit_failure_threshold):
+            breaker.record_failure()
+        breaker._opened_at -= breaker.reset_timeout
+
+        with self.erp.request_budget(10) as budget:
+            def time_out(**kwargs):
+                budget.deadline = time.monotonic() - 1
+                raise requests.exceptions.Timeout()
+
+            self.session.request.side_effect = time_out
+            with self.assertRaises(ERPDeadlineExceeded):
+                self.erp.make_erp_request('u1', self.base, 'GET', '/Vendors')
+
+        self.assertEqual(breaker.state, CircuitBreaker.HALF_OPEN)
+        self.assertTrue(breaker.allow_request())
+
+
+class ERPSessionPoolTestCase(SimpleTestCase):
+    """One pooled keep-alive session per ERP host"""
+
+    def setUp(self):
+        self.erp = ERPClient()
+        self.erp.token_store = DictTokenStore()
+        self.erp.token_store.values['erpToken:u1'] = 'session-token'
+
+    def tearDown(self):
+        self.erp.close_sessions()
+
+    def test_session_reused_per_host_and_port(self):
+        first = self.erp._get_session('https://erp-a.example', 5000)
+        self.assertIs(self.erp._get_session('https://erp-a.example', '5000'), first)
+        self.assertIsNot(self.erp._get_session('https://erp-a.example', 5001), first)
+        self.assertIsNot(self.erp._get_session('https://erp-b.example', 5000), first)
+
+        stats = self.erp.get_pool_stats()
+        self.assertEqual((stats['session_hits'], stats['session_misses']), (1, 3))
+        self.assertEqual(len(stats['hosts']), 3)
+
+    def test_session_adapter_uses_pool_settings(self):
+        adapter = self.erp._get_session('https://erp-a.example', 5000).get_adapter('https://erp-a.example')
+        self.assertEqual(adapter._pool_maxsize, self.erp.pool_maxsize)
+        self.assertEqual(adapter._pool_block, self.erp.pool_block)
+
+    def test_requests_share_the_host_session(self):
+        with patch('requests.Session.request', autospec=True) as request:
+            request.return_value = make_response(body=b'[]')
+            self.erp.make_erp_request('u1', 'https://erp-a.example', 'GET', '/Vendors')
+            self.erp.make_erp_request('u1', 'https://erp-a.example', 'GET', '/Branches', port=5000)
+            self.erp.make_erp_request('u1', 'https://erp-b.example', 'GET', '/Vendors')
+
+        sessions = [call.args[0] for call in request.call_args_list]
+        self.assertIs(sessions[0], sessions[1])
+        self.assertIsNot(sessions[0], sessions[2])
+
+    def test_close_sessions_drops_pool(self):
+        first = self.erp._get_session('https://erp-a.example', 5000)
+        self.erp.close_sessions()
+        self.assertIsNot(self.erp._get_session('https://erp-a.example', 5000), first)
+
+
+class ERPTokenCacheTestCase(SimpleTestCase):
+    """In-process token cache in front of the token store"""
+
+    def setUp(self):
+        self.store = DictTokenStore()
+        self.store.values['erpToken:u1'] = 'tok-1'
+        self.loads = []
+        self.now = 1000.0
+        self.cache = ERPTokenCache(loader=self._load, ttl=30, refresh_ahead=0)
+        clock = patch('services.erp_client.time.monotonic', side_effect=lambda: self.now)
+        clock.start()
+        self.addCleanup(clock.stop)
+
+    def _load(self, keys):
+        self.loads.append(keys)
+        return self.store.get_many(keys)
+
+    def test_hit_skips_loader(self):
+        self.assertEqual(self.cache.get('erpToken:u1'), 'tok-1')
+        self.store.values['erpToken:u1'] = 'tok-2'
+        self.assertEqual(self.cache.get('erpToken:u1'), 'tok-1')
+        self.assertEqual(self.loads, [['erpToken:u1']])
+
+        stats = self.cache.get_stats()
+        self.assertEqual((stats['local_hits'], stats['local_misses']), (1, 1))
+        self.assertEqual(stats['redis_calls_avoided'], 1)
+
+    def test_ttl_expiry_reloads(self):
+        self.cache.get('erpToken:u1')
+        self.store.values['erpToken:u1'] = 'tok-2'
+
+        self.now += 29
+        self.assertEqual(self.cache.get('erpToken:u1'), 'tok-1')
+        self.now += 1
+        self.assertEqual(self.cache.get('erpToken:u1'), 'tok-2')
+        self.assertEqual(len(self.loads), 2)
+
+    def test_invalidate_reloads(self):
+        self.cache.get('erpToken:u1')
+        self.store.values['erpToken:u1'] = 'tok-2'
+        self.cache.invalidate('erpToken:u1')
+
+        self.assertEqual(self.cache.get('erpToken:u1'), 'tok-2')
+        self.assertEqual(self.cache.get_stats()['invalidations'], 1)
+
+    def test_missing_token_not_cached(self):
+        self.assertIsNone(self.cache.get('erpToken:u2'))
+        self.store.values['erpToken:u2'] = 'tok-3'
+        self.assertEqual(self.cache.get('erpToken:u2'), 'tok-3')
+
+    def test_get_many_loads_misses_in_one_call(self):
+        self.store.values['erpToken:u2'] = 'tok-2'
+        self.cache.get('erpToken:u1')
+
+        tokens = self.cache.get_many(['erpToken:u1', 'erpToken:u2', 'erpToken:u3'])
+
+        self.assertEqual(tokens, {'erpToken:u1': 'tok-1', 'erpToken:u2': 'tok-2', 'erpToken:u3': None})
+        self.assertEqual(self.loads, [['erpToken:u1'], ['erpToken:u2', 'erpToken:u3']])
+
+    def test_refresh_ahead_reloads_in_background(self):
+        cache = ERPTokenCache(loader=self._load, ttl=30, refresh_ahead=5)
+        cache.get('erpToken:u1')
+        self.store.values['erpToken:u1'] = 'tok-2'
+        self.now += 26
+
+        with patch('services.erp_client.threading.Thread') as thread:
+            self.assertEqual(cache.get('erpToken:u1'), 'tok-1')
+        cache._refresh(*thread.call_args.kwargs['args'])
+
+        self.assertEqual(cache.get('erpToken:u1'), 'tok-2')
+        self.assertEqual(cache.get_stats()['background_refreshes'], 1)
+
+    def test_disabled_always_loads(self):
+        cache = ERPTokenCache(loader=self._load, ttl=30, enabled=False)
+        cache.get('erpToken:u1')
+        cache.get('erpToken:u1')
+        self.assertEqual(len(self.loads), 2)
+
+    def test_client_keeps_cache_in_sync_with_store(self):
+        erp = ERPClient()
+        erp.token_store = self.store
+
+        self.assertEqual(erp.get_erp_token('u1'), 'tok-1')
+        erp._redis_set('erpToken:u1', 'tok-2')
+        self.store.values['erpToken:u1'] = 'tok-3'
+        self.assertEqual(erp.get_erp_token('u1'), 'tok-2')
+
+        erp.invalidate_erp_token('u1')
+        self.assertEqual(erp.get_erp_token('u1'), 'tok-3')
+
+        erp._redis_delete('erpToken:u1')
+        self.assertIsNone(erp.get_erp_token('u1'))
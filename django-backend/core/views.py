@@ -1,9 +1,12 @@
 """
 Core views for common functionality across the application
 """
-from django.http import JsonResponse
+from django.http import JsonResponse, HttpResponse
 from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_http_methods
 from services.mongodb_service import mongodb_service
+from decouple import config
+import hmac
 import json
 import logging
 
@@ -132,3 +135,40 @@ def session_debug(request):
             'error': 'Failed to fetch session information',
             'details': str(e)
         }, status=500)
+
+
+@require_http_methods(["GET"])
+def metrics(request):
+    """
+    Prometheus scrape endpoint for ERP client metrics (this worker only)
+
+    Allowed for logged-in admins, or with `Authorization: Bearer <METRICS_TOKEN>`
+    when METRICS_TOKEN is configured.
+    """
+    metrics_token = config('METRICS_TOKEN', default='')
+    bearer_ok = bool(metrics_token) and hmac.compare_digest(
+        request.headers.get('Authorization', '').encode(), f'Bearer {metrics_token}'.encode()
+    )
+
+    if not bearer_ok and not request.session.get('admin_logged_in'):
+        return JsonResponse({'error': 'Not authenticated'}, status=401)
+
+    from services.erp_client import erp_client
+
+    lines = erp_client.metrics.prometheus_lines()
+
+    cache_stats = erp_client.response_cache.get_stats()
+    lines += ['# HELP erp_cache_lookups_total ERP response cache lookups', '# TYPE erp_cache_lookups_total counter']
+    for family, stats in cache_stats['families'].items():
+        lines.append(f'erp_cache_lookups_total{{family="{family}",result="hit"}} {stats["hits"]}')
+        lines.append(f'erp_cache_lookups_total{{family="{family}",result="miss"}} {stats["misses"]}')
+
+    token_stats = erp_client.token_cache.get_stats()
+    lines += ['# HELP erp_token_redis_calls_avoided_total Token lookups served without Redis', '# TYPE erp_token_redis_calls_avoided_total counter']
+    lines.append(f'erp_token_redis_calls_avoided_total {token_stats["redis_calls_avoided"]}')
+
+    pool_stats = erp_client.get_pool_stats()
+    lines += ['# HELP erp_connections_reused_total ERP requests served on a kept-alive connection', '# TYPE erp_connections_reused_total counter']
+    lines.append(f'erp_connections_reused_total {pool_stats["connections_reused"]}')
+
+    return HttpResponse('\n'.join(lines) + '\n', content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -44,4 +44,5 @@ urlpatterns = [
     path('branch/', include('branch_analysis.urls')),  # Branch Transfer Analysis
     path('api/switch-port/', core_views.switch_port, name='switch_port'),  # Port selector API
     path('api/session-debug/', core_views.session_debug, name='session_debug'),  # Session debugging
+    path('metrics', core_views.metrics, name='metrics'),  # Prometheus ERP metrics
 ]
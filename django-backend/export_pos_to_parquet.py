@@ -2,15 +2,16 @@
 Export Purchase Orders from MongoDB to Parquet
 
 This script exports your 111K PO records from MongoDB to a compressed Parquet file
-and uploads it to Wasabi S3 for DuckDB querying.
+and publishes them to the partitioned purchase orders dataset on Wasabi S3
+(analytics/purchase_orders/company_code=/year=/month=, with manifest and
+rollups) that the DuckDB analytics views read. Companies in the export are
+replaced.
 """
 
 import os
 import sys
 import django
 import pandas as pd
-import pyarrow as pa
-import pyarrow.parquet as pq
 from datetime import datetime
 import time
 
@@ -22,6 +23,11 @@ from pymongo import MongoClient
 from decouple import config
 import boto3
 
+from services.parquet_writer import PO_DICTIONARY_COLUMNS, write_parquet
+from services.duckdb_query import read_parquet_sql
+from services.po_dataset import PO_PARTITIONING
+from scripts.partition_purchase_orders import write_purchase_orders
+
 print("=" * 70)
 print("MongoDB to Parquet Export - Purchase Orders")
 print("=" * 70)
@@ -45,7 +51,7 @@ print(f"  MongoDB Database: {DATABASE_NAME}")
 print(f"  Collection: {COLLECTION_NAME}")
 print(f"\nDestination:")
 print(f"  Local: {LOCAL_OUTPUT_DIR}/{OUTPUT_FILENAME}")
-print(f"  Wasabi: s3://{WASABI_BUCKET}/analytics/{OUTPUT_FILENAME}")
+print(f"  Wasabi: s3://{WASABI_BUCKET}/analytics/purchase_orders/ (partitioned dataset)")
 
 # Step 1: Connect to MongoDB
 print(f"\n[Step 1] Connecting to MongoDB...")
@@ -108,14 +114,9 @@ parquet_start = time.time()
 os.makedirs(LOCAL_OUTPUT_DIR, exist_ok=True)
 local_path = os.path.join(LOCAL_OUTPUT_DIR, OUTPUT_FILENAME)
 
-# Write Parquet with Snappy compression
-table = pa.Table.from_pandas(df)
-pq.write_table(
-    table,
-    local_path,
-    compression='snappy',
-    row_group_size=100000  # 100K rows per group
-)
+# Write Parquet with the shared settings (sorted by company_code/order_date,
+# dictionary-encoded low-cardinality columns, ZSTD, page indexes)
+write_parquet(df, local_path, dictionary_columns=PO_DICTIONARY_COLUMNS)
 
 parquet_time = time.time() - parquet_start
 file_size_mb = os.path.getsize(local_path) / (1024 * 1024)
@@ -126,8 +127,8 @@ print(f"  Size: {file_size_mb:.2f} MB")
 print(f"  Compression: {compression_ratio:.1f}x (was {memory_mb:.2f} MB)")
 print(f"  Write time: {parquet_time:.2f}s")
 
-# Step 5: Upload to Wasabi S3
-print(f"\n[Step 5] Uploading to Wasabi S3...")
+# Step 5: Publish to the partitioned dataset on Wasabi S3
+print(f"\n[Step 5] Writing partitioned dataset to Wasabi S3...")
 upload_start = time.time()
 
 try:
@@ -139,24 +140,21 @@ try:
         region_name=WASABI_REGION
     )
 
-    s3_key = f"analytics/{OUTPUT_FILENAME}"
-    s3_client.upload_file(
-        local_path,
-        WASABI_BUCKET,
-        s3_key,
-        ExtraArgs={'ContentType': 'application/octet-stream'}
-    )
+    result = write_purchase_orders(df, s3_client, WASABI_BUCKET)
 
     upload_time = time.time() - upload_start
-    s3_path = f"s3://{WASABI_BUCKET}/{s3_key}"
+    s3_path = result['uri']
 
     print(f"  S3 Path: {s3_path}")
+    print(f"  Partitions: {result['fragments_written']} written, {result['fragments_removed']} replaced")
     print(f"  Upload time: {upload_time:.2f}s")
-    print(f"  Upload speed: {file_size_mb / upload_time:.2f} MB/s")
+
+    from services.duckdb_client import duckdb_client
+    duckdb_client.invalidate_results(s3_path)
 
 except Exception as e:
     print(f"  ERROR: Upload failed - {e}")
-    print(f"  You can manually upload {local_path} later")
+    print(f"  Publish {local_path} later with scripts/partition_purchase_orders.py --source <key>")
     s3_path = None
 
 # Step 6: Verify with DuckDB query
@@ -178,7 +176,7 @@ try:
         from services.duckdb_client import duckdb_client
         s3_results = duckdb_client.query(f"""
             SELECT COUNT(*) as count
-            FROM '{s3_path}'
+            FROM {read_parquet_sql(duckdb_client.resolve_path(s3_path), PO_PARTITIONING)}
         """)
         print(f"  S3 query: {s3_results[0]['count']:,} records (SUCCESS!)")
 
@@ -206,17 +204,20 @@ if s3_path:
     print(f"\nExample query:")
     print(f"""
 from services.duckdb_client import duckdb_client
-
-results = duckdb_client.query('''
-    SELECT vendor, COUNT(*) as orders, SUM(amount) as total
-    FROM '{s3_path}'
-    GROUP BY vendor
+from services.duckdb_query import read_parquet_sql
+from services.po_dataset import PO_PARTITIONING
+
+source = read_parquet_sql(duckdb_client.resolve_path('{s3_path}'), PO_PARTITIONING)
+results = duckdb_client.query(f'''
+    SELECT po_payto_name, COUNT(*) as orders, SUM(order_total) as total
+    FROM {{source}}
+    GROUP BY po_payto_name
     ORDER BY total DESC
     LIMIT 10
 ''')
 
 for row in results:
-    print(f"{{row['vendor']}}: ${{row['total']:,.2f}}")
+    print(f"{{row['po_payto_name']}}: ${{row['total']:,.2f}}")
 """)
 
 print("\nNext: Create Django views to query this data blazing fast!")
@@ -0,0 +1,17 @@
+"""
+Gunicorn configuration
+
+Gunicorn loads ./gunicorn.conf.py automatically; command-line flags in
+nixpacks.toml (bind, workers, timeout) still take precedence.
+"""
+
+from decouple import config
+
+
+def post_worker_init(worker):
+    """Warm per-worker resources so the first request doesn't pay setup costs"""
+    if not config('DUCKDB_WARM_UP', default=True, cast=bool):
+        return
+
+    from services.duckdb_client import duckdb_client
+    duckdb_client.warm_up()
@@ -1,3 +1,136 @@
-from django.test import TestCase
+"""
+Warehouse dashboard API tests
 
-# Create your tests here.
+ERP and MongoDB are mocked, so these run without network access:
+    python manage.py test products
+"""
+
+import json
+import os
+from unittest.mock import patch, MagicMock
+
+from django.test import TestCase, Client
+
+from services.erp_client import ERPClient, ERPClientError
+
+
+def fake_erp_request(user_id, company_api_base, method, endpoint, port=None, **kwargs):
+    """Stand-in for ERPClient.make_erp_request with canned warehouse data"""
+    if endpoint.startswith('/SalesOrders/'):
+        order_number = endpoint.rsplit('/', 1)[1]
+        if order_number == 'S300':
+            raise ERPClientError('ERP server error (500). The ERP system may be temporarily unavailable.')
+        return {
+            'generations': [
+                {'generationId': 1, 'shipDate': '2025-01-01', 'shipToName': f'{order_number} gen 1',
+                 'poNumber': 'PO-1', 'balanceDue': {'value': 10}},
+                {'generationId': 2, 'shipDate': '2025-01-02', 'shipToName': f'{order_number} gen 2',
+                 'poNumber': 'PO-2', 'balanceDue': 20},
+            ]
+        }
+    if endpoint.startswith('/UserDefined/PRINT.REVIEW'):
+        return {'STATUS': 'PICKED'}
+    raise ERPClientError(f'unexpected endpoint {endpoint}')
+
+
+class ERPFanOutTestCase(TestCase):
+    """ERPClient.fan_out keeps input order and isolates failures"""
+
+    def test_results_in_input_order_with_failures(self):
+        client = ERPClient()
+
+        def work(n):
+            if n == 3:
+                raise ValueError('boom')
+            return n * 10
+
+        results = client.fan_out(work, range(6), max_workers=4)
+
+        self.assertEqual([r for r, _ in results], [0, 10, 20, None, 40, 50])
+        self.assertIsInstance(results[3][1], ValueError)
+        self.assertTrue(all(err is None for i, (_, err) in enumerate(results) if i != 3))
+
+
+class WarehouseOrdersAPITestCase(TestCase):
+    """warehouse_api_orders with mocked MongoDB and ERP"""
+
+    def setUp(self):
+        self.client = Client()
+        session = self.client.session
+        session['admin_logged_in'] = True
+        session['admin_user_id'] = 'test-admin-123'
+        session['admin_company_code'] = 'emp54'
+        session['admin_company_api_base'] = 'https://erp.example.com'
+        session['admin_port'] = 5000
+        session.save()
+
+        self.invoices = [
+            {'fullInvoiceID': 'S100.001', 'shipVia': 'UPS GROUND'},
+            {'fullInvoiceID': 'S100.002', 'shipVia': 'UPS GROUND'},
+            {'fullInvoiceID': 'S300.001', 'shipVia': 'UPS GROUND'},
+            {'fullInvoiceID': None, 'shipVia': 'UPS GROUND'},
+        ]
+
+    def _get_orders(self):
+        mongo_client = MagicMock()
+        mongo_client.__getitem__.return_value.__getitem__.return_value.find.return_value = self.invoices
+
+        with patch.dict(os.environ, {'MONGO_URI': 'mongodb://test'}), \
+                patch('pymongo.MongoClient', return_value=mongo_client), \
+                patch('services.erp_client.erp_client.make_erp_request', side_effect=fake_erp_request) as erp_mock:
+            response = self.client.get('/products/warehouse/api/orders/', {'branch': '100'})
+
+        return response, erp_mock
+
+    def test_orders_returned_with_per_invoice_failure_tolerance(self):
+        response, _ = self._get_orders()
+
+        self.assertEqual(response.status_code, 200)
+        orders = {o['fullInvoiceID']: o for o in json.loads(response.content)['orders']}
+
+        self.assertEqual(set(orders), {'S100.001', 'S100.002', 'S300.001'})
+        self.assertEqual(orders['S100.001']['shipToName'], 'S100 gen 1')
+        self.assertEqual(orders['S100.001']['balanceDue'], 10)
+        self.assertEqual(orders['S100.002']['balanceDue'], 20)
+        self.assertEqual(orders['S100.002']['status'], 'PICKED')
+
+        # SalesOrders failure leaves the detail fields blank but keeps the invoice
+        self.assertEqual(orders['S300.001']['shipToName'], '')
+        self.assertEqual(orders['S300.001']['status'], 'PICKED')
+
+    def test_sales_orders_fetched_once_per_order(self):
+        response, erp_mock = self._get_orders()
+
+        sales_order_calls = [
+            c.kwargs['endpoint'] for c in erp_mock.call_args_list
+            if c.kwargs['endpoint'].startswith('/SalesOrders/')
+        ]
+        self.assertEqual(sorted(sales_order_calls), ['/SalesOrders/S100', '/SalesOrders/S300'])
+
+        meta = json.loads(response.content)['meta']
+        self.assertEqual(meta['invoice_count'], 3)
+        self.assertEqual(meta['order_count'], 2)
+        self.assertEqual(meta['erp_calls'], 5)
+        self.assertEqual(meta['erp_calls_saved'], 1)
+
+    def test_exhausted_request_budget_returns_partial_results(self):
+        from services.erp_client import erp_client
+
+        mongo_client = MagicMock()
+        mongo_client.__getitem__.return_value.__getitem__.return_value.find.return_value = self.invoices
+        session = MagicMock()
+
+        # A zero budget skips every lookup, including those in fan-out threads
+        with patch.dict(os.environ, {'MONGO_URI': 'mongodb://test'}), \
+                patch('pymongo.MongoClient', return_value=mongo_client), \
+                patch.object(erp_client, 'get_erp_token', return_value='token'), \
+                patch.object(erp_client, '_get_session', return_value=session), \
+                patch.object(erp_client, 'view_deadline', 0):
+            response = self.client.get('/products/warehouse/api/orders/', {'branch': '100'})
+
+        self.assertEqual(response.status_code, 200)
+        body = json.loads(response.content)
+        self.assertEqual(len(body['orders']), 3)
+        self.assertTrue(body['meta']['partial'])
+        self.assertEqual(body['meta']['skipped_lookups'], 5)
+        session.request.assert_not_called()
@@ -4,7 +4,7 @@ from django.views.decorators.csrf import csrf_exempt
 from django.contrib.auth.decorators import login_required
 from core.decorators import require_product
 from services.product_service import product_service
-from services.erp_client import ERPClientError
+from services.erp_client import ERPClientError, ERPDeadlineExceeded
 from decouple import config
 import json
 import logging
@@ -223,15 +223,18 @@ def product_merge_save(request):
 
         logger.info(f"[Product Merge Save] Calling ERP merge with user: {user_id}, port: {port}")
 
-        # Call real ERP via product service
-        result = product_service.merge_product_keywords(
-            user_id=user_id,
-            company_api_base=company_api_base,
-            keeper_product_id=keeper_id,
-            merge_product_id=merge_id,
-            selected_companies=selected_companies,
-            port=port
-        )
+        # Call real ERP via product service, bounded by one request budget so
+        # the four chained ERP calls cannot outlive the gunicorn worker timeout
+        from services.erp_client import erp_client
+        with erp_client.request_budget():
+            result = product_service.merge_product_keywords(
+                user_id=user_id,
+                company_api_base=company_api_base,
+                keeper_product_id=keeper_id,
+                merge_product_id=merge_id,
+                selected_companies=selected_companies,
+                port=port
+            )
 
         logger.info(f"[Product Merge Save] ERP merge successful: {result}")
 
@@ -245,6 +248,13 @@ def product_merge_save(request):
             'product_response': result.get('product_response', {})
         })
 
+    except ERPDeadlineExceeded as e:
+        logger.error(f"[Product Merge Save] ERP merge timed out for {keeper_id} + {merge_id}: {e}")
+        return JsonResponse({
+            'error': 'ERP merge timed out',
+            'details': str(e)
+        }, status=504)
+
     except ERPClientError as e:
         logger.error(f"[Product Merge Save] ERP merge failed for {keeper_id} + {merge_id}: {e}")
         return JsonResponse({
@@ -356,6 +366,55 @@ def warehouse_api_branches(request):
           logger.error(traceback.format_exc())
           return JsonResponse({'error': str(e)}, status=500)
 
+def _fetch_sales_order_generations(erp_client, user_id, company_api_base, port, order_number):
+    """
+    Fetch /SalesOrders/{order_number} once and index its generations by generationId.
+
+    Runs inside the warehouse fan-out thread pool. ERP failures are logged and
+    return an empty mapping so one bad order never fails the page.
+    """
+    try:
+        order_data = erp_client.make_erp_request(
+            user_id=user_id,
+            company_api_base=company_api_base,
+            port=port,
+            method='GET',
+            endpoint=f'/SalesOrders/{order_number}'
+        )
+    except ERPDeadlineExceeded:
+        # Counted on the request budget; the response is flagged partial
+        return {}
+    except Exception as order_err:
+        # Log but don't fail - we can still show the invoices without these fields
+        if '404' not in str(order_err):
+            logger.warning(f'[Warehouse API] Could not fetch order details for {order_number}: {order_err}')
+        return {}
+
+    return {
+        g.get('generationId'): g
+        for g in order_data.get('generations', [])
+        if isinstance(g, dict)
+    }
+
+def _fetch_print_review_status(erp_client, user_id, company_api_base, port, pending):
+    """Fetch the PRINT.REVIEW STATUS for one invoice ('' when missing or on error)"""
+    try:
+        print_review_data = erp_client.make_erp_request(
+            user_id=user_id,
+            company_api_base=company_api_base,
+            port=port,
+            method='GET',
+            endpoint=f"/UserDefined/PRINT.REVIEW?id={pending['api_id']}"
+        )
+        return print_review_data.get('STATUS', '')
+    except ERPDeadlineExceeded:
+        return ''
+    except Exception as status_err:
+        # Ignore 404s (normal for invoices without PRINT.REVIEW records)
+        if '404' not in str(status_err):
+            logger.warning(f"[Warehouse API] Could not fetch status for {pending['full_invoice_id']}: {status_err}")
+        return ''
+
 @csrf_exempt
 def warehouse_api_orders(request):
     """
@@ -423,6 +482,9 @@ def warehouse_api_orders(request):
         # Import ERP client for status lookups
         from services.erp_client import erp_client
 
+        # First pass: filter and parse invoice IDs (no ERP calls yet)
+        pending_orders = []
+
         for order in mongo_orders:
             ship_via = order.get('shipVia', '')
 
@@ -455,60 +517,65 @@ def warehouse_api_orders(request):
                 logger.warning(f'[Warehouse API] Could not parse fullInvoiceID {full_invoice_id}: {parse_err}')
                 continue
 
-            # Fetch shipDate and custName from SalesOrders API (lightweight single-order lookup)
+            pending_orders.append({
+                'full_invoice_id': full_invoice_id,
+                'ship_via': ship_via,
+                'order_number': order_number,
+                'generation_id': generation_id,
+                'api_id': api_id
+            })
+
+        # Second pass: ERP lookups run concurrently, results come back in order.
+        # Every generation of an order shares one /SalesOrders/{order} call.
+        order_numbers = list(dict.fromkeys(p['order_number'] for p in pending_orders))
+
+        lookups = [('order', order_number) for order_number in order_numbers]
+        lookups += [('status', pending) for pending in pending_orders]
+
+        def run_lookup(lookup):
+            kind, item = lookup
+            if kind == 'order':
+                return _fetch_sales_order_generations(erp_client, user_id, company_api_base, port, item)
+            return _fetch_print_review_status(erp_client, user_id, company_api_base, port, item)
+
+        # Bound the whole fan-out by one deadline; lookups that cannot run in
+        # time are skipped and the page is returned as partial
+        with erp_client.request_budget() as budget:
+            fan_out_results = erp_client.fan_out(run_lookup, lookups)
+
+        generations_by_order = {}
+        statuses = []
+        for (kind, item), (result, lookup_err) in zip(lookups, fan_out_results):
+            if lookup_err is not None:
+                logger.warning(f"[Warehouse API] {kind} lookup failed: {lookup_err}")
+            if kind == 'order':
+                generations_by_order[item] = result or {}
+            else:
+                statuses.append(result or '')
+
+        for pending, status in zip(pending_orders, statuses):
+            # Get the specific generation
+            matching_gen = generations_by_order.get(pending['order_number'], {}).get(pending['generation_id'])
+
             ship_date = ''
             ship_to_name = ''
             po_number = ''
             balance_due = 0
 
-            try:
-                order_data = erp_client.make_erp_request(
-                    user_id=user_id,
-                    company_api_base=company_api_base,
-                    port=port,
-                    method='GET',
-                    endpoint=f'/SalesOrders/{order_number}'
-                )
-
-                # Get the specific generation
-                generations = order_data.get('generations', [])
-                matching_gen = next((g for g in generations if g.get('generationId') == generation_id), None)
-
-                if matching_gen:
-                    ship_date = matching_gen.get('shipDate', '')
-                    ship_to_name = matching_gen.get('shipToName', '')
-                    po_number = matching_gen.get('poNumber', '')
-                    balance_due_obj = matching_gen.get('balanceDue', {})
-                    balance_due = balance_due_obj.get('value', 0) if isinstance(balance_due_obj, dict) else balance_due_obj
-
-            except Exception as order_err:
-                # Log but don't fail - we can still show the invoice without these fields
-                if '404' not in str(order_err):
-                    logger.warning(f'[Warehouse API] Could not fetch order details for {full_invoice_id}: {order_err}')
-
-            # Fetch status from PRINT.REVIEW API
-            status = ''
-            try:
-                print_review_data = erp_client.make_erp_request(
-                    user_id=user_id,
-                    company_api_base=company_api_base,
-                    port=port,
-                    method='GET',
-                    endpoint=f'/UserDefined/PRINT.REVIEW?id={api_id}'
-                )
-                status = print_review_data.get('STATUS', '')
-            except Exception as status_err:
-                # Ignore 404s (normal for invoices without PRINT.REVIEW records)
-                if '404' not in str(status_err):
-                    logger.warning(f'[Warehouse API] Could not fetch status for {full_invoice_id}: {status_err}')
+            if matching_gen:
+                ship_date = matching_gen.get('shipDate', '')
+                ship_to_name = matching_gen.get('shipToName', '')
+                po_number = matching_gen.get('poNumber', '')
+                balance_due_obj = matching_gen.get('balanceDue', {})
+                balance_due = balance_due_obj.get('value', 0) if isinstance(balance_due_obj, dict) else balance_due_obj
 
             # Build order object
             processed_orders.append({
                 'shipDate': ship_date,
-                'fullInvoiceID': full_invoice_id,
+                'fullInvoiceID': pending['full_invoice_id'],
                 'shipToName': ship_to_name,
                 'poNumber': po_number,
-                'shipVia': ship_via,
+                'shipVia': pending['ship_via'],
                 'termsCode': '',  # Not needed, omit for now
                 'balanceDue': balance_due,
                 'status': status
@@ -517,9 +584,28 @@ def warehouse_api_orders(request):
         # Sort by ship date (newest first)
         processed_orders.sort(key=lambda x: x.get('shipDate', ''), reverse=True)
 
-        logger.info(f"[Warehouse API] Returning {len(processed_orders)} filtered orders")
+        erp_calls_saved = len(pending_orders) - len(order_numbers)
+
+        logger.info(
+            f"[Warehouse API] Returning {len(processed_orders)} filtered orders "
+            f"({len(lookups)} ERP calls, {erp_calls_saved} saved by order batching)"
+        )
+        if budget.exhausted:
+            logger.warning(
+                f"[Warehouse API] Request budget exhausted, {budget.skipped} ERP lookups skipped; returning partial results"
+            )
 
-        return JsonResponse({'orders': processed_orders})
+        return JsonResponse({
+            'orders': processed_orders,
+            'meta': {
+                'invoice_count': len(pending_orders),
+                'order_count': len(order_numbers),
+                'erp_calls': len(lookups),
+                'erp_calls_saved': erp_calls_saved,
+                'partial': budget.exhausted,
+                'skipped_lookups': budget.skipped
+            }
+        })
 
     except Exception as e:
         logger.error(f"[Warehouse API] Error fetching orders: {e}")
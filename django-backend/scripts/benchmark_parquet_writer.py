@@ -0,0 +1,137 @@
+"""
+Benchmark: shared Parquet writer vs. the previous Snappy output
+
+Generates synthetic purchase orders (shuffled, like a MongoDB export) and
+writes them twice:
+
+- baseline: pq.write_table(Table.from_pandas(df), compression='snappy',
+  row_group_size=100000), as the import/export scripts used to
+- tuned: services.parquet_writer.write_parquet (sorted, selective
+  dictionary encoding, ZSTD, statistics and page indexes)
+
+Then compares file size, write time and the median time of the queries
+the analytics endpoints run.
+
+Usage:
+    python scripts/benchmark_parquet_writer.py
+    python scripts/benchmark_parquet_writer.py --rows 2000000 --repeat 7
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+import duckdb
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.parquet_writer import write_parquet  # noqa: E402
+
+QUERIES = {
+    'one month, one company': """
+        SELECT COUNT(*), SUM(order_total) FROM {source}
+        WHERE company_code = 'heritage' AND order_date >= DATE '2024-03-01' AND order_date < DATE '2024-04-01'
+    """,
+    'monthly trends (12 months)': """
+        SELECT DATE_TRUNC('month', CAST(order_date AS DATE)) AS month, COUNT(*), SUM(order_total)
+        FROM {source} WHERE order_date >= DATE '2024-06-01'
+        GROUP BY 1 ORDER BY 1 DESC
+    """,
+    'vendor analysis': """
+        SELECT po_payto_name, po_payto_id, COUNT(*), SUM(order_total) FROM {source}
+        WHERE po_payto_name IS NOT NULL GROUP BY 1, 2 ORDER BY 4 DESC LIMIT 20
+    """,
+    'branch filter': """
+        SELECT po_number, order_total, order_date FROM {source}
+        WHERE po_branch = '0117' ORDER BY order_date DESC LIMIT 100
+    """,
+    'po_number lookup': """
+        SELECT * FROM {source} WHERE po_number LIKE '%123456%'
+    """,
+}
+
+
+def synthetic_purchase_orders(rows, seed=54):
+    rng = np.random.default_rng(seed)
+    companies = np.array(['heritage', 'metro', 'tristate', 'wittichen', 'emp54'])
+    branches = np.array([f'{n:04d}' for n in range(100, 160)])
+    vendors = np.array([f'VENDOR {n:05d} SUPPLY CO' for n in range(2500)])
+    start = np.datetime64('2021-01-01')
+
+    vendor_ids = rng.integers(0, len(vendors), rows)
+    return pd.DataFrame({
+        'po_number': [f'PO-{n:08d}' for n in rng.permutation(rows)],
+        'po_payto_id': [f'V{n:05d}' for n in vendor_ids],
+        'po_payto_name': vendors[vendor_ids],
+        'po_company': 'EMP',
+        'po_branch': branches[rng.integers(0, len(branches), rows)],
+        'order_total': np.round(rng.gamma(2.0, 400.0, rows), 2),
+        'order_date': start + rng.integers(0, 5 * 365, rows).astype('timedelta64[D]'),
+        'company_code': companies[rng.integers(0, len(companies), rows)],
+        'import_batch_id': 'benchmark',
+        'imported_by': 'benchmark@emp54',
+        'imported_at': pd.Timestamp('2025-01-01'),
+    })
+
+
+def time_queries(path, repeat):
+    conn = duckdb.connect()
+    source = f"'{path}'"
+    results = {}
+    for name, sql in QUERIES.items():
+        sql = sql.format(source=source)
+        conn.execute(sql).fetchall()  # warm the OS page cache
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            conn.execute(sql).fetchall()
+            timings.append((time.perf_counter() - started) * 1000)
+        results[name] = statistics.median(timings)
+    conn.close()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare Parquet writer settings')
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"Generating {args.rows:,} synthetic purchase orders...")
+    df = synthetic_purchase_orders(args.rows)
+
+    with tempfile.TemporaryDirectory() as directory:
+        baseline_path = os.path.join(directory, 'baseline.parquet')
+        tuned_path = os.path.join(directory, 'tuned.parquet')
+
+        started = time.perf_counter()
+        pq.write_table(pa.Table.from_pandas(df), baseline_path, compression='snappy', row_group_size=100000)
+        baseline_write = time.perf_counter() - started
+
+        started = time.perf_counter()
+        write_parquet(df, tuned_path)
+        tuned_write = time.perf_counter() - started
+
+        baseline_queries = time_queries(baseline_path, args.repeat)
+        tuned_queries = time_queries(tuned_path, args.repeat)
+
+        baseline_mb = os.path.getsize(baseline_path) / (1024 * 1024)
+        tuned_mb = os.path.getsize(tuned_path) / (1024 * 1024)
+
+    print(f"\n{'':32} {'snappy':>10} {'tuned':>10} {'change':>8}")
+    print(f"{'file size (MB)':32} {baseline_mb:>10.2f} {tuned_mb:>10.2f} {(tuned_mb / baseline_mb - 1) * 100:>7.0f}%")
+    print(f"{'write time (s)':32} {baseline_write:>10.2f} {tuned_write:>10.2f} {(tuned_write / baseline_write - 1) * 100:>7.0f}%")
+    for name in QUERIES:
+        before, after = baseline_queries[name], tuned_queries[name]
+        print(f"{name + ' (ms)':32} {before:>10.1f} {after:>10.1f} {(after / before - 1) * 100:>7.0f}%")
+
+
+if __name__ == '__main__':
+    main()
@@ -4,6 +4,11 @@ Migration Script: MongoDB to Parquet
 Exports MongoDB collections to Parquet files for DuckDB analysis.
 Supports both local file output and direct upload to Wasabi S3.
 
+purchase_orders is uploaded into the partitioned dataset the analytics
+views read (analytics/purchase_orders/, with manifest and rollups; see
+scripts/partition_purchase_orders.py), replacing the exported companies.
+Other collections are uploaded as analytics/<output_filename>.
+
 Usage:
     python manage.py shell < scripts/migrate_mongodb_to_parquet.py
 
@@ -15,16 +20,21 @@ Or import and use:
 import os
 import sys
 import pandas as pd
-import pyarrow as pa
-import pyarrow.parquet as pq
 from pymongo import MongoClient
 from decouple import config
 import boto3
 from datetime import datetime
 import logging
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.parquet_writer import write_parquet  # noqa: E402
+from scripts.partition_purchase_orders import write_purchase_orders  # noqa: E402
+
 logger = logging.getLogger(__name__)
 
+PURCHASE_ORDERS_COLLECTION = 'purchase_orders'
+
 
 def get_mongo_client():
     """Get MongoDB client"""
@@ -114,13 +124,9 @@ def export_collection_to_parquet(
 
     # Write to Parquet
     logger.info(f"Writing to Parquet: {local_path}")
-    table = pa.Table.from_pandas(df)
-    pq.write_table(
-        table,
-        local_path,
-        compression='snappy',  # Good balance of speed and compression
-        row_group_size=100000  # Optimize for 100K row chunks
-    )
+    # Shared writer settings: sorted by company_code/order_date where present,
+    # dictionary encoding for low-cardinality strings, ZSTD, page indexes
+    write_parquet(df, local_path)
 
     # Get file size
     file_size_mb = os.path.getsize(local_path) / (1024 * 1024)
@@ -132,11 +138,13 @@ def export_collection_to_parquet(
         try:
             s3_client = get_s3_client()
             bucket = config('WASABI_BUCKET')
-            s3_key = f"analytics/{output_filename}"
-
-            logger.info(f"Uploading to s3://{bucket}/{s3_key}")
-            s3_client.upload_file(local_path, bucket, s3_key)
-            s3_path = f"s3://{bucket}/{s3_key}"
+            if collection_name == PURCHASE_ORDERS_COLLECTION:
+                s3_path = write_purchase_orders(df, s3_client, bucket)['uri']
+            else:
+                s3_key = f"analytics/{output_filename}"
+                logger.info(f"Uploading to s3://{bucket}/{s3_key}")
+                s3_client.upload_file(local_path, bucket, s3_key)
+                s3_path = f"s3://{bucket}/{s3_key}"
             logger.info(f"Upload complete: {s3_path}")
         except Exception as e:
             logger.error(f"S3 upload failed: {e}")
@@ -0,0 +1,112 @@
+"""
+Migration Script: single purchase_orders.parquet -> partitioned dataset
+
+Splits the legacy analytics/purchase_orders.parquet object into the
+company_code=/year=/month= layout the DuckDB analytics views now read
+(see services/po_dataset.py), along with its daily rollups. Existing
+partitions of the companies found in the file are replaced. The legacy
+object is left in place.
+
+Usage:
+    python scripts/partition_purchase_orders.py
+    python scripts/partition_purchase_orders.py --source analytics/purchase_orders.parquet
+"""
+
+import argparse
+import io
+import logging
+import os
+import sys
+
+import boto3
+import pyarrow.parquet as pq
+from decouple import config
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.po_dataset import PurchaseOrderDataset  # noqa: E402
+from services.po_rollups import PurchaseOrderRollups  # noqa: E402
+
+logger = logging.getLogger(__name__)
+
+LEGACY_PARQUET_PATH = 'analytics/purchase_orders.parquet'
+
+
+def get_s3_client():
+    """Get Wasabi S3 client"""
+    endpoint = config('WASABI_ENDPOINT', default='s3.wasabisys.com').replace('https://', '').replace('http://', '')
+    return boto3.client(
+        's3',
+        endpoint_url=f"https://{endpoint}",
+        aws_access_key_id=config('WASABI_ACCESS_KEY', default='') or config('WASABI_ACCESS_KEY_ID'),
+        aws_secret_access_key=config('WASABI_SECRET_KEY', default='') or config('WASABI_SECRET_ACCESS_KEY'),
+        region_name=config('WASABI_REGION', default='us-east-1')
+    )
+
+
+def write_purchase_orders(df, s3_client=None, bucket=None, default_company_code='heritage'):
+    """
+    Replace the companies in df in the partitioned dataset (and its rollups)
+
+    The one way scripts publish purchase orders: the views read the
+    company_code=/year=/month= dataset through its manifest, never a single
+    Parquet object.
+
+    Args:
+        df (DataFrame): Purchase orders (extra columns are dropped)
+        default_company_code (str): Used for rows without a company_code
+
+    Returns:
+        dict: Write statistics from PurchaseOrderDataset.write
+    """
+    s3_client = s3_client or get_s3_client()
+    bucket = bucket or config('WASABI_BUCKET', default='emp54')
+
+    if 'company_code' not in df.columns:
+        df['company_code'] = default_company_code
+    df['company_code'] = df['company_code'].fillna(default_company_code)
+
+    dataset = PurchaseOrderDataset(s3_client, bucket, rollups=PurchaseOrderRollups(s3_client, bucket))
+    result = dataset.write(df, mode='replace')
+
+    logger.info(
+        f"Wrote {result['fragments_written']} partitions ({result['rows_written']:,} rows, "
+        f"{result['bytes_written'] / (1024 * 1024):.2f} MB) to {dataset.uri}"
+    )
+    return {**result, 'uri': dataset.uri}
+
+
+def partition_legacy_file(source_key=LEGACY_PARQUET_PATH, default_company_code='heritage'):
+    """
+    Rewrite the legacy single-file Parquet object as a partitioned dataset
+
+    Args:
+        source_key (str): Key of the legacy Parquet object
+        default_company_code (str): Used for rows without a company_code
+
+    Returns:
+        dict: Write statistics from PurchaseOrderDataset.write
+    """
+    s3_client = get_s3_client()
+    bucket = config('WASABI_BUCKET', default='emp54')
+
+    logger.info(f"Reading s3://{bucket}/{source_key}")
+    response = s3_client.get_object(Bucket=bucket, Key=source_key)
+    df = pq.read_table(io.BytesIO(response['Body'].read())).to_pandas()
+    logger.info(f"Loaded {len(df):,} records")
+
+    return write_purchase_orders(df, s3_client, bucket, default_company_code)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s'
+    )
+
+    parser = argparse.ArgumentParser(description='Partition the legacy purchase orders Parquet file')
+    parser.add_argument('--source', default=LEGACY_PARQUET_PATH, help='Key of the legacy Parquet object')
+    parser.add_argument('--default-company-code', default='heritage', help='company_code for rows without one')
+    args = parser.parse_args()
+
+    partition_legacy_file(args.source, args.default_company_code)
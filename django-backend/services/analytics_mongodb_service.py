@@ -5,7 +5,9 @@ Uses pymongo directly for better performance and full MongoDB features
 (aggregation, indexing, etc.) without djongo compatibility issues.
 """
 
-from pymongo import MongoClient, ASCENDING, DESCENDING
+import gridfs
+from pymongo import MongoClient, ASCENDING, DESCENDING, ReplaceOne, UpdateOne
+from pymongo.errors import BulkWriteError
 from decouple import config
 import logging
 from typing import List, Dict, Any, Optional
@@ -26,6 +28,8 @@ class AnalyticsMongoDBService:
         self.db = None
         self.purchase_orders = None
         self.import_logs = None
+        self.import_jobs = None
+        self.import_files = None
         self.connect()
 
     def connect(self):
@@ -44,6 +48,10 @@ class AnalyticsMongoDBService:
             self.purchase_orders = self.db['purchase_orders']
             self.import_logs = self.db['po_import_logs']
 
+            # Durable CSV import queue (services/po_import_queue.py)
+            self.import_jobs = self.db['po_import_jobs']
+            self.import_files = gridfs.GridFSBucket(self.db, bucket_name='po_import_files')
+
             # Test connection
             self.client.admin.command('ping')
             logger.info(f"✅ Connected to MongoDB for Analytics: {db_name}")
@@ -87,11 +95,33 @@ class AnalyticsMongoDBService:
                 ('imported_at', DESCENDING)
             ], name='company_imported')
 
+            # Import job queue: claiming, and one running job per company slot
+            self.import_jobs.create_index([
+                ('status', ASCENDING),
+                ('run_after', ASCENDING)
+            ], name='status_run_after')
+
+            self.import_jobs.create_index([
+                ('company_code', ASCENDING),
+                ('slot', ASCENDING)
+            ], name='company_running_slot', unique=True, partialFilterExpression={'status': 'running'})
+
             logger.info("✅ Created MongoDB indexes for analytics")
 
         except Exception as e:
             logger.warning(f"⚠️ Index creation warning: {e}")
 
+        # Upsert key of bulk_upsert_purchase_orders. Fails while older
+        # imports left duplicate PO numbers; remove them with
+        # `python manage.py dedupe_purchase_orders`.
+        try:
+            self.purchase_orders.create_index([
+                ('company_code', ASCENDING),
+                ('po_number', ASCENDING)
+            ], name='company_po_number', unique=True)
+        except Exception as e:
+            logger.warning(f"⚠️ Unique PO number index not created (run dedupe_purchase_orders): {e}")
+
     def insert_purchase_order(self, po_data: Dict[str, Any]) -> str:
         """Insert a single purchase order and return its ID"""
         result = self.purchase_orders.insert_one(po_data)
@@ -104,6 +134,74 @@ class AnalyticsMongoDBService:
         result = self.purchase_orders.insert_many(po_list)
         return len(result.inserted_ids)
 
+    def bulk_upsert_purchase_orders(self, po_list: List[Dict[str, Any]], overwrite: bool = False) -> Dict[str, int]:
+        """
+        Insert a batch of POs keyed by (company_code, po_number) in one round trip
+
+        Runs an unordered bulk_write of upserts, so duplicates are resolved
+        by the server against the company_po_number unique index:
+        overwrite=True replaces existing POs (ReplaceOne), otherwise existing
+        POs are left alone ($setOnInsert). An overwrite that loses an insert
+        race to another import is retried once as a plain replace.
+
+        Returns:
+            dict: inserted, replaced and skipped counts
+        """
+        if not po_list:
+            return {'inserted': 0, 'replaced': 0, 'skipped': 0}
+
+        if overwrite:
+            operations = [
+                ReplaceOne({'company_code': po['company_code'], 'po_number': po['po_number']}, po, upsert=True)
+                for po in po_list
+            ]
+        else:
+            operations = [
+                UpdateOne({'company_code': po['company_code'], 'po_number': po['po_number']}, {'$setOnInsert': po}, upsert=True)
+                for po in po_list
+            ]
+
+        lost_races = []
+        try:
+            result = self.purchase_orders.bulk_write(operations, ordered=False).bulk_api_result
+        except BulkWriteError as e:
+            # Two upserts of a new PO racing each other (e.g. concurrent
+            # imports): the loser hits the unique index, and the PO exists
+            result = e.details
+            if any(error['code'] != 11000 for error in result['writeErrors']):
+                raise
+            lost_races = [error['index'] for error in result['writeErrors']]
+
+        inserted = result['nUpserted']
+        replaced = result['nMatched'] if overwrite else 0
+
+        if overwrite and lost_races:
+            # The winner inserted the PO, so a plain replace now matches it;
+            # without this the row the user asked to overwrite is dropped
+            retry = [
+                ReplaceOne({'company_code': po_list[i]['company_code'], 'po_number': po_list[i]['po_number']}, po_list[i])
+                for i in lost_races
+            ]
+            replaced += self.purchase_orders.bulk_write(retry, ordered=False).matched_count
+
+        return {'inserted': inserted, 'replaced': replaced, 'skipped': len(po_list) - inserted - replaced}
+
+    def remove_duplicate_purchase_orders(self) -> int:
+        """Keep the most recently imported PO per (company_code, po_number); returns the number deleted"""
+        pipeline = [
+            {'$sort': {'imported_at': -1}},
+            {'$group': {
+                '_id': {'company_code': '$company_code', 'po_number': '$po_number'},
+                'ids': {'$push': '$_id'},
+                'count': {'$sum': 1}
+            }},
+            {'$match': {'count': {'$gt': 1}}}
+        ]
+        deleted = 0
+        for group in self.purchase_orders.aggregate(pipeline, allowDiskUse=True):
+            deleted += self.purchase_orders.delete_many({'_id': {'$in': group['ids'][1:]}}).deleted_count
+        return deleted
+
     def find_purchase_order(self, po_number: str, company_code: str) -> Optional[Dict[str, Any]]:
         """Find PO by number and company"""
         return self.purchase_orders.find_one({
@@ -3,15 +3,328 @@ DuckDB Client for Analytical Queries
 
 Provides high-performance analytical queries on Parquet files stored in Wasabi S3.
 Perfect for read-only analysis of large datasets (millions of rows).
+
+Each process keeps one in-memory DuckDB database with httpfs and the Wasabi
+S3 settings configured once. Queries run on pooled cursors of that database,
+so the po_* endpoints no longer pay the extension/S3 setup cost per request.
+Call duckdb_client.warm_up() at worker boot (see gunicorn.conf.py).
+
+s3:// Parquet paths passed through resolve_path() are served from a local
+on-disk mirror (services/parquet_cache.py) once it holds the current version.
+Paths ending in '/' are hive-partitioned datasets (see services/po_dataset.py)
+and resolve to their current file list.
+
+query(..., cache_sources=[...]) results are cached in memory, keyed by the
+normalized SQL, the params and the ETag of every source Parquet file, so a
+new upload invalidates them automatically.
+
+query_json() is the Arrow-native result path for API responses: DuckDB
+streams Arrow record batches and renders each row to JSON itself, so no
+pandas DataFrame or per-row Python dict is ever built.
 """
 
 import duckdb
+import re
+import sys
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import date
 from decouple import config
 import logging
 
+from .duckdb_query import read_parquet_sql
+from .parquet_cache import ParquetMirrorCache
+
 logger = logging.getLogger(__name__)
 
 
+class _PooledConnection:
+    """A cursor on the shared database plus the bookkeeping used for recycling"""
+
+    __slots__ = ('conn', 'generation', 'created_at', 'last_checked_at', 'uses')
+
+    def __init__(self, conn, generation):
+        self.conn = conn
+        self.generation = generation
+        self.created_at = time.monotonic()
+        self.last_checked_at = self.created_at
+        self.uses = 0
+
+
+class DuckDBConnectionPool:
+    """
+    Thread-safe pool of cursors on one pre-configured DuckDB database
+
+    DuckDB connections must not be used by two threads at once, so each
+    checkout gets a cursor to itself. Cursors share the database instance,
+    its loaded extensions and global S3 settings.
+
+    - Health check: an idle cursor older than health_check_interval runs
+      SELECT 1 before reuse; failures are replaced.
+    - Recycling: cursors are closed after max_uses queries or max_age seconds.
+    - If the database itself fails (e.g. out of memory), reset() rebuilds it
+      and cursors from the old database are dropped on return.
+    """
+
+    def __init__(self, setup, size=4, max_uses=1000, max_age=3600, health_check_interval=60):
+        self._setup = setup
+        self.size = size
+        self.max_uses = max_uses
+        self.max_age = max_age
+        self.health_check_interval = health_check_interval
+
+        self._lock = threading.Lock()
+        self._available = threading.BoundedSemaphore(size)
+        self._idle = []
+        self._database = None
+        self._generation = 0
+        self._stats = {'created': 0, 'reused': 0, 'recycled': 0, 'health_check_failures': 0, 'database_resets': 0, 'dedicated': 0}
+
+    def _get_database(self):
+        """Create and configure the shared database on first use (caller holds _lock)"""
+        if self._database is None:
+            started = time.monotonic()
+            database = duckdb.connect(':memory:')
+            try:
+                self._setup(database)
+            except Exception:
+                database.close()
+                raise
+            self._database = database
+            self._generation += 1
+            logger.info(f"DuckDB database initialized in {(time.monotonic() - started) * 1000:.0f}ms")
+        return self._database
+
+    def _new_connection(self):
+        with self._lock:
+            database = self._get_database()
+            pooled = _PooledConnection(database.cursor(), self._generation)
+            self._stats['created'] += 1
+        return pooled
+
+    def _is_stale(self, pooled, now):
+        return (
+            pooled.generation != self._generation or
+            pooled.uses >= self.max_uses or
+            now - pooled.created_at >= self.max_age
+        )
+
+    def _healthy(self, pooled, now):
+        if now - pooled.last_checked_at < self.health_check_interval:
+            return True
+        try:
+            pooled.conn.execute("SELECT 1").fetchone()
+            pooled.last_checked_at = now
+            return True
+        except Exception as e:
+            logger.warning(f"DuckDB pooled connection failed health check: {e}")
+            with self._lock:
+                self._stats['health_check_failures'] += 1
+            return False
+
+    @staticmethod
+    def _close(pooled):
+        try:
+            pooled.conn.close()
+        except Exception:
+            pass
+
+    def _checkout(self):
+        while True:
+            with self._lock:
+                pooled = self._idle.pop() if self._idle else None
+            if pooled is None:
+                return self._new_connection()
+
+            now = time.monotonic()
+            if self._is_stale(pooled, now):
+                with self._lock:
+                    self._stats['recycled'] += 1
+                self._close(pooled)
+                continue
+            if not self._healthy(pooled, now):
+                self._close(pooled)
+                continue
+
+            with self._lock:
+                self._stats['reused'] += 1
+            return pooled
+
+    def _checkin(self, pooled, broken=False):
+        pooled.uses += 1
+        if broken or self._is_stale(pooled, time.monotonic()):
+            if not broken:
+                with self._lock:
+                    self._stats['recycled'] += 1
+            self._close(pooled)
+            return
+        with self._lock:
+            self._idle.append(pooled)
+
+    @contextmanager
+    def connection(self):
+        """Check out a cursor for the duration of the block (blocks when all are in use)"""
+        self._available.acquire()
+        try:
+            pooled = self._checkout()
+            try:
+                yield pooled.conn
+            except (duckdb.ConnectionException, duckdb.FatalException, duckdb.InternalException):
+                # The cursor (or the whole database) is unusable; don't hand it out again
+                self._checkin(pooled, broken=True)
+                self.reset()
+                raise
+            except BaseException:
+                self._checkin(pooled)
+                raise
+            else:
+                self._checkin(pooled)
+        finally:
+            self._available.release()
+
+    @contextmanager
+    def dedicated(self):
+        """
+        A fresh cursor on the shared database, outside the pool
+
+        For long-lived streams (exports held open for a whole client
+        download): it takes no pool slot, so slow clients never block
+        dashboard queries waiting in connection(). Closed on exit.
+        """
+        with self._lock:
+            conn = self._get_database().cursor()
+            self._stats['dedicated'] += 1
+        try:
+            yield conn
+        finally:
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+    def warm_up(self):
+        """Initialize the database and fill the pool with ready cursors"""
+        created = [self._new_connection() for _ in range(self.size - len(self._idle))]
+        with self._lock:
+            self._idle.extend(created)
+
+    def reset(self):
+        """Drop the shared database; it is rebuilt on the next checkout"""
+        with self._lock:
+            idle, self._idle = self._idle, []
+            # Not closed explicitly: closing the root would also close cursors
+            # other threads are still using. It is freed once they return.
+            self._database = None
+            self._generation += 1
+            self._stats['database_resets'] += 1
+        for pooled in idle:
+            self._close(pooled)
+
+    def get_stats(self):
+        with self._lock:
+            return {
+                'size': self.size,
+                'idle': len(self._idle),
+                'initialized': self._database is not None,
+                **self._stats
+            }
+
+
+class DuckDBResultCache:
+    """
+    Memory-bounded LRU cache of query results keyed on data version
+
+    Keys include the ETag of each source Parquet file, so stale entries are
+    never served after an upload; they just age out of the LRU. invalidate()
+    frees them right away.
+    """
+
+    _WHITESPACE = re.compile(r'\s+')
+
+    def __init__(self, max_bytes=64 * 1024 * 1024, enabled=True):
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+        self._entries = OrderedDict()  # key -> (records, size, sources)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'invalidations': 0}
+
+    @classmethod
+    def normalize_sql(cls, sql):
+        return cls._WHITESPACE.sub(' ', sql).strip()
+
+    @staticmethod
+    def _freeze_params(params):
+        if params is None:
+            return None
+        if isinstance(params, dict):
+            return tuple(sorted((k, repr(v)) for k, v in params.items()))
+        return tuple(repr(v) for v in params)
+
+    def key_for(self, sql, params, versions, result_format='records'):
+        """versions: tuple of (source path, ETag) pairs"""
+        normalized = self.normalize_sql(sql)
+        # Queries relative to today must not be served from yesterday's entry
+        today = date.today().isoformat() if 'CURRENT_DATE' in normalized.upper() else None
+        return (normalized, self._freeze_params(params), versions, today, result_format)
+
+    def get(self, key):
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._stats['misses'] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._stats['hits'] += 1
+            value = entry[0]
+        # Rows are copied so callers can't mutate the cached result (JSON bytes are immutable)
+        if isinstance(value, list):
+            return [dict(row) for row in value]
+        return value
+
+    def set(self, key, value, size, sources):
+        """value: list of row dicts, or a (json_bytes, row_count) tuple"""
+        if not self.enabled or size > self.max_bytes:
+            return
+        if isinstance(value, list):
+            value = [dict(row) for row in value]
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            self._entries[key] = (value, size, tuple(sources))
+            self._bytes += size
+            while self._bytes > self.max_bytes and self._entries:
+                _, (_, evicted_size, _) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self._stats['evictions'] += 1
+
+    def invalidate(self, source=None):
+        """Drop results that read source (or everything)"""
+        with self._lock:
+            if source is None:
+                keys = list(self._entries)
+            else:
+                keys = [key for key, entry in self._entries.items() if source in entry[2]]
+            for key in keys:
+                self._bytes -= self._entries.pop(key)[1]
+            self._stats['invalidations'] += len(keys)
+
+    def get_stats(self):
+        with self._lock:
+            return {
+                'enabled': self.enabled,
+                'entries': len(self._entries),
+                'size_mb': round(self._bytes / (1024 * 1024), 2),
+                'max_mb': round(self.max_bytes / (1024 * 1024), 2),
+                **self._stats
+            }
+
+
 class DuckDBClient:
     """Client for querying Parquet files with DuckDB"""
 
@@ -25,16 +338,87 @@ class DuckDBClient:
         self.wasabi_access_key = config('WASABI_ACCESS_KEY', default='') or config('WASABI_ACCESS_KEY_ID', default='')
         self.wasabi_secret_key = config('WASABI_SECRET_KEY', default='') or config('WASABI_SECRET_ACCESS_KEY', default='')
 
-    def get_connection(self):
+        self.pool = DuckDBConnectionPool(
+            setup=self._configure_database,
+            size=config('DUCKDB_POOL_SIZE', default=4, cast=int),
+            max_uses=config('DUCKDB_POOL_MAX_USES', default=1000, cast=int),
+            max_age=config('DUCKDB_POOL_MAX_AGE', default=3600, cast=float),
+            health_check_interval=config('DUCKDB_POOL_HEALTH_CHECK_INTERVAL', default=60, cast=float)
+        )
+
+        # Local mirror of S3 Parquet objects (validated by ETag, LRU size cap).
+        # Also resolves datasets to their committed files when mirroring is off.
+        self.parquet_cache = ParquetMirrorCache(
+            s3_client_factory=self._create_s3_client,
+            cache_dir=config('PARQUET_CACHE_DIR', default='/tmp/emp54-parquet-cache'),
+            max_bytes=config('PARQUET_CACHE_MAX_MB', default=2048, cast=int) * 1024 * 1024,
+            validate_interval=config('PARQUET_CACHE_VALIDATE_INTERVAL', default=60, cast=float),
+            enabled=bool(self.wasabi_access_key and self.wasabi_secret_key),
+            mirror=config('PARQUET_CACHE_ENABLED', default=True, cast=bool)
+        )
+
+        # Query results keyed on (normalized SQL, params, source ETags)
+        self.result_cache = DuckDBResultCache(
+            max_bytes=config('DUCKDB_RESULT_CACHE_MAX_MB', default=64, cast=int) * 1024 * 1024,
+            enabled=config('DUCKDB_RESULT_CACHE_ENABLED', default=True, cast=bool)
+        )
+
+    def _create_s3_client(self):
+        """boto3 client for the same Wasabi account DuckDB reads through httpfs"""
+        import boto3
+
+        return boto3.client(
+            's3',
+            endpoint_url=f"https://{self.wasabi_endpoint}",
+            aws_access_key_id=self.wasabi_access_key,
+            aws_secret_access_key=self.wasabi_secret_key,
+            region_name=self.wasabi_region
+        )
+
+    def resolve_path(self, parquet_path):
         """
-        Get a DuckDB connection configured for Wasabi S3
+        Path DuckDB should read for a Parquet file
+
+        s3:// paths resolve to the local mirror when it holds the current
+        version (checked via ETag); otherwise the S3 path is returned and
+        the mirror is refreshed in the background.
+
+        Args:
+            parquet_path (str): S3 path or local path to Parquet file, or a
+                dataset path ending in '/'
 
         Returns:
-            duckdb.DuckDBPyConnection: Configured connection
+            str | list: Local or S3 path; for a dataset, the list of its
+                files (or the dataset path itself)
+        """
+        return self.parquet_cache.resolve(parquet_path)
+
+    def _source_versions(self, sources):
+        """(path, ETag) for each source, or None if any version is unknown"""
+        versions = []
+        for source in sources:
+            if source.startswith('s3://') and not (self.wasabi_access_key and self.wasabi_secret_key):
+                return None
+            version = self.parquet_cache.version(source)
+            if version is None:
+                return None
+            versions.append((source, version))
+        return tuple(versions)
+
+    def invalidate_results(self, parquet_path=None):
         """
-        conn = duckdb.connect(':memory:')  # In-memory database for fast queries
+        Drop cached results (and mirror metadata) for a Parquet file after it changes
 
-        # Configure S3/Wasabi access
+        Called by the import views after uploading. Other workers see the new
+        ETag on their next validation and stop using their old entries.
+        """
+        self.result_cache.invalidate(parquet_path)
+        self.parquet_cache.invalidate(parquet_path)
+
+    def _configure_database(self, conn):
+        """One-time setup of the shared in-memory database (extensions and S3 access)"""
+        # Configure S3/Wasabi access. s3_* are global settings, so every
+        # cursor of this database inherits them.
         if self.wasabi_access_key and self.wasabi_secret_key:
             conn.execute("INSTALL httpfs;")
             conn.execute("LOAD httpfs;")
@@ -43,15 +427,53 @@ class DuckDBClient:
             conn.execute(f"SET s3_access_key_id='{self.wasabi_access_key}';")
             conn.execute(f"SET s3_secret_access_key='{self.wasabi_secret_key}';")
 
-        return conn
+    def get_connection(self):
+        """
+        Get a DuckDB connection configured for Wasabi S3
+
+        The connection is a new cursor on the shared, already configured
+        database; the caller must close it. Prefer `with
+        duckdb_client.connection() as conn:` which reuses pooled cursors.
+
+        Returns:
+            duckdb.DuckDBPyConnection: Configured connection
+        """
+        with self.pool.connection() as conn:
+            return conn.cursor()
+
+    def connection(self):
+        """Context manager yielding a pooled, configured DuckDB connection"""
+        return self.pool.connection()
 
-    def query(self, sql, params=None):
+    def warm_up(self):
+        """
+        Initialize the shared database and connection pool ahead of the first query
+
+        Called from the gunicorn post_worker_init hook. Failures are logged,
+        not raised, so a Wasabi outage never stops a worker from booting.
+        """
+        started = time.monotonic()
+        try:
+            self.pool.warm_up()
+            logger.info(f"DuckDB pool warmed up ({self.pool.size} connections) in {(time.monotonic() - started) * 1000:.0f}ms")
+            return True
+        except Exception as e:
+            logger.error(f"DuckDB warm-up failed, will initialize on first query: {e}")
+            return False
+
+    def get_pool_stats(self):
+        """Pool size, idle cursors and create/reuse/recycle counters"""
+        return self.pool.get_stats()
+
+    def query(self, sql, params=None, cache_sources=None):
         """
         Execute a SQL query and return results as a list of dicts
 
         Args:
             sql (str): SQL query to execute
             params (dict): Optional parameters for parameterized queries
+            cache_sources (list): Parquet paths the query reads. When given,
+                the result is cached until any of them changes (ETag).
 
         Returns:
             list: Query results as list of dictionaries
@@ -65,24 +487,169 @@ class DuckDBClient:
             ...     GROUP BY vendor
             ... ''', params={'order_date': '2024-01-01'})
         """
+        cache_key = None
+        if cache_sources and self.result_cache.enabled:
+            versions = self._source_versions(cache_sources)
+            if versions is not None:
+                cache_key = self.result_cache.key_for(sql, params, versions)
+                cached = self.result_cache.get(cache_key)
+                if cached is not None:
+                    return cached
+
         try:
-            conn = self.get_connection()
+            with self.connection() as conn:
+                if params:
+                    result = conn.execute(sql, params).fetchdf()
+                else:
+                    result = conn.execute(sql).fetchdf()
 
-            if params:
-                result = conn.execute(sql, params).fetchdf()
+            # Convert DataFrame to list of dicts for JSON serialization
+            records = result.to_dict('records')
+
+            if cache_key is not None:
+                # Column data plus per-row dict overhead (approximate)
+                size = int(result.memory_usage(deep=True).sum()) + (sys.getsizeof(records[0]) * len(records) if records else 0)
+                self.result_cache.set(cache_key, records, size, cache_sources)
+
+            return records
+
+        except Exception as e:
+            logger.error(f"DuckDB query error: {e}")
+            logger.error(f"SQL: {sql}")
+            raise
+
+    @staticmethod
+    def _json_projection(schema):
+        """
+        Per-column SQL that renders like the pandas/JsonResponse path did
+
+        Timestamps and dates become ISO 8601 ('2025-01-05T00:00:00') and
+        NaN/Infinity become null (they are not valid JSON).
+        """
+        import pyarrow as pa
+
+        fields = []
+        for field in schema:
+            column = '"' + field.name.replace('"', '""') + '"'
+            if pa.types.is_timestamp(field.type) or pa.types.is_date(field.type):
+                expr = f"strftime(CAST({column} AS TIMESTAMP), '%Y-%m-%dT%H:%M:%S')"
+            elif pa.types.is_floating(field.type):
+                expr = f"CASE WHEN isnan({column}) OR isinf({column}) THEN NULL ELSE {column} END"
             else:
-                result = conn.execute(sql).fetchdf()
+                expr = column
+            fields.append(f"{column} := {expr}")
+        return f"to_json(struct_pack({', '.join(fields)}))::VARCHAR"
 
-            conn.close()
+    def iter_json_batches(self, sql, params=None, separator=',', batch_rows=10000, dedicated=False):
+        """
+        Stream a query result as JSON text, one chunk per Arrow record batch
 
-            # Convert DataFrame to list of dicts for JSON serialization
-            return result.to_dict('records')
+        Each yielded chunk is (bytes, row_count); the bytes hold the batch's
+        rows as JSON objects joined by separator. Memory stays bounded by
+        batch_rows regardless of the result size. A pooled connection (or,
+        with dedicated=True, a cursor outside the pool; use it for streams
+        sent to a client) is held until the generator is exhausted or closed.
+        """
+        import pyarrow as pa
+        import pyarrow.compute as pc
+
+        params = params or []
+        with self.pool.dedicated() if dedicated else self.connection() as conn:
+            schema = conn.execute(f"SELECT * FROM ({sql}) LIMIT 0", params).fetch_arrow_table().schema
+            json_sql = f"SELECT {self._json_projection(schema)} AS row_json FROM ({sql})"
+            reader = conn.execute(json_sql, params).fetch_record_batch(batch_rows)
+
+            for batch in reader:
+                rows = batch.column(0)
+                if len(rows) == 0:
+                    continue
+                # Join all rows of the batch into one string inside Arrow
+                as_list = pa.ListArray.from_arrays(pa.array([0, len(rows)], pa.int32()), rows)
+                yield pc.binary_join(as_list, separator)[0].as_py().encode(), len(rows)
+
+    def iter_record_batches(self, sql, params=None, batch_rows=100000):
+        """
+        Stream a query result as pyarrow RecordBatches of up to batch_rows rows
+
+        Used by the export endpoint; memory stays bounded by one batch. The
+        query runs on a dedicated cursor outside the pool (see
+        DuckDBConnectionPool.dedicated), held until the generator is
+        exhausted or closed. An empty result yields one empty batch, so
+        consumers still get the schema.
+        """
+        import pyarrow as pa
+
+        with self.pool.dedicated() as conn:
+            reader = conn.execute(sql, params or []).fetch_record_batch(batch_rows)
+            empty = True
+            for batch in reader:
+                if batch.num_rows:
+                    empty = False
+                    yield batch
+            if empty:
+                yield pa.RecordBatch.from_pylist([], schema=reader.schema)
+
+    def query_json(self, sql, params=None, cache_sources=None):
+        """
+        Execute a SQL query and return its rows as a JSON array (bytes)
+
+        Args:
+            sql (str): SQL query to execute
+            params (list): Optional bound parameters
+            cache_sources (list): Parquet paths read, enables the result cache
+
+        Returns:
+            tuple: (JSON array bytes, row count)
+        """
+        cache_key = None
+        if cache_sources and self.result_cache.enabled:
+            versions = self._source_versions(cache_sources)
+            if versions is not None:
+                cache_key = self.result_cache.key_for(sql, params, versions, result_format='json')
+                cached = self.result_cache.get(cache_key)
+                if cached is not None:
+                    return cached
+
+        try:
+            chunks = []
+            count = 0
+            for chunk, rows in self.iter_json_batches(sql, params):
+                chunks.append(chunk)
+                count += rows
+            result = (b'[' + b','.join(chunks) + b']', count)
+
+            if cache_key is not None:
+                self.result_cache.set(cache_key, result, len(result[0]), cache_sources)
+
+            return result
 
         except Exception as e:
             logger.error(f"DuckDB query error: {e}")
             logger.error(f"SQL: {sql}")
             raise
 
+    def run_json(self, query, cache=True):
+        """
+        Execute a ParquetQuery and return (JSON array bytes, row count)
+
+        See query_json(); use with json_data_response() in the analytics views.
+        """
+        sql, params = query.build(self.resolve_path)
+        return self.query_json(sql, params, cache_sources=query.sources if cache else None)
+
+    def run(self, query, cache=True):
+        """
+        Execute a ParquetQuery (services/duckdb_query.py) with bound parameters
+
+        The Parquet source is resolved to the local mirror when current, and
+        the result is cached against the source's ETag unless cache=False.
+
+        Returns:
+            list: Query results as list of dictionaries
+        """
+        sql, params = query.build(self.resolve_path)
+        return self.query(sql, params, cache_sources=query.sources if cache else None)
+
     def query_dataframe(self, sql, params=None):
         """
         Execute a SQL query and return results as a pandas DataFrame
@@ -95,14 +662,12 @@ class DuckDBClient:
             pandas.DataFrame: Query results
         """
         try:
-            conn = self.get_connection()
-
-            if params:
-                result = conn.execute(sql, params).fetchdf()
-            else:
-                result = conn.execute(sql).fetchdf()
+            with self.connection() as conn:
+                if params:
+                    result = conn.execute(sql, params).fetchdf()
+                else:
+                    result = conn.execute(sql).fetchdf()
 
-            conn.close()
             return result
 
         except Exception as e:
@@ -126,15 +691,14 @@ class DuckDBClient:
         Get schema information for a Parquet file
 
         Args:
-            parquet_path (str): S3 path or local path to Parquet file
+            parquet_path (str): S3 path or local path to Parquet file or dataset
 
         Returns:
             list: Column information
         """
         try:
-            conn = self.get_connection()
-            result = conn.execute(f"DESCRIBE SELECT * FROM '{parquet_path}'").fetchdf()
-            conn.close()
+            with self.connection() as conn:
+                result = conn.execute(f"DESCRIBE SELECT * FROM {read_parquet_sql(self.resolve_path(parquet_path))}").fetchdf()
             return result.to_dict('records')
         except Exception as e:
             logger.error(f"Error getting table info: {e}")
@@ -145,15 +709,14 @@ class DuckDBClient:
         Get record count for a Parquet file
 
         Args:
-            parquet_path (str): S3 path or local path to Parquet file
+            parquet_path (str): S3 path or local path to Parquet file or dataset
 
         Returns:
             int: Number of records
         """
         try:
-            conn = self.get_connection()
-            result = conn.execute(f"SELECT COUNT(*) as count FROM '{parquet_path}'").fetchone()
-            conn.close()
+            with self.connection() as conn:
+                result = conn.execute(f"SELECT COUNT(*) as count FROM {read_parquet_sql(self.resolve_path(parquet_path))}").fetchone()
             return result[0] if result else 0
         except Exception as e:
             logger.error(f"Error counting records: {e}")
@@ -0,0 +1,273 @@
+"""
+DuckDB Query Builder - Parameterized SELECT statements over Parquet files
+
+Builds SQL with `?` placeholders and a matching parameter list for
+DuckDBClient.query, so request values are always bound, never interpolated.
+Identical filters produce identical SQL text regardless of the values,
+which keeps statements stable for DuckDB and for the result cache.
+
+Only the Parquet path (server-side constant) and column/expression text
+written in code end up in the SQL. Column names passed at runtime (e.g. a
+sort field from the query string) must be whitelisted via `allowed`.
+
+A source ending in '/' is a hive-partitioned dataset (directory or S3
+prefix). With a HivePartitioning, date filters on its month column also
+filter the year/month partition columns, so DuckDB only opens the files
+for the months a query can match.
+
+Example:
+    query = (
+        ParquetQuery(PO_DATASET_PATH, PO_PARTITIONING)
+        .select('po_branch AS branch', 'COUNT(*) AS order_count')
+        .where_equals('po_branch', branch)
+        .group_by('po_branch')
+        .limit(20)
+    )
+    results = duckdb_client.run(query)
+"""
+
+import re
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
+
+_IDENTIFIER = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*$')
+
+Number = Union[int, float, Decimal]
+
+
+def _identifier(name: str, allowed: Optional[Sequence[str]] = None) -> str:
+    if allowed is not None and name not in allowed:
+        raise ValueError(f"Unsupported column: {name}")
+    if not _IDENTIFIER.match(name):
+        raise ValueError(f"Invalid column name: {name}")
+    return name
+
+
+def _escape_like(text: str) -> str:
+    return text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def parse_date(value: Union[str, date]) -> date:
+    """'YYYY-MM-DD' (or a date) -> date; ValueError on anything else"""
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return date.fromisoformat(str(value).strip())
+
+
+def months_before(day: date, months: int) -> date:
+    """Same day `months` months earlier, clamped to month end (like DuckDB's date - to_months)"""
+    total = day.year * 12 + day.month - 1 - months
+    year, month = divmod(total, 12)
+    month += 1
+    next_month = date(year + month // 12, month % 12 + 1, 1)
+    last_day = (next_month - date.resolution).day
+    return date(year, month, min(day.day, last_day))
+
+
+def parse_number(value: Union[str, Number]) -> float:
+    """Numeric query-string value -> float; ValueError on anything else"""
+    number = float(value)
+    if number != number or number in (float('inf'), float('-inf')):
+        raise ValueError(f"Invalid number: {value}")
+    return number
+
+
+def _quote(text: str) -> str:
+    return "'" + text.replace("'", "''") + "'"
+
+
+class HivePartitioning:
+    """
+    Partition columns of a hive-partitioned dataset
+
+    Args:
+        types: Partition column -> DuckDB type. Declared rather than
+            auto-detected, so e.g. company_code=100 stays a VARCHAR.
+        month_column: Date column the dataset is partitioned by through
+            integer `year` and `month` partition columns (optional)
+    """
+
+    def __init__(self, types: Dict[str, str], month_column: Optional[str] = None):
+        self.types = types
+        self.month_column = month_column
+
+    def options(self) -> str:
+        types = ', '.join(f"{_quote(name)}: {sql_type}" for name, sql_type in self.types.items())
+        return f"hive_partitioning = true, hive_types = {{{types}}}"
+
+
+def read_parquet_sql(path: Union[str, List[str]], partitioning: Optional[HivePartitioning] = None) -> str:
+    """
+    FROM-clause expression reading a Parquet file or hive-partitioned dataset
+
+    Args:
+        path: File path, dataset path ending in '/', or the explicit file
+            list of a dataset (as returned by the local mirror)
+        partitioning: Partition column types (auto-detected when omitted)
+    """
+    if isinstance(path, str) and not path.endswith('/'):
+        return _quote(path)
+
+    files = _quote(path + '**/*.parquet') if isinstance(path, str) else '[' + ', '.join(_quote(p) for p in path) + ']'
+    options = partitioning.options() if partitioning else 'hive_partitioning = true'
+    return f"read_parquet({files}, {options})"
+
+
+class ParquetQuery:
+    """Fluent builder for a parameterized SELECT over one Parquet source"""
+
+    def __init__(self, source: str, partitioning: Optional[HivePartitioning] = None):
+        self.source = source
+        self.partitioning = partitioning
+        self._ctes: List[Tuple[str, 'ParquetQuery']] = []
+        self._from: Optional[str] = None
+        self._select: List[str] = []
+        self._where: List[Tuple[str, List[Any]]] = []
+        self._group_by: List[str] = []
+        self._having: List[Tuple[str, List[Any]]] = []
+        self._order_by: List[str] = []
+        self._limit: Optional[int] = None
+
+    # -- clauses ---------------------------------------------------------
+
+    def with_cte(self, name: str, query: 'ParquetQuery') -> 'ParquetQuery':
+        """Add `WITH name AS (query)` and select FROM it instead of the Parquet file"""
+        self._ctes.append((_identifier(name), query))
+        self._from = name
+        return self
+
+    def select(self, *expressions: str) -> 'ParquetQuery':
+        self._select.extend(expressions)
+        return self
+
+    def where(self, clause: str, *params: Any) -> 'ParquetQuery':
+        """Raw condition written in code, with `?` for each bound value"""
+        if clause.count('?') != len(params):
+            raise ValueError(f"Placeholder count does not match params: {clause}")
+        self._where.append((clause, list(params)))
+        return self
+
+    def where_not_null(self, *columns: str) -> 'ParquetQuery':
+        for column in columns:
+            self.where(f"{_identifier(column)} IS NOT NULL")
+        return self
+
+    def where_equals(self, column: str, value: Any) -> 'ParquetQuery':
+        return self.where(f"{_identifier(column)} = ?", value)
+
+    def where_contains(self, column: str, text: str) -> 'ParquetQuery':
+        """Substring match (LIKE '%text%'); wildcards in text match literally"""
+        return self.where(f"{_identifier(column)} LIKE ? ESCAPE '\\'", f"%{_escape_like(text)}%")
+
+    def where_at_least(self, column: str, value: Union[str, Number]) -> 'ParquetQuery':
+        return self.where(f"{_identifier(column)} >= ?", parse_number(value))
+
+    def where_at_most(self, column: str, value: Union[str, Number]) -> 'ParquetQuery':
+        return self.where(f"{_identifier(column)} <= ?", parse_number(value))
+
+    def where_on_or_after(self, column: str, value: Union[str, date]) -> 'ParquetQuery':
+        day = parse_date(value)
+        self._where_month_partition(column, '>=', day)
+        return self.where(f"{_identifier(column)} >= ?", day)
+
+    def where_on_or_before(self, column: str, value: Union[str, date]) -> 'ParquetQuery':
+        day = parse_date(value)
+        self._where_month_partition(column, '<=', day)
+        return self.where(f"{_identifier(column)} <= ?", day)
+
+    def _where_month_partition(self, column: str, operator: str, day: date):
+        # Redundant with the date condition, but only references partition
+        # columns, so DuckDB can evaluate it per file and skip other months
+        if self.partitioning is not None and column == self.partitioning.month_column and self._from is None:
+            self.where(f"year * 100 + month {operator} ?", day.year * 100 + day.month)
+
+    def group_by(self, *expressions: str) -> 'ParquetQuery':
+        self._group_by.extend(expressions)
+        return self
+
+    def having(self, clause: str, *params: Any) -> 'ParquetQuery':
+        if clause.count('?') != len(params):
+            raise ValueError(f"Placeholder count does not match params: {clause}")
+        self._having.append((clause, list(params)))
+        return self
+
+    def order_by(self, column: str, descending: bool = False, allowed: Optional[Sequence[str]] = None) -> 'ParquetQuery':
+        """Order by a column/alias; pass `allowed` when column comes from the request"""
+        self._order_by.append(f"{_identifier(column, allowed)}{' DESC' if descending else ''}")
+        return self
+
+    def order_by_expression(self, expression: str) -> 'ParquetQuery':
+        """Order by an expression written in code (e.g. 'branch, rank')"""
+        self._order_by.append(expression)
+        return self
+
+    def limit(self, n: Union[str, int]) -> 'ParquetQuery':
+        n = int(n)
+        if n < 0:
+            raise ValueError(f"Invalid limit: {n}")
+        self._limit = n
+        return self
+
+    # -- output ----------------------------------------------------------
+
+    @property
+    def sources(self) -> List[str]:
+        """Parquet files/datasets the statement reads (for result cache keys)"""
+        sources = [self.source] if self._from is None else []
+        for _, cte in self._ctes:
+            sources.extend(s for s in cte.sources if s not in sources)
+        return sources
+
+    def build(self, resolve=None) -> Tuple[str, List[Any]]:
+        """
+        Render (sql, params)
+
+        Args:
+            resolve: Optional callable mapping the Parquet source to the path
+                (or dataset file list) DuckDB should read, e.g.
+                DuckDBClient.resolve_path
+        """
+        params: List[Any] = []
+        parts = []
+
+        if self._ctes:
+            rendered = []
+            for name, cte in self._ctes:
+                cte_sql, cte_params = cte.build(resolve)
+                rendered.append(f"{name} AS (\n{cte_sql}\n)")
+                params.extend(cte_params)
+            parts.append('WITH ' + ',\n'.join(rendered))
+
+        if self._from is not None:
+            from_clause = self._from
+        else:
+            path = resolve(self.source) if resolve else self.source
+            from_clause = read_parquet_sql(path, self.partitioning)
+
+        parts.append('SELECT ' + ', '.join(self._select or ['*']))
+        parts.append(f'FROM {from_clause}')
+
+        if self._where:
+            parts.append('WHERE ' + ' AND '.join(clause for clause, _ in self._where))
+            for _, clause_params in self._where:
+                params.extend(clause_params)
+
+        if self._group_by:
+            parts.append('GROUP BY ' + ', '.join(self._group_by))
+
+        if self._having:
+            parts.append('HAVING ' + ' AND '.join(clause for clause, _ in self._having))
+            for _, clause_params in self._having:
+                params.extend(clause_params)
+
+        if self._order_by:
+            parts.append('ORDER BY ' + ', '.join(self._order_by))
+
+        if self._limit is not None:
+            parts.append('LIMIT ?')
+            params.append(self._limit)
+
+        return '\n'.join(parts), params
@@ -6,13 +6,23 @@ Redis token management, and error handling for all business entities.
 """
 
 import requests
-import json
 import logging
 import base64
 import time
-from typing import Optional, Dict, Any, Union
+import copy
+import threading
+import contextvars
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Optional, Dict, Any, Union, Tuple, List, Callable, Iterable, Iterator
+from requests.adapters import HTTPAdapter
 from django.conf import settings
 from decouple import config
+from .token_store import get_token_store
+from .erp_tracing import get_tracer
+from .erp_metrics import ERPMetrics
+from .erp_resilience import CircuitBreaker, RetryBudget, RequestBudget, parse_retry_after
 
 logger = logging.getLogger(__name__)
 
@@ -20,6 +30,271 @@ class ERPClientError(Exception):
     """Custom exception for ERP client errors"""
     pass
 
+class ERPCircuitOpenError(ERPClientError):
+    """Raised without contacting the ERP when its host circuit is open"""
+    pass
+
+class ERPDeadlineExceeded(ERPClientError):
+    """Raised when the view's request budget runs out before an ERP call can finish"""
+    pass
+
+# Request budget of the view currently being served (see ERPClient.request_budget)
+_current_budget: contextvars.ContextVar[Optional[RequestBudget]] = contextvars.ContextVar('erp_request_budget', default=None)
+
+class ERPResponseCache:
+    """
+    Read-through LRU cache for idempotent ERP entity lookups
+
+    Only single-entity GETs (e.g. /Customers/{id}) in a configured endpoint
+    family are cached. Each family has its own TTL, keys are scoped by ERP
+    base URL and port, and any write to a family drops that family's
+    entries for the same host.
+    """
+
+    def __init__(self, ttls: Dict[str, int], max_entries: int = 2048, enabled: bool = True):
+        self.ttls = ttls
+        self.max_entries = max_entries
+        self.enabled = enabled
+        self._entries: "OrderedDict[Tuple, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {family: {'hits': 0, 'misses': 0} for family in ttls}
+        self._evictions = 0
+        self._invalidations = 0
+
+    @staticmethod
+    def endpoint_family(endpoint: str) -> Tuple[str, bool]:
+        """
+        Split an endpoint into its family and whether it addresses one entity
+
+        '/Customers/123' -> ('Customers', True), '/Customers' -> ('Customers', False)
+        """
+        path = endpoint.split('?', 1)[0].strip('/')
+        segments = path.split('/') if path else []
+        if not segments:
+            return '', False
+        return segments[0], len(segments) > 1
+
+    def key_for(
+        self,
+        method: str,
+        company_api_base: str,
+        port: int,
+        endpoint: str,
+        params: Optional[Dict] = None
+    ) -> Optional[Tuple]:
+        """Return the cache key for a request, or None if it is not cacheable"""
+        if not self.enabled or method.upper() != 'GET' or params:
+            return None
+
+        family, is_entity = self.endpoint_family(endpoint)
+        if not is_entity or family not in self.ttls:
+            return None
+
+        return (company_api_base, int(port), family, endpoint)
+
+    def get(self, key: Tuple) -> Optional[Any]:
+        """Get a cached response (a copy, so callers may mutate it)"""
+        family = key[2]
+        now = time.monotonic()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(key)
+                self._stats[family]['hits'] += 1
+                value = entry[1]
+            else:
+                if entry is not None:
+                    del self._entries[key]
+                self._stats[family]['misses'] += 1
+                return None
+
+        return copy.deepcopy(value)
+
+    def set(self, key: Tuple, value: Any):
+        """Store a response with its family TTL, evicting least recently used entries"""
+        expires_at = time.monotonic() + self.ttls[key[2]]
+
+        with self._lock:
+            self._entries[key] = (expires_at, copy.deepcopy(value))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._evictions += 1
+
+    def invalidate(
+        self,
+        company_api_base: Optional[str] = None,
+        port: Optional[int] = None,
+        endpoint: Optional[str] = None
+    ) -> int:
+        """
+        Drop cached entries, optionally limited to one host and/or endpoint family
+
+        Returns:
+            Number of entries removed
+        """
+        family = self.endpoint_family(endpoint)[0] if endpoint else None
+
+        with self._lock:
+            doomed = [
+                key for key in self._entries
+                if (company_api_base is None or key[0] == company_api_base)
+                and (port is None or key[1] == int(port))
+                and (family is None or key[2] == family)
+            ]
+            for key in doomed:
+                del self._entries[key]
+            self._invalidations += len(doomed)
+
+        return len(doomed)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Hit/miss counters and hit rate per endpoint family"""
+        with self._lock:
+            families = {}
+            total_hits = 0
+            total_lookups = 0
+            for family, counts in self._stats.items():
+                lookups = counts['hits'] + counts['misses']
+                families[family] = {
+                    'ttl_seconds': self.ttls[family],
+                    'hits': counts['hits'],
+                    'misses': counts['misses'],
+                    'hit_rate': round(counts['hits'] / lookups, 4) if lookups else 0.0
+                }
+                total_hits += counts['hits']
+                total_lookups += lookups
+
+            return {
+                'enabled': self.enabled,
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'evictions': self._evictions,
+                'invalidations': self._invalidations,
+                'hit_rate': round(total_hits / total_lookups, 4) if total_lookups else 0.0,
+                'families': families
+            }
+
+
+class ERPTokenCache:
+    """
+    Short-lived in-process cache of ERP session tokens
+
+    Redis stays the source of truth across gunicorn workers; this only saves
+    the Redis round trip on the hot path. Entries are served for `ttl`
+    seconds, and once they are within `refresh_ahead` seconds of expiring the
+    next read triggers a background reload from Redis while the current
+    token keeps being served. The loader takes a list of keys, so misses and
+    refreshes for several tokens cost one Redis round trip.
+    """
+
+    def __init__(
+        self,
+        loader: Callable[[List[str]], Dict[str, Optional[str]]],
+        ttl: int = 30,
+        refresh_ahead: int = 5,
+        enabled: bool = True
+    ):
+        self.loader = loader
+        self.ttl = ttl
+        self.refresh_ahead = min(refresh_ahead, ttl)
+        self.enabled = enabled and ttl > 0
+        self._entries: Dict[str, Tuple[float, str]] = {}
+        self._refreshing = set()
+        self._lock = threading.Lock()
+        self._stats = {
+            'local_hits': 0,
+            'local_misses': 0,
+            'background_refreshes': 0,
+            'invalidations': 0
+        }
+
+    def get(self, key: str) -> Optional[str]:
+        """Get a token, reading through to Redis on a miss"""
+        return self.get_many([key])[key]
+
+    def get_many(self, keys: List[str]) -> Dict[str, Optional[str]]:
+        """Get several tokens, loading all local misses in one Redis round trip"""
+        keys = list(dict.fromkeys(keys))
+        if not self.enabled:
+            loaded = self.loader(keys)
+            return {key: loaded.get(key) for key in keys}
+
+        now = time.monotonic()
+        tokens: Dict[str, Optional[str]] = {}
+        missing = []
+        refresh = []
+
+        with self._lock:
+            for key in keys:
+                entry = self._entries.get(key)
+                if entry is not None and entry[0] > now:
+                    self._stats['local_hits'] += 1
+                    if entry[0] - now <= self.refresh_ahead and key not in self._refreshing:
+                        self._refreshing.add(key)
+                        refresh.append(key)
+                    tokens[key] = entry[1]
+                else:
+                    self._stats['local_misses'] += 1
+                    missing.append(key)
+
+        if refresh:
+            threading.Thread(target=self._refresh, args=(refresh,), daemon=True, name='erp-token-refresh').start()
+
+        if missing:
+            loaded = self.loader(missing)
+            for key in missing:
+                token = loaded.get(key)
+                if token is not None:
+                    self.set(key, token)
+                tokens[key] = token
+
+        return {key: tokens[key] for key in keys}
+
+    def _refresh(self, keys: List[str]):
+        """Reload tokens from Redis in the background"""
+        try:
+            loaded = self.loader(keys)
+            with self._lock:
+                self._stats['background_refreshes'] += len(keys)
+            for key in keys:
+                token = loaded.get(key)
+                if token is not None:
+                    self.set(key, token)
+                else:
+                    self.invalidate(key)
+        finally:
+            with self._lock:
+                self._refreshing.difference_update(keys)
+
+    def set(self, key: str, token: str):
+        """Cache a token locally (used after this worker writes it to Redis)"""
+        if not self.enabled:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, token)
+
+    def invalidate(self, key: str):
+        """Forget a token so the next read goes back to Redis"""
+        with self._lock:
+            if self._entries.pop(key, None) is not None:
+                self._stats['invalidations'] += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Local hit/miss counters; every local hit is a Redis call avoided"""
+        with self._lock:
+            lookups = self._stats['local_hits'] + self._stats['local_misses']
+            return {
+                'enabled': self.enabled,
+                'ttl_seconds': self.ttl,
+                'entries': len(self._entries),
+                **self._stats,
+                'redis_calls_avoided': self._stats['local_hits'] - self._stats['background_refreshes'],
+                'hit_rate': round(self._stats['local_hits'] / lookups, 4) if lookups else 0.0
+            }
+
+
 class ERPClient:
     """
     Core ERP client that handles authentication and API communication
@@ -28,87 +303,325 @@ class ERPClient:
     """
 
     def __init__(self):
-        # Upstash Redis REST API configuration (same as Node.js backend)
-        self.redis_rest_url = config('UPSTASH_REDIS_REST_URL', default=None)
-        self.redis_rest_token = config('UPSTASH_REDIS_REST_TOKEN', default=None)
+        # Token store: native pooled Redis, or Upstash REST API (same as Node.js backend)
+        self.token_store = get_token_store()
 
-        if self.redis_rest_url and self.redis_rest_token:
-            logger.info("Using Upstash Redis REST API for ERP token caching")
+        if self.token_store.configured:
+            logger.info(f"Using {self.token_store.name} token store for ERP token caching")
         else:
-            logger.warning("Upstash Redis not configured, ERP tokens will not be cached")
+            logger.warning("Redis not configured, ERP tokens will not be cached")
+
+        self.default_timeout = config('ERP_READ_TIMEOUT', default=30, cast=float)
+        self.connect_timeout = config('ERP_CONNECT_TIMEOUT', default=5, cast=float)
+
+        # Fail-fast limits: total time per make_erp_request (all attempts and
+        # backoff), per-host circuit breakers and a worker-wide retry budget
+        self.request_deadline = config('ERP_REQUEST_DEADLINE', default=45, cast=float)
+        self.min_attempt_time = config('ERP_MIN_ATTEMPT_TIME', default=1, cast=float)
+        # Default budget for views that chain several ERP calls; keep it well
+        # under the gunicorn worker timeout (120s) so partial results get out
+        self.view_deadline = config('ERP_VIEW_DEADLINE', default=25, cast=float)
+        self.circuit_failure_threshold = config('ERP_CIRCUIT_FAILURE_THRESHOLD', default=5, cast=int)
+        self.circuit_reset_timeout = config('ERP_CIRCUIT_RESET_TIMEOUT', default=30, cast=float)
+        self.retry_budget = RetryBudget(
+            ratio=config('ERP_RETRY_BUDGET_RATIO', default=0.2, cast=float),
+            min_per_second=config('ERP_RETRY_BUDGET_MIN_PER_SECOND', default=1, cast=float)
+        )
+        self._circuit_breakers: Dict[Tuple[str, int], CircuitBreaker] = {}
+
+        # Pooled keep-alive HTTP sessions, one per (company_api_base, port)
+        self.pool_connections = config('ERP_POOL_CONNECTIONS', default=4, cast=int)
+        self.pool_maxsize = config('ERP_POOL_MAXSIZE', default=16, cast=int)
+        self.pool_block = config('ERP_POOL_BLOCK', default=True, cast=bool)
+        self.keep_alive = config('ERP_KEEP_ALIVE', default=True, cast=bool)
+
+        # Concurrency limits for fan-out ERP lookups
+        self.max_concurrency_per_host = config('ERP_MAX_CONCURRENCY_PER_HOST', default=self.pool_maxsize, cast=int)
+        self.fan_out_workers = config('ERP_FAN_OUT_WORKERS', default=8, cast=int)
+
+        # Local token cache in front of Redis (source of truth across workers)
+        self.token_cache = ERPTokenCache(
+            loader=self._redis_get_many,
+            ttl=config('ERP_TOKEN_LOCAL_TTL', default=30, cast=int),
+            refresh_ahead=config('ERP_TOKEN_REFRESH_AHEAD', default=5, cast=int),
+            enabled=config('ERP_TOKEN_LOCAL_CACHE', default=True, cast=bool)
+        )
+
+        # Per-endpoint latency histograms, retry/error counters and bytes
+        self.metrics = ERPMetrics()
+
+        # Sampled, redacted request tracing (replaces per-call debug printing)
+        self.tracer = get_tracer()
+
+        # Read-through cache for slowly-changing reference entities
+        self.response_cache = ERPResponseCache(
+            ttls={
+                'Branches': config('ERP_CACHE_TTL_BRANCHES', default=3600, cast=int),
+                'Customers': config('ERP_CACHE_TTL_CUSTOMERS', default=600, cast=int),
+                'Users': config('ERP_CACHE_TTL_USERS', default=300, cast=int),
+                'Vendors': config('ERP_CACHE_TTL_VENDORS', default=600, cast=int),
+            },
+            max_entries=config('ERP_CACHE_MAX_ENTRIES', default=2048, cast=int),
+            enabled=config('ERP_CACHE_ENABLED', default=True, cast=bool)
+        )
 
-        self.default_timeout = 30
+        self._sessions: Dict[Tuple[str, int], requests.Session] = {}
+        self._host_semaphores: Dict[Tuple[str, int], threading.BoundedSemaphore] = {}
+        self._sessions_lock = threading.Lock()
+        self._pool_hits = 0
+        self._pool_misses = 0
 
-    def _redis_get(self, key: str) -> Optional[str]:
+    def _get_session(self, company_api_base: str, port: int) -> requests.Session:
         """
-        Get value from Upstash Redis using REST API
+        Get the pooled HTTP session for an ERP host, creating it on first use
+
+        Each (base URL, port) gets its own requests.Session with an HTTPAdapter
+        so TCP/TLS connections are kept alive and reused across ERP calls.
+        pool_maxsize caps concurrent connections to a single ERP host; with
+        pool_block enabled, extra threads wait for a free connection instead
+        of opening throwaway ones.
+
+        Args:
+            company_api_base: Company's ERP base URL
+            port: ERP port
+
+        Returns:
+            Shared requests.Session for that host
         """
-        if not self.redis_rest_url or not self.redis_rest_token:
-            return None
+        key = (company_api_base, int(port))
 
-        try:
-            url = f"{self.redis_rest_url}/get/{key}"
-            headers = {
-                'Authorization': f'Bearer {self.redis_rest_token}',
-                'Content-Type': 'application/json'
-            }
+        with self._sessions_lock:
+            session = self._sessions.get(key)
+            if session is not None:
+                self._pool_hits += 1
+                return session
 
-            response = requests.get(url, headers=headers, timeout=5)
+            self._pool_misses += 1
 
-            if response.status_code == 200:
-                result = response.json()
-                return result.get('result')
-            return None
+            session = requests.Session()
+            adapter = HTTPAdapter(
+                pool_connections=self.pool_connections,
+                pool_maxsize=self.pool_maxsize,
+                pool_block=self.pool_block
+            )
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            if not self.keep_alive:
+                session.headers['Connection'] = 'close'
 
-        except Exception as e:
-            logger.error(f"Redis GET error for key {key}: {e}")
-            return None
+            self._sessions[key] = session
+            logger.info(f"[ERP] Created pooled session for {company_api_base}:{port} (maxsize={self.pool_maxsize})")
+            return session
 
-    def _redis_set(self, key: str, value: str, ttl: int = 3600) -> bool:
+    def _get_host_semaphore(self, company_api_base: str, port: int) -> threading.BoundedSemaphore:
+        """
+        Get the semaphore that caps in-flight requests to one ERP host
+
+        Shared by every thread in the worker, so concurrent views and
+        fan-out lookups together never exceed max_concurrency_per_host.
         """
-        Set value in Upstash Redis using REST API
+        key = (company_api_base, int(port))
+
+        with self._sessions_lock:
+            semaphore = self._host_semaphores.get(key)
+            if semaphore is None:
+                semaphore = threading.BoundedSemaphore(self.max_concurrency_per_host)
+                self._host_semaphores[key] = semaphore
+            return semaphore
+
+    def _get_circuit_breaker(self, company_api_base: str, port: int) -> CircuitBreaker:
+        """Get the circuit breaker for one ERP host, creating it on first use"""
+        key = (company_api_base, int(port))
+
+        with self._sessions_lock:
+            breaker = self._circuit_breakers.get(key)
+            if breaker is None:
+                breaker = CircuitBreaker(self.circuit_failure_threshold, self.circuit_reset_timeout)
+                self._circuit_breakers[key] = breaker
+            return breaker
+
+    def get_resilience_stats(self) -> Dict[str, Any]:
+        """Circuit breaker state per ERP host and retry budget balance"""
+        with self._sessions_lock:
+            breakers = dict(self._circuit_breakers)
+
+        return {
+            'circuits': {f"{base}:{port}": breaker.get_stats() for (base, port), breaker in breakers.items()},
+            'retry_budget': self.retry_budget.get_stats()
+        }
+
+    @contextmanager
+    def request_budget(self, seconds: Optional[float] = None) -> Iterator[RequestBudget]:
+        """
+        Bound every ERP call made inside the block by one shared deadline
+
+        Usage in a view:
+            with erp_client.request_budget() as budget:
+                ...make ERP calls...
+            partial = budget.exhausted
+
+        Nested blocks never extend an outer deadline. The budget follows
+        calls into fan_out worker threads.
+
+        Args:
+            seconds: Budget in seconds (defaults to ERP_VIEW_DEADLINE)
         """
-        if not self.redis_rest_url or not self.redis_rest_token:
-            return False
+        seconds = self.view_deadline if seconds is None else seconds
+        outer = _current_budget.get()
+        if outer is not None:
+            seconds = min(seconds, outer.remaining())
 
+        budget = RequestBudget(seconds)
+        token = _current_budget.set(budget)
         try:
-            url = f"{self.redis_rest_url}/setex/{key}/{ttl}/{value}"
-            headers = {
-                'Authorization': f'Bearer {self.redis_rest_token}',
-                'Content-Type': 'application/json'
-            }
+            yield budget
+        finally:
+            _current_budget.reset(token)
+            if outer is not None:
+                for _ in range(budget.skipped):
+                    outer.record_skip()
+
+    @staticmethod
+    def current_request_budget() -> Optional[RequestBudget]:
+        """The request budget in effect for this thread, if any"""
+        return _current_budget.get()
+
+    def fan_out(
+        self,
+        func: Callable[[Any], Any],
+        items: Iterable[Any],
+        max_workers: Optional[int] = None
+    ) -> List[Tuple[Any, Optional[Exception]]]:
+        """
+        Run func over items concurrently with a bounded thread pool
 
-            response = requests.post(url, headers=headers, timeout=5)
-            return response.status_code == 200
+        Per-host limits are still enforced inside make_erp_request, so
+        max_workers only bounds how many items are in progress at once.
+        A failing item never affects the others. The caller's request
+        budget (if any) applies inside the worker threads too.
 
-        except Exception as e:
-            logger.error(f"Redis SET error for key {key}: {e}")
-            return False
+        Args:
+            func: Callable taking one item (typically making ERP calls)
+            items: Items to process
+            max_workers: Thread pool size (defaults to ERP_FAN_OUT_WORKERS)
 
-    def _redis_delete(self, key: str) -> bool:
+        Returns:
+            List of (result, exception) tuples in the same order as items
+        """
+        items = list(items)
+        if not items:
+            return []
+
+        workers = min(max_workers or self.fan_out_workers, len(items))
+
+        def run(item):
+            try:
+                return func(item), None
+            except Exception as e:
+                return None, e
+
+        if workers <= 1:
+            return [run(item) for item in items]
+
+        # One context copy per item: a context can only be entered by one thread at a time
+        contexts = [contextvars.copy_context() for _ in items]
+
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='erp-fan-out') as executor:
+            return list(executor.map(lambda ctx, item: ctx.run(run, item), contexts, items))
+
+    def get_pool_stats(self) -> Dict[str, Any]:
         """
-        Delete key from Upstash Redis using REST API
+        Get connection pool statistics for all ERP hosts
+
+        Session hits/misses count lookups of the per-host session.
+        Connection reuse comes from urllib3: every request that did not
+        need a new connection was served by a kept-alive one.
+
+        Returns:
+            Dict with session hit/miss counters and per-host connection stats
         """
-        if not self.redis_rest_url or not self.redis_rest_token:
-            return False
+        with self._sessions_lock:
+            sessions = dict(self._sessions)
+            stats = {
+                'session_hits': self._pool_hits,
+                'session_misses': self._pool_misses,
+                'hosts': {}
+            }
 
-        try:
-            url = f"{self.redis_rest_url}/del/{key}"
-            headers = {
-                'Authorization': f'Bearer {self.redis_rest_token}',
-                'Content-Type': 'application/json'
+        total_connections = 0
+        total_requests = 0
+
+        for (base, port), session in sessions.items():
+            connections = 0
+            host_requests = 0
+            adapter = session.get_adapter(base)
+            pools = adapter.poolmanager.pools
+            for pool_key in pools.keys():
+                pool = pools.get(pool_key)
+                if pool is None:
+                    continue
+                connections += pool.num_connections
+                host_requests += pool.num_requests
+
+            stats['hosts'][f"{base}:{port}"] = {
+                'connections_opened': connections,
+                'requests': host_requests,
+                'connections_reused': max(host_requests - connections, 0)
             }
+            total_connections += connections
+            total_requests += host_requests
 
-            response = requests.post(url, headers=headers, timeout=5)
-            return response.status_code == 200
+        stats['connections_opened'] = total_connections
+        stats['requests'] = total_requests
+        stats['connections_reused'] = max(total_requests - total_connections, 0)
 
-        except Exception as e:
-            logger.error(f"Redis DELETE error for key {key}: {e}")
-            return False
+        return stats
+
+    def close_sessions(self):
+        """Close all pooled ERP sessions and drop their connections"""
+        with self._sessions_lock:
+            sessions = list(self._sessions.values())
+            self._sessions.clear()
+
+        for session in sessions:
+            session.close()
+
+    def _redis_get_many(self, keys: List[str]) -> Dict[str, Optional[str]]:
+        """
+        Get several values from the token store in one round trip (MGET)
+        """
+        return self.token_store.get_many(keys)
+
+    def _redis_set(self, key: str, value: str, ttl: int = 3600) -> bool:
+        """
+        Set value in the token store and keep the local token cache in sync
+        """
+        return self._redis_set_many({key: value}, ttl)
+
+    def _redis_set_many(self, values: Dict[str, str], ttl: int = 3600) -> bool:
+        """
+        Set several values in the token store (pipelined SETEX) and keep the
+        local token cache in sync
+        """
+        if self.token_store.set_many(values, ttl):
+            for key, value in values.items():
+                self.token_cache.set(key, value)
+            return True
+
+        for key in values:
+            self.token_cache.invalidate(key)
+        return False
+
+    def _redis_delete(self, key: str) -> bool:
+        """
+        Delete key from the token store and the local token cache
+        """
+        self.token_cache.invalidate(key)
+        return self.token_store.delete(key)
 
     def get_erp_token(self, user_id: str) -> Optional[str]:
         """
-        Get ERP session token from Redis cache
+        Get ERP session token, from the local token cache or Redis
 
         Args:
             user_id: User ID to lookup token for
@@ -117,13 +630,17 @@ class ERPClient:
             ERP session token or None if not found
         """
         redis_key = f"erpToken:{user_id}"
-        token = self._redis_get(redis_key)
+        token = self.token_cache.get(redis_key)
 
         if token is None:
             logger.error(f"Redis error getting ERP token for user {user_id}: No token found")
 
         return token
 
+    def invalidate_erp_token(self, user_id: str):
+        """Drop the locally cached token for a user (Redis is left untouched)"""
+        self.token_cache.invalidate(f"erpToken:{user_id}")
+
     def refresh_session(
         self,
         refresh_token: str,
@@ -152,7 +669,8 @@ class ERPClient:
 
             logger.info(f"[Session Refresh] Refreshing session for user {user_id}")
 
-            response = requests.post(url, json=payload, timeout=30)
+            session = self._get_session(company_api_base, port)
+            response = session.post(url, json=payload, timeout=30)
             response.raise_for_status()
 
             session_data = response.json()
@@ -252,11 +770,20 @@ class ERPClient:
         data: Optional[Dict] = None,
         params: Optional[Dict] = None,
         port: Optional[int] = None,
-        last_port: Optional[int] = 5000
+        last_port: Optional[int] = 5000,
+        use_cache: bool = True
     ) -> Dict[str, Any]:
         """
         Make authenticated request to ERP system
 
+        GETs of cached reference entities (Branches, Customers, Users,
+        Vendors) are served from response_cache; writes to those endpoint
+        families invalidate it.
+
+        Inside erp_client.request_budget(), timeouts shrink to the time left
+        in the view's budget, and calls that cannot start in time raise
+        ERPDeadlineExceeded without contacting the ERP.
+
         Args:
             user_id: User ID for token lookup
             company_api_base: Company's ERP base URL
@@ -266,11 +793,13 @@ class ERPClient:
             params: Query parameters
             port: Override port (defaults to last_port)
             last_port: Default port to use
+            use_cache: Set False to bypass the response cache for this read
 
         Returns:
             ERP response data
 
         Raises:
+            ERPDeadlineExceeded: If the view's request budget is used up
             ERPClientError: If request fails
         """
 
@@ -286,6 +815,16 @@ class ERPClient:
         final_port = port or last_port
         full_url = f"{company_api_base}:{final_port}{endpoint}"
 
+        cache_key = None
+        if use_cache:
+            cache_key = self.response_cache.key_for(method, company_api_base, final_port, endpoint, params)
+        if cache_key:
+            cached = self.response_cache.get(cache_key)
+            if cached is not None:
+                return cached
+
+        session = self._get_session(company_api_base, final_port)
+
         # Prepare headers (same pattern as Node.js)
         headers = {
             'Authorization': f'SessionToken {requests.utils.unquote(erp_token)}',
@@ -293,62 +832,106 @@ class ERPClient:
             'Content-Type': 'application/json',
         }
 
-        # Retry logic for transient failures (Railway production issue)
+        # Retry logic for transient failures (Railway production issue), bounded
+        # by the per-host circuit breaker, the shared retry budget and an
+        # overall deadline so a down ERP cannot stall worker threads.
         max_retries = 2
         retry_delay = 0.5  # Start with 500ms
+        next_delay = retry_delay
         last_exception = None
+        token_reloaded = False
+        budget_limited = False
+        traced = self.tracer.sample()
+        deadline = time.monotonic() + self.request_deadline
+        breaker = self._get_circuit_breaker(company_api_base, final_port)
+
+        # The view's request budget (if any) caps this call's own deadline
+        budget = _current_budget.get()
+        if budget is not None:
+            if budget.remaining() < self.min_attempt_time:
+                budget.record_skip()
+                self.metrics.record_error(method, endpoint, 'deadline_skipped')
+                raise ERPDeadlineExceeded(
+                    f"Skipped {method} {endpoint}: request budget of {budget.seconds:.0f}s exhausted"
+                )
+            budget.record_call()
+            deadline = min(deadline, budget.deadline)
+
+        self.retry_budget.record_request()
+
+        def can_retry(delay: float) -> bool:
+            if attempt >= max_retries:
+                return False
+            if time.monotonic() + delay + self.min_attempt_time > deadline:
+                logger.warning(f"[ERP] Not retrying {endpoint}: request deadline would be exceeded")
+                return False
+            if not self.retry_budget.try_spend():
+                logger.warning(f"[ERP] Not retrying {endpoint}: retry budget exhausted")
+                return False
+            return True
 
         for attempt in range(max_retries + 1):
+            if not breaker.allow_request():
+                self.metrics.record_error(method, endpoint, 'circuit_open')
+                raise ERPCircuitOpenError(
+                    f"ERP host {company_api_base}:{final_port} is unavailable (circuit open after repeated failures). "
+                    f"Failing fast; next attempt allowed in {breaker.seconds_until_retry():.0f}s."
+                )
+
             try:
                 if attempt > 0:
                     logger.info(f"[ERP] Retry attempt {attempt}/{max_retries} for {endpoint}")
-                    time.sleep(retry_delay)
+                    self.metrics.record_retry(method, endpoint)
+                    time.sleep(next_delay)
                     retry_delay *= 2  # Exponential backoff
+                    next_delay = retry_delay
 
-                logger.info(f"ERP Request: {method} {full_url}")
-                logger.info(f"ERP Headers: {headers}")
-                if data:
-                    logger.info(f"ERP Request Body: {json.dumps(data, indent=2)}")
-                if params:
-                    logger.info(f"ERP Query Params: {params}")
-
-                # Console-style logging for debugging
-                print(f"\n===== ERP API CALL DEBUG =====")
-                print(f"URL: {full_url}")
-                print(f"METHOD: {method}")
-                if data:
-                    # Show key fields for debugging instead of massive JSON
-                    if isinstance(data, dict):
-                        key_fields = {}
-                        for key in ['id', 'FileName', 'DESC.OVRD.NUC', 'keywords', 'description', 'updateKey']:
-                            if key in data:
-                                key_fields[key] = data[key]
-                        print(f"BODY KEY FIELDS: {json.dumps(key_fields, indent=2)}")
-                        print(f"BODY TOTAL FIELDS: {len(data.keys()) if hasattr(data, 'keys') else 'unknown'}")
-                    else:
-                        print(f"BODY: {json.dumps(data, indent=2)}")
-                if params:
-                    print(f"PARAMS: {params}")
-                print(f"================================\n")
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    if budget is not None and budget.expired:
+                        budget.record_skip()
+                        raise ERPDeadlineExceeded(f"Request budget of {budget.seconds:.0f}s exhausted before retrying {full_url}")
+                    raise ERPClientError(f"ERP request deadline of {self.request_deadline}s exceeded: {full_url}")
+
+                # A timeout we shortened to fit the budget says nothing about host health
+                budget_limited = budget is not None and remaining < self.default_timeout
+
+                if traced:
+                    self.tracer.trace_request(method, full_url, headers, data, params, attempt)
 
                 # Track request timing
                 start_time = time.time()
 
-                response = requests.request(
-                    method=method,
-                    url=full_url,
-                    headers=headers,
-                    json=data,
-                    params=params,
-                    timeout=self.default_timeout
-                )
+                with self._get_host_semaphore(company_api_base, final_port):
+                    response = session.request(
+                        method=method,
+                        url=full_url,
+                        headers=headers,
+                        json=data,
+                        params=params,
+                        timeout=(min(self.connect_timeout, remaining), min(self.default_timeout, remaining))
+                    )
 
                 elapsed_ms = (time.time() - start_time) * 1000
 
-                logger.info(f"ERP Response Status: {response.status_code} (took {elapsed_ms:.0f}ms)")
-                logger.info(f"ERP Response Headers: {dict(response.headers)}")
-                if response.content:
-                    logger.info(f"ERP Response Body: {response.text[:1000]}...")
+                request_body = response.request.body if response.request is not None else None
+                self.metrics.observe(
+                    method,
+                    endpoint,
+                    elapsed_ms / 1000,
+                    bytes_sent=len(request_body) if request_body else 0,
+                    bytes_received=len(response.content or b'')
+                )
+
+                # Only server-side failures count against the host's circuit
+                if response.status_code >= 500:
+                    breaker.record_failure()
+                else:
+                    breaker.record_success()
+
+                logger.debug("ERP %s %s -> %s (%.0fms)", method, endpoint, response.status_code, elapsed_ms)
+                if traced:
+                    self.tracer.trace_response(method, full_url, response, elapsed_ms)
 
                 # Log slow requests (might indicate timeout/rate limit issues)
                 if elapsed_ms > 5000:
@@ -357,24 +940,48 @@ class ERPClient:
                 # Check for HTTP errors
                 response.raise_for_status()
 
-                return response.json()
+                # A successful write makes cached reads stale whatever its body
+                if method.upper() != 'GET':
+                    self.response_cache.invalidate(company_api_base, final_port, endpoint)
+
+                # 204 No Content and other empty bodies
+                if not response.content:
+                    return {}
+
+                result = response.json()
+
+                if cache_key:
+                    self.response_cache.set(cache_key, result)
+
+                return result
 
             except requests.exceptions.Timeout as e:
                 last_exception = e
-                if attempt < max_retries:
+                self.metrics.record_error(method, endpoint, 'timeout')
+                if budget_limited and budget.expired:
+                    budget.record_skip()
+                    raise ERPDeadlineExceeded(f"ERP request cut short by the {budget.seconds:.0f}s request budget: {full_url}")
+                breaker.record_failure()
+                if can_retry(next_delay):
                     logger.warning(f"[ERP] Timeout on attempt {attempt + 1}, retrying...")
                     continue
-                raise ERPClientError(f"ERP request timeout after {max_retries + 1} attempts: {full_url}")
+                raise ERPClientError(f"ERP request timeout after {attempt + 1} attempts: {full_url}")
 
             except requests.exceptions.ConnectionError as e:
                 last_exception = e
-                if attempt < max_retries:
+                breaker.record_failure()
+                self.metrics.record_error(method, endpoint, 'connection_error')
+                if can_retry(next_delay):
                     logger.warning(f"[ERP] Connection error on attempt {attempt + 1}, retrying...")
                     continue
-                raise ERPClientError(f"ERP connection error after {max_retries + 1} attempts: {full_url}")
+                raise ERPClientError(f"ERP connection error after {attempt + 1} attempts: {full_url}")
 
             except requests.exceptions.RequestException as e:
                 last_exception = e
+                if hasattr(e, 'response') and e.response is not None:
+                    self.metrics.record_error(method, endpoint, f'http_{e.response.status_code}')
+                else:
+                    self.metrics.record_error(method, endpoint, 'request_error')
 
                 # Don't retry 404s - those are legitimate "not found" responses
                 if hasattr(e, 'response') and e.response is not None and e.response.status_code == 404:
@@ -385,13 +992,31 @@ class ERPClient:
                     )
                     # Fall through to error handling
 
+                # 401 - the locally cached token may be stale. Drop it and retry
+                # once if Redis now holds a different token for this user.
+                elif hasattr(e, 'response') and e.response is not None and e.response.status_code == 401:
+                    self.invalidate_erp_token(user_id)
+                    if attempt < max_retries and not token_reloaded:
+                        token_reloaded = True
+                        fresh_token = self.get_erp_token(user_id)
+                        if fresh_token and fresh_token != erp_token:
+                            erp_token = fresh_token
+                            headers['Authorization'] = f'SessionToken {requests.utils.unquote(erp_token)}'
+                            next_delay = 0
+                            logger.info(f"[ERP] 401 with cached token for {user_id}, retrying with token from Redis")
+                            continue
+
                 # For other errors, only retry if not on last attempt
-                elif attempt < max_retries and hasattr(e, 'response') and e.response is not None:
+                elif hasattr(e, 'response') and e.response is not None:
                     status = e.response.status_code
-                    # Retry on 5xx errors and 429 (rate limit)
+                    # Retry on 5xx errors and 429 (rate limit), honoring Retry-After
                     if status >= 500 or status == 429:
-                        logger.warning(f"[ERP] Status {status} on attempt {attempt + 1}, retrying...")
-                        continue
+                        retry_after = parse_retry_after(e.response.headers.get('Retry-After')) if status == 429 else None
+                        if retry_after is not None:
+                            next_delay = retry_after
+                        if can_retry(next_delay):
+                            logger.warning(f"[ERP] Status {status} on attempt {attempt + 1}, retrying in {next_delay:.1f}s...")
+                            continue
 
                 # If we get here, we're done retrying - raise the error
                 if hasattr(e, 'response') and e.response is not None:
@@ -403,6 +1028,8 @@ class ERPClient:
                         error_msg = f"ERP access denied (403). User '{user_id}' may not have permission for this operation."
                     elif status_code == 404:
                         error_msg = f"ERP endpoint not found (404): {full_url}. Check the API endpoint configuration."
+                    elif status_code == 429:
+                        error_msg = f"ERP rate limit exceeded (429). Please try again shortly."
                     elif status_code >= 500:
                         error_msg = f"ERP server error ({status_code}). The ERP system may be temporarily unavailable."
                     else:
@@ -417,6 +1044,9 @@ class ERPClient:
                 logger.error(error_msg)
                 raise ERPClientError(error_msg)
 
+            finally:
+                breaker.end_probe()
+
     def search_products(
         self,
         user_id: str,
@@ -0,0 +1,186 @@
+"""
+ERP Metrics - Per-endpoint latency histograms and counters for ERPClient
+
+Every ERP call is recorded against its endpoint template, so
+/SalesOrders/S105418530 and /SalesOrders/S105418531 both count toward
+GET /SalesOrders/{id}. Metrics are kept in memory per gunicorn worker and
+exposed as JSON (admin portal) or Prometheus text (/metrics).
+"""
+
+import re
+import threading
+from bisect import bisect_left
+from collections import deque, defaultdict
+from typing import Dict, Any, List, Tuple
+
+# Histogram bucket upper bounds in seconds (Prometheus convention)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+# Recent samples kept per series for p50/p95/p99
+SAMPLE_WINDOW = 1024
+
+# Second-level path segments that name a resource, not an entity ID
+NAMED_RESOURCE_PARENTS = {'UserDefined'}
+
+_DIGIT = re.compile(r'\d')
+
+
+def endpoint_template(endpoint: str) -> str:
+    """
+    Normalize an ERP endpoint to a low-cardinality template
+
+    '/SalesOrders/S105418530'                  -> '/SalesOrders/{id}'
+    '/SalesOrders/S1/PrintInvoice'             -> '/SalesOrders/{id}/PrintInvoice'
+    '/Users/jsmith'                            -> '/Users/{id}'
+    '/UserDefined/PRINT.REVIEW?id=S1.0001'     -> '/UserDefined/PRINT.REVIEW?id'
+    """
+    path, _, query = endpoint.partition('?')
+    segments = [seg for seg in path.split('/') if seg]
+
+    normalized = []
+    for i, seg in enumerate(segments):
+        is_id_position = i % 2 == 1 and segments[i - 1] not in NAMED_RESOURCE_PARENTS
+        if is_id_position or _DIGIT.search(seg) and i > 0:
+            normalized.append('{id}')
+        else:
+            normalized.append(seg)
+
+    template = '/' + '/'.join(normalized)
+    if query:
+        keys = sorted({pair.split('=', 1)[0] for pair in query.split('&') if pair})
+        template += '?' + '&'.join(keys)
+    return template
+
+
+def _percentile(sorted_samples: List[float], pct: float) -> float:
+    if not sorted_samples:
+        return 0.0
+    index = min(int(round(pct / 100 * (len(sorted_samples) - 1))), len(sorted_samples) - 1)
+    return sorted_samples[index]
+
+
+class _Series:
+    """Latency histogram and byte counters for one (method, template)"""
+
+    __slots__ = ('bucket_counts', 'count', 'total_seconds', 'samples', 'bytes_sent', 'bytes_received', 'retries')
+
+    def __init__(self):
+        self.bucket_counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.count = 0
+        self.total_seconds = 0.0
+        self.samples = deque(maxlen=SAMPLE_WINDOW)
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.retries = 0
+
+
+class ERPMetrics:
+    """Thread-safe in-memory metrics registry for ERP calls"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._series: Dict[Tuple[str, str], _Series] = defaultdict(_Series)
+        self._errors: Dict[Tuple[str, str, str], int] = defaultdict(int)
+
+    def observe(self, method: str, endpoint: str, elapsed_seconds: float, bytes_sent: int = 0, bytes_received: int = 0):
+        """Record one completed HTTP exchange (any status)"""
+        key = (method.upper(), endpoint_template(endpoint))
+        bucket = bisect_left(LATENCY_BUCKETS, elapsed_seconds)
+
+        with self._lock:
+            series = self._series[key]
+            series.bucket_counts[bucket] += 1
+            series.count += 1
+            series.total_seconds += elapsed_seconds
+            series.samples.append(elapsed_seconds)
+            series.bytes_sent += bytes_sent
+            series.bytes_received += bytes_received
+
+    def record_retry(self, method: str, endpoint: str):
+        """Record one retry attempt"""
+        key = (method.upper(), endpoint_template(endpoint))
+        with self._lock:
+            self._series[key].retries += 1
+
+    def record_error(self, method: str, endpoint: str, error_class: str):
+        """Record one failed attempt (timeout, connection_error, http_404, ...)"""
+        key = (method.upper(), endpoint_template(endpoint), error_class)
+        with self._lock:
+            self._errors[key] += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        """JSON-friendly view: per-endpoint percentiles (ms), retries, errors and bytes"""
+        with self._lock:
+            series_items = [
+                (key, series.count, series.total_seconds, sorted(series.samples),
+                 series.bytes_sent, series.bytes_received, series.retries)
+                for key, series in self._series.items()
+            ]
+            errors = dict(self._errors)
+
+        endpoints = []
+        for (method, template), count, total, samples, sent, received, retries in series_items:
+            endpoint_errors = {
+                error_class: n for (m, t, error_class), n in errors.items()
+                if m == method and t == template
+            }
+            endpoints.append({
+                'method': method,
+                'endpoint': template,
+                'count': count,
+                'total_ms': round(total * 1000, 1),
+                'avg_ms': round(total * 1000 / count, 1) if count else 0.0,
+                'p50_ms': round(_percentile(samples, 50) * 1000, 1),
+                'p95_ms': round(_percentile(samples, 95) * 1000, 1),
+                'p99_ms': round(_percentile(samples, 99) * 1000, 1),
+                'retries': retries,
+                'errors': endpoint_errors,
+                'bytes_sent': sent,
+                'bytes_received': received
+            })
+
+        # Endpoints that dominate page latency first
+        endpoints.sort(key=lambda e: e['total_ms'], reverse=True)
+        return {'endpoints': endpoints}
+
+    def prometheus_lines(self) -> List[str]:
+        """Render metrics in the Prometheus text exposition format"""
+        with self._lock:
+            series_items = [
+                (key, list(series.bucket_counts), series.count, series.total_seconds,
+                 series.bytes_sent, series.bytes_received, series.retries)
+                for key, series in self._series.items()
+            ]
+            errors = dict(self._errors)
+
+        def labels(method, template, **extra):
+            pairs = [('method', method), ('endpoint', template)] + list(extra.items())
+            return ','.join('{}="{}"'.format(k, str(v).replace('\\', '\\\\').replace('"', '\\"')) for k, v in pairs)
+
+        lines = [
+            '# HELP erp_request_duration_seconds ERP HTTP request latency by endpoint template',
+            '# TYPE erp_request_duration_seconds histogram'
+        ]
+        for (method, template), bucket_counts, count, total, _, _, _ in series_items:
+            cumulative = 0
+            for bound, n in zip(LATENCY_BUCKETS, bucket_counts):
+                cumulative += n
+                lines.append(f'erp_request_duration_seconds_bucket{{{labels(method, template, le=bound)}}} {cumulative}')
+            lines.append(f'erp_request_duration_seconds_bucket{{{labels(method, template, le="+Inf")}}} {count}')
+            lines.append(f'erp_request_duration_seconds_sum{{{labels(method, template)}}} {total:.6f}')
+            lines.append(f'erp_request_duration_seconds_count{{{labels(method, template)}}} {count}')
+
+        lines += ['# HELP erp_request_retries_total ERP request retry attempts', '# TYPE erp_request_retries_total counter']
+        for (method, template), _, _, _, _, _, retries in series_items:
+            lines.append(f'erp_request_retries_total{{{labels(method, template)}}} {retries}')
+
+        lines += ['# HELP erp_request_errors_total Failed ERP request attempts by error class', '# TYPE erp_request_errors_total counter']
+        for (method, template, error_class), n in errors.items():
+            lines.append(f'erp_request_errors_total{{{labels(method, template, error_class=error_class)}}} {n}')
+
+        lines += ['# HELP erp_request_bytes_total ERP bytes transferred', '# TYPE erp_request_bytes_total counter']
+        for (method, template), _, _, _, sent, received, _ in series_items:
+            lines.append(f'erp_request_bytes_total{{{labels(method, template, direction="sent")}}} {sent}')
+            lines.append(f'erp_request_bytes_total{{{labels(method, template, direction="received")}}} {received}')
+
+        return lines
@@ -0,0 +1,236 @@
+"""
+ERP Resilience - Circuit breakers and retry budget for ERPClient
+
+When an ERP host is down, retrying every call with fixed sleeps ties up
+gunicorn worker threads for the full timeout of every attempt. These
+helpers let make_erp_request fail fast instead:
+
+- CircuitBreaker (one per ERP host): after N consecutive failures the
+  circuit opens and calls are rejected immediately. After reset_timeout a
+  single probe request is let through (half-open); success closes the
+  circuit, failure re-opens it.
+- RetryBudget (shared by the whole worker): retries may only use a fraction
+  of recent request volume, so a struggling ERP is not hit with 3x load.
+- RequestBudget (one per view request): a wall-clock deadline shared by every
+  ERP call a view makes, so a page that chains many calls answers on time
+  with partial results instead of hitting the gunicorn timeout.
+"""
+
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+from typing import Optional, Dict, Any
+
+
+class CircuitBreaker:
+    """Closed / open / half-open circuit breaker for one ERP host"""
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._state = self.CLOSED
+        self._consecutive_failures = 0
+        self._opened_at = 0.0
+        self._probe_started_at: Optional[float] = None
+        self._probe_thread: Optional[int] = None
+        self._lock = threading.Lock()
+        self._stats = {'opened': 0, 'rejected': 0}
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._current_state(time.monotonic())
+
+    def _current_state(self, now: float) -> str:
+        if self._state == self.OPEN and now - self._opened_at >= self.reset_timeout:
+            self._state = self.HALF_OPEN
+            self._probe_started_at = None
+        return self._state
+
+    def allow_request(self) -> bool:
+        """True if a request may be sent now (half-open lets one probe through)"""
+        now = time.monotonic()
+        with self._lock:
+            state = self._current_state(now)
+
+            if state == self.CLOSED:
+                return True
+
+            if state == self.HALF_OPEN:
+                # One probe at a time; a probe that never reported back is
+                # abandoned after reset_timeout so the circuit cannot wedge.
+                if self._probe_started_at is None or now - self._probe_started_at >= self.reset_timeout:
+                    self._probe_started_at = now
+                    self._probe_thread = threading.get_ident()
+                    return True
+
+            self._stats['rejected'] += 1
+            return False
+
+    def seconds_until_retry(self) -> float:
+        with self._lock:
+            if self._state != self.OPEN:
+                return 0.0
+            return max(self.reset_timeout - (time.monotonic() - self._opened_at), 0.0)
+
+    def end_probe(self):
+        """
+        Release this thread's half-open probe if it ended without a verdict
+
+        A probe cut short by a request deadline or budget reports neither
+        success nor failure; releasing it lets the next request probe at once
+        instead of waiting out reset_timeout.
+        """
+        with self._lock:
+            if self._probe_thread == threading.get_ident():
+                self._probe_started_at = None
+                self._probe_thread = None
+
+    def record_success(self):
+        with self._lock:
+            self._state = self.CLOSED
+            self._consecutive_failures = 0
+            self._probe_started_at = None
+            self._probe_thread = None
+
+    def record_failure(self):
+        with self._lock:
+            self._consecutive_failures += 1
+            if self._state == self.HALF_OPEN or self._consecutive_failures >= self.failure_threshold:
+                if self._state != self.OPEN:
+                    self._stats['opened'] += 1
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+                self._probe_started_at = None
+                self._probe_thread = None
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'state': self._current_state(time.monotonic()),
+                'consecutive_failures': self._consecutive_failures,
+                **self._stats
+            }
+
+
+class RetryBudget:
+    """
+    Token-bucket retry budget shared by all ERP calls in a worker
+
+    Every request deposits `ratio` tokens and every retry spends one, so
+    retries stay below roughly ratio * request volume. `min_per_second`
+    tokens are added over time so low-traffic workers can still retry.
+    """
+
+    def __init__(self, ratio: float = 0.2, min_per_second: float = 1.0, max_balance: float = 20):
+        self.ratio = ratio
+        self.min_per_second = min_per_second
+        self.max_balance = max_balance
+        self._balance = max_balance
+        self._last_refill = time.monotonic()
+        self._lock = threading.Lock()
+        self._stats = {'granted': 0, 'denied': 0}
+
+    def _refill(self, now: float):
+        elapsed = now - self._last_refill
+        self._last_refill = now
+        self._balance = min(self._balance + elapsed * self.min_per_second, self.max_balance)
+
+    def record_request(self):
+        with self._lock:
+            self._refill(time.monotonic())
+            self._balance = min(self._balance + self.ratio, self.max_balance)
+
+    def try_spend(self) -> bool:
+        """Take one retry token; False when the budget is exhausted"""
+        with self._lock:
+            self._refill(time.monotonic())
+            if self._balance >= 1:
+                self._balance -= 1
+                self._stats['granted'] += 1
+                return True
+            self._stats['denied'] += 1
+            return False
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            self._refill(time.monotonic())
+            return {'balance': round(self._balance, 2), **self._stats}
+
+
+class RequestBudget:
+    """
+    Deadline shared by all ERP calls made while serving one view request
+
+    ERPClient shrinks each call's timeouts to the remaining budget and skips
+    calls that cannot start in time. Views check `exhausted` / `skipped` to
+    report partial results.
+    """
+
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+        self.started_at = time.monotonic()
+        self.deadline = self.started_at + seconds
+        self._lock = threading.Lock()
+        self._calls = 0
+        self._skipped = 0
+
+    def remaining(self) -> float:
+        return max(self.deadline - time.monotonic(), 0.0)
+
+    @property
+    def expired(self) -> bool:
+        return time.monotonic() >= self.deadline
+
+    @property
+    def skipped(self) -> int:
+        with self._lock:
+            return self._skipped
+
+    @property
+    def exhausted(self) -> bool:
+        """True once any ERP call was skipped or cut short by the deadline"""
+        return self.skipped > 0
+
+    def record_call(self):
+        with self._lock:
+            self._calls += 1
+
+    def record_skip(self):
+        with self._lock:
+            self._skipped += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'budget_seconds': self.seconds,
+                'elapsed_seconds': round(time.monotonic() - self.started_at, 3),
+                'erp_calls_attempted': self._calls,
+                'erp_calls_skipped': self._skipped,
+                'partial': self._skipped > 0
+            }
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Parse a Retry-After header (delta-seconds or HTTP date) into seconds"""
+    if not value:
+        return None
+
+    value = value.strip()
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+
+    try:
+        retry_at = parsedate_to_datetime(value)
+        if retry_at.tzinfo is None:
+            retry_at = retry_at.replace(tzinfo=timezone.utc)
+        return max((retry_at - datetime.now(timezone.utc)).total_seconds(), 0.0)
+    except (TypeError, ValueError):
+        return None
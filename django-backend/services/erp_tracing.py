@@ -0,0 +1,116 @@
+"""
+ERP Request Tracing - Sampled, redacted request/response traces for ERPClient
+
+Replaces the old unconditional debug printing in make_erp_request. A trace is
+emitted only for sampled requests, and all formatting (JSON pretty-printing,
+header dumps, body truncation) happens only when a trace is actually written.
+
+Configuration (environment):
+    ERP_TRACE_LEVEL        off | basic | headers | body   (default: basic)
+    ERP_TRACE_SAMPLE_RATE  0.0 - 1.0 fraction of requests traced (default: 0.01)
+    ERP_TRACE_BODY_CHARS   max characters of request/response body (default: 1000)
+
+Levels are cumulative: 'headers' includes 'basic', 'body' includes both.
+"""
+
+import json
+import logging
+import random
+from typing import Optional, Dict, Any
+
+from decouple import config
+
+logger = logging.getLogger('services.erp_client.trace')
+
+TRACE_LEVELS = {'off': 0, 'basic': 1, 'headers': 2, 'body': 3}
+
+REDACTED = '***'
+
+# Header and body field names (lowercased, without '-'/'_') containing any of
+# these fragments are never written to logs: erpToken, x-api-key, user_password
+SENSITIVE_KEYS = ('authorization', 'cookie', 'password', 'token', 'secret', 'apikey')
+
+
+def _is_sensitive(key: Any) -> bool:
+    normalized = str(key).lower().replace('-', '').replace('_', '')
+    return any(fragment in normalized for fragment in SENSITIVE_KEYS)
+
+
+def redact(value: Any) -> Any:
+    """Return a copy of headers/body with sensitive values masked"""
+    if isinstance(value, dict):
+        return {k: REDACTED if _is_sensitive(k) else redact(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [redact(item) for item in value]
+    return value
+
+
+class ERPRequestTracer:
+    """Decides which ERP requests are traced and writes the trace lines"""
+
+    def __init__(self, level: str = 'basic', sample_rate: float = 0.01, body_chars: int = 1000):
+        self.level = TRACE_LEVELS.get(level.lower(), TRACE_LEVELS['basic'])
+        self.sample_rate = max(0.0, min(sample_rate, 1.0))
+        self.body_chars = body_chars
+
+    def sample(self) -> bool:
+        """Decide once per ERP call whether it is traced"""
+        if self.level == 0 or self.sample_rate <= 0:
+            return False
+        if not logger.isEnabledFor(logging.INFO):
+            return False
+        return self.sample_rate >= 1.0 or random.random() < self.sample_rate
+
+    def _truncate(self, text: str) -> str:
+        if len(text) > self.body_chars:
+            return f"{text[:self.body_chars]}... ({len(text)} chars)"
+        return text
+
+    def trace_request(
+        self,
+        method: str,
+        url: str,
+        headers: Dict[str, str],
+        data: Optional[Any] = None,
+        params: Optional[Dict] = None,
+        attempt: int = 0
+    ):
+        """Write the request side of a sampled trace"""
+        logger.info("[ERP Trace] --> %s %s attempt=%d params=%s", method, url, attempt, redact(params) if params else None)
+
+        if self.level >= TRACE_LEVELS['headers']:
+            logger.info("[ERP Trace]     request headers: %s", redact(headers))
+
+        if self.level >= TRACE_LEVELS['body'] and data is not None:
+            logger.info("[ERP Trace]     request body: %s", self._truncate(json.dumps(redact(data), indent=2, default=str)))
+
+    def trace_response(self, method: str, url: str, response, elapsed_ms: float):
+        """Write the response side of a sampled trace"""
+        logger.info(
+            "[ERP Trace] <-- %s %s status=%s bytes=%d took=%.0fms",
+            method, url, response.status_code, len(response.content or b''), elapsed_ms
+        )
+
+        if self.level >= TRACE_LEVELS['headers']:
+            logger.info("[ERP Trace]     response headers: %s", redact(dict(response.headers)))
+
+        if self.level >= TRACE_LEVELS['body'] and response.content:
+            logger.info("[ERP Trace]     response body: %s", self._response_body(response))
+
+    def _response_body(self, response) -> str:
+        # Only parsed JSON is logged, after redaction; raw text could carry
+        # credentials (login and token responses) in any shape
+        try:
+            body = json.loads(response.text)
+        except ValueError:
+            return f"<{len(response.content)} bytes non-JSON body omitted>"
+        return self._truncate(json.dumps(redact(body), indent=2, default=str))
+
+
+def get_tracer() -> ERPRequestTracer:
+    """Build the tracer from environment configuration"""
+    return ERPRequestTracer(
+        level=config('ERP_TRACE_LEVEL', default='basic'),
+        sample_rate=config('ERP_TRACE_SAMPLE_RATE', default=0.01, cast=float),
+        body_chars=config('ERP_TRACE_BODY_CHARS', default=1000, cast=int)
+    )
@@ -0,0 +1,335 @@
+"""
+Parquet Mirror Cache - Local on-disk copies of S3-hosted Parquet files
+
+DuckDB reads s3:// Parquet objects over httpfs with remote range requests on
+every query. This cache keeps a local copy of each object DuckDBClient reads
+and hands DuckDB the local path instead:
+
+- Validation: head_object (ETag / Last-Modified), at most once every
+  validate_interval seconds per object.
+- Download: in a background thread, to a temp file renamed into place, so a
+  query never sees a partial file. Until the copy matching the current ETag
+  is ready, queries keep reading from S3.
+- Eviction: least recently used files are deleted when the cache directory
+  exceeds max_bytes.
+
+Cached files are named <sha1(uri)>-<etag>.parquet, so gunicorn workers
+sharing the directory reuse each other's downloads, and a new version never
+overwrites a file another query is reading.
+
+A uri ending in '/' is a hive-partitioned dataset. It is validated once per
+validate_interval by reading its manifest log (services/parquet_manifest.py),
+or by listing its .parquet files if it has none, and resolves to the
+explicit list of its committed files: local copies where they are ready,
+s3:// objects otherwise. Uncommitted fragments of a running import and
+files already replaced by compaction are never read. With mirror=False the
+list is still resolved, but every file is read from S3. Copies
+keep the partition directories (<sha1(prefix)>/company_code=X/.../) so
+DuckDB still reads the partition values from the path.
+"""
+
+import hashlib
+import logging
+import os
+import re
+import shutil
+import threading
+import time
+import uuid
+from typing import Optional, Dict, Any, Callable, List, Tuple, Union
+
+from .parquet_manifest import ManifestLog
+
+logger = logging.getLogger(__name__)
+
+_UNSAFE_CHARS = re.compile(r'[^A-Za-z0-9_.]')
+
+
+def split_s3_uri(uri: str) -> Tuple[str, str]:
+    """'s3://bucket/path/file.parquet' -> ('bucket', 'path/file.parquet')"""
+    bucket, _, key = uri[len('s3://'):].partition('/')
+    return bucket, key
+
+
+def is_dataset(uri: str) -> bool:
+    """A path ending in '/' names a hive-partitioned dataset, not a file"""
+    return uri.endswith('/')
+
+
+class ParquetMirrorCache:
+    """Validated local mirror of S3 Parquet objects with LRU size cap"""
+
+    def __init__(
+        self,
+        s3_client_factory: Callable[[], Any],
+        cache_dir: str,
+        max_bytes: int = 2 * 1024 ** 3,
+        validate_interval: float = 60,
+        enabled: bool = True,
+        mirror: bool = True
+    ):
+        self._s3_client_factory = s3_client_factory
+        self._s3_client = None
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.validate_interval = validate_interval
+        self.enabled = enabled
+        self.mirror = mirror and enabled
+        self._manifest_logs: Dict[str, ManifestLog] = {}
+
+        self._lock = threading.Lock()
+        # uri -> {'etag', 'last_modified', 'size', 'validated_at'}
+        # dataset uri -> {'objects': [(key, etag, size)], 'etag', 'validated_at'}
+        self._remote: Dict[str, Dict[str, Any]] = {}
+        self._downloading = set()
+        self._stats = {'local_hits': 0, 's3_reads': 0, 'validations': 0, 'downloads': 0, 'download_errors': 0, 'evictions': 0}
+
+        if self.mirror:
+            try:
+                os.makedirs(self.cache_dir, exist_ok=True)
+            except OSError as e:
+                logger.error(f"Parquet cache directory {self.cache_dir} unavailable, reading from S3: {e}")
+                self.mirror = False
+
+    def _client(self):
+        if self._s3_client is None:
+            self._s3_client = self._s3_client_factory()
+        return self._s3_client
+
+    @staticmethod
+    def _digest(uri: str) -> str:
+        return hashlib.sha1(uri.encode()).hexdigest()[:16]
+
+    def _local_path(self, uri: str, etag: str, dataset: Optional[str] = None) -> str:
+        name = f"{self._digest(uri)}-{_UNSAFE_CHARS.sub('', etag)}.parquet"
+        if dataset is None:
+            return os.path.join(self.cache_dir, name)
+        # Keep the hive partition directories of the object under the dataset prefix
+        partition_dir = os.path.dirname(uri[len(dataset):])
+        return os.path.join(self.cache_dir, self._digest(dataset), *partition_dir.split('/'), name)
+
+    def _validate(self, uri: str) -> Optional[Dict[str, Any]]:
+        """Current remote metadata for uri (HEAD at most every validate_interval)"""
+        now = time.monotonic()
+        with self._lock:
+            remote = self._remote.get(uri)
+            if remote and now - remote['validated_at'] < self.validate_interval:
+                return remote
+
+        bucket, key = split_s3_uri(uri)
+        try:
+            if is_dataset(uri):
+                remote = self._list_dataset(bucket, key)
+            else:
+                head = self._client().head_object(Bucket=bucket, Key=key)
+                remote = {
+                    'etag': head['ETag'].strip('"'),
+                    'last_modified': head.get('LastModified'),
+                    'size': head.get('ContentLength', 0)
+                }
+        except Exception as e:
+            # S3 unreachable: keep using the last known version if we have it
+            logger.warning(f"Parquet cache could not validate {uri}: {e}")
+            return remote
+
+        remote['validated_at'] = now
+        with self._lock:
+            self._remote[uri] = remote
+            self._stats['validations'] += 1
+        return remote
+
+    def _list_dataset(self, bucket: str, prefix: str) -> Dict[str, Any]:
+        """Committed Parquet files of a dataset; the dataset ETag hashes their ETags"""
+        with self._lock:
+            log = self._manifest_logs.get(f"{bucket}/{prefix}")
+            if log is None:
+                log = self._manifest_logs[f"{bucket}/{prefix}"] = ManifestLog(self._client(), bucket, prefix)
+
+        files = log.live_files()
+        if files is None:
+            files = log.list_data_files()
+        objects = sorted((f['key'], f['etag'], f.get('size', 0)) for f in files)
+        etag = hashlib.sha1(repr(objects).encode()).hexdigest()
+        return {'objects': objects, 'etag': etag, 'size': sum(size for _, _, size in objects)}
+
+    def _resolve_object(self, uri: str, etag: str, size: int, dataset: Optional[str] = None) -> str:
+        if not self.mirror:
+            return uri
+
+        path = self._local_path(uri, etag, dataset)
+        if os.path.exists(path):
+            try:
+                os.utime(path)  # mtime doubles as the LRU timestamp
+            except OSError:
+                pass
+            with self._lock:
+                self._stats['local_hits'] += 1
+            return path
+
+        with self._lock:
+            self._stats['s3_reads'] += 1
+        if size <= self.max_bytes:
+            self._start_download(uri, etag, path)
+        return uri
+
+    def resolve(self, uri: str) -> Union[str, List[str]]:
+        """
+        Local path of the current version of uri, or uri itself
+
+        Starts a background download when the local copy is missing or stale.
+        For a dataset, returns the list of its committed files (each local or
+        s3://), or uri itself when the listing is unavailable or empty.
+        Non-S3 paths are returned unchanged.
+        """
+        if not self.enabled or not uri.startswith('s3://'):
+            return uri
+
+        remote = self._validate(uri)
+        if remote is None:
+            return uri
+
+        if not is_dataset(uri):
+            return self._resolve_object(uri, remote['etag'], remote['size'])
+
+        bucket, _ = split_s3_uri(uri)
+        paths = [
+            self._resolve_object(f"s3://{bucket}/{key}", etag, size, dataset=uri)
+            for key, etag, size in remote['objects']
+        ]
+        return paths or uri
+
+    def version(self, uri: str) -> Optional[str]:
+        """ETag of the current version of uri (None when unknown)"""
+        if not uri.startswith('s3://'):
+            try:
+                if is_dataset(uri):
+                    files = sorted(
+                        (os.path.join(root, name), os.stat(os.path.join(root, name)).st_mtime_ns)
+                        for root, _, names in os.walk(uri) for name in names if name.endswith('.parquet')
+                    )
+                    return hashlib.sha1(repr(files).encode()).hexdigest() if files else None
+                return str(os.stat(uri).st_mtime_ns)
+            except OSError:
+                return None
+        remote = self._validate(uri)
+        return remote['etag'] if remote else None
+
+    def _start_download(self, uri: str, etag: str, path: str):
+        with self._lock:
+            if uri in self._downloading:
+                return
+            self._downloading.add(uri)
+
+        thread = threading.Thread(
+            target=self._download,
+            args=(uri, etag, path),
+            name='parquet-cache-download',
+            daemon=True
+        )
+        thread.start()
+
+    def _download(self, uri: str, etag: str, path: str):
+        bucket, key = split_s3_uri(uri)
+        temp_path = os.path.join(self.cache_dir, f".{uuid.uuid4().hex}.part")
+        started = time.monotonic()
+
+        try:
+            # IfMatch guarantees the bytes belong to the ETag in the file name
+            # (download_file does not accept IfMatch, so stream get_object)
+            response = self._client().get_object(Bucket=bucket, Key=key, IfMatch=etag)
+            with open(temp_path, 'wb') as f:
+                shutil.copyfileobj(response['Body'], f, 1024 * 1024)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(temp_path, path)
+            with self._lock:
+                self._stats['downloads'] += 1
+            logger.info(
+                f"Parquet cache stored {uri} ({os.path.getsize(path) / (1024 * 1024):.1f} MB) "
+                f"in {time.monotonic() - started:.1f}s"
+            )
+            self._remove_old_versions(uri, path)
+            self._evict()
+        except Exception as e:
+            with self._lock:
+                self._stats['download_errors'] += 1
+            logger.error(f"Parquet cache download failed for {uri}: {e}")
+        finally:
+            if os.path.exists(temp_path):
+                try:
+                    os.remove(temp_path)
+                except OSError:
+                    pass
+            with self._lock:
+                self._downloading.discard(uri)
+
+    def _remove_old_versions(self, uri: str, current_path: str):
+        prefix = f"{self._digest(uri)}-"
+        directory = os.path.dirname(current_path)
+        for name in os.listdir(directory):
+            path = os.path.join(directory, name)
+            if name.startswith(prefix) and path != current_path:
+                try:
+                    os.remove(path)  # queries already reading it keep their open handle
+                except OSError:
+                    pass
+
+    def _cached_files(self):
+        """Paths of all cached Parquet files, including dataset partitions"""
+        for root, _, names in os.walk(self.cache_dir):
+            for name in names:
+                if name.endswith('.parquet'):
+                    yield os.path.join(root, name)
+
+    def _evict(self):
+        """Delete least recently used files until the cache fits in max_bytes"""
+        entries = []
+        for path in self._cached_files():
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+                with self._lock:
+                    self._stats['evictions'] += 1
+                logger.info(f"Parquet cache evicted {os.path.basename(path)}")
+            except OSError:
+                pass
+
+    def invalidate(self, uri: Optional[str] = None):
+        """Force revalidation of uri (or all objects) on the next resolve"""
+        with self._lock:
+            if uri is None:
+                self._remote.clear()
+            else:
+                self._remote.pop(uri, None)
+
+    def get_stats(self) -> Dict[str, Any]:
+        size = 0
+        files = 0
+        if self.mirror:
+            for path in self._cached_files():
+                files += 1
+                try:
+                    size += os.path.getsize(path)
+                except OSError:
+                    pass
+
+        with self._lock:
+            return {
+                'enabled': self.enabled,
+                'mirror': self.mirror,
+                'cache_dir': self.cache_dir,
+                'files': files,
+                'size_mb': round(size / (1024 * 1024), 2),
+                'max_mb': round(self.max_bytes / (1024 * 1024), 2),
+                'downloading': sorted(self._downloading),
+                **self._stats
+            }
@@ -0,0 +1,286 @@
+"""
+Parquet Manifest Log - Append-only commit log for a Parquet dataset on S3
+
+Writers never rewrite a data file. An import uploads new fragment files and
+then commits a small JSON manifest naming them; uploading the manifest is
+the commit point, so readers see all of an import or none of it, and
+concurrent imports cannot overwrite each other's rows.
+
+    <prefix>_manifests/<UTC timestamp>-<id>.json
+        {"added": [{"key", "etag", "size", "rows"}, ...], "removed": [key, ...],
+         "removed_prefixes": [prefix, ...], "requires": [key, ...], ...}
+
+    <prefix>_checkpoints/<last manifest covered>.json
+        {"files": [...live files...], "covers": "<manifest key>"}
+
+The live file set is the latest checkpoint plus every later manifest, in
+commit order: added keys become live, removed keys stop being live, and
+every live key under a removed_prefixes entry stops being live (a replace
+import drops whatever its company had when its commit lands, including a
+fragment compacted after the import listed the files). Compaction commits
+one manifest that adds the merged fragment and removes its sources, so the
+swap is atomic for readers. It also lists the sources as "requires": if
+any of them is no longer live when the manifest applies (a replace import
+committed while compaction ran), the whole manifest is void, so replaced
+rows never come back. Removed objects are only deleted by vacuum()
+after a grace period, so readers still holding an older file list (the
+local mirror revalidates every PARQUET_CACHE_VALIDATE_INTERVAL) can read
+them. The grace period must also exceed the longest import, because
+uploaded fragments are unreferenced until their manifest is committed.
+
+Datasets without any manifest or checkpoint (written before the log
+existed) are read by listing their .parquet files; the first commit
+checkpoints that listing.
+"""
+
+import json
+import logging
+import threading
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+_TIMESTAMP_FORMAT = '%Y%m%dT%H%M%S%fZ'
+_INITIAL_COVERS = '00000000T000000000000Z'
+
+
+def _manifest_time(key: str) -> Optional[datetime]:
+    """Commit time encoded in a manifest/checkpoint file name"""
+    stem = key.rsplit('/', 1)[-1].split('-', 1)[0]
+    try:
+        return datetime.strptime(stem, _TIMESTAMP_FORMAT).replace(tzinfo=timezone.utc)
+    except ValueError:
+        return None
+
+
+class ManifestLog:
+    """Manifest commit log of one dataset prefix in a bucket"""
+
+    MANIFESTS = '_manifests/'
+    CHECKPOINTS = '_checkpoints/'
+
+    def __init__(self, s3_client, bucket: str, prefix: str):
+        self.s3_client = s3_client
+        self.bucket = bucket
+        self.prefix = prefix
+        # Manifests and checkpoints are immutable, so parsed bodies are kept
+        self._documents: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    # -- S3 helpers -------------------------------------------------------
+
+    def _list(self, prefix: str) -> List[Dict[str, Any]]:
+        objects = []
+        kwargs = {'Bucket': self.bucket, 'Prefix': prefix}
+        while True:
+            response = self.s3_client.list_objects_v2(**kwargs)
+            objects.extend(response.get('Contents', []))
+            if not response.get('IsTruncated'):
+                return objects
+            kwargs['ContinuationToken'] = response['NextContinuationToken']
+
+    def _read(self, key: str) -> Dict[str, Any]:
+        with self._lock:
+            document = self._documents.get(key)
+        if document is None:
+            response = self.s3_client.get_object(Bucket=self.bucket, Key=key)
+            document = json.loads(response['Body'].read())
+            with self._lock:
+                self._documents[key] = document
+        return document
+
+    def _put(self, key: str, document: Dict[str, Any]):
+        body = json.dumps(document, default=str).encode()
+        self.s3_client.put_object(Bucket=self.bucket, Key=key, Body=body, ContentType='application/json')
+        with self._lock:
+            self._documents[key] = document
+
+    def _delete(self, keys: List[str]):
+        for start in range(0, len(keys), 1000):
+            batch = keys[start:start + 1000]
+            self.s3_client.delete_objects(Bucket=self.bucket, Delete={'Objects': [{'Key': key} for key in batch]})
+        with self._lock:
+            for key in keys:
+                self._documents.pop(key, None)
+
+    def list_data_files(self) -> List[Dict[str, Any]]:
+        """Every .parquet object under the prefix, live or not: {'key', 'etag', 'size', 'last_modified'}"""
+        return [
+            {'key': obj['Key'], 'etag': obj['ETag'].strip('"'), 'size': obj.get('Size', 0), 'last_modified': obj.get('LastModified')}
+            for obj in self._list(self.prefix)
+            if obj['Key'].endswith('.parquet')
+        ]
+
+    # -- reading ----------------------------------------------------------
+
+    def _state(self):
+        """(latest checkpoint key or None, manifest keys after it, all manifest keys)"""
+        checkpoints = sorted(obj['Key'] for obj in self._list(self.prefix + self.CHECKPOINTS) if obj['Key'].endswith('.json'))
+        manifests = sorted(obj['Key'] for obj in self._list(self.prefix + self.MANIFESTS) if obj['Key'].endswith('.json'))
+
+        with self._lock:
+            listed = set(checkpoints) | set(manifests)
+            for key in [key for key in self._documents if key not in listed]:
+                del self._documents[key]
+
+        checkpoint = checkpoints[-1] if checkpoints else None
+        covers = self._read(checkpoint)['covers'] if checkpoint else ''
+        return checkpoint, [key for key in manifests if key > covers], manifests
+
+    def live_files(self) -> Optional[List[Dict[str, Any]]]:
+        """
+        Committed data files: [{'key', 'etag', 'size', 'rows'}] in commit order
+
+        Returns None when the dataset has no manifest log yet.
+        """
+        checkpoint, pending, _ = self._state()
+        if checkpoint is None and not pending:
+            return None
+
+        live: Dict[str, Dict[str, Any]] = {}
+        if checkpoint:
+            for entry in self._read(checkpoint)['files']:
+                live[entry['key']] = entry
+        for key in pending:
+            self._apply(live, self._read(key))
+        return list(live.values())
+
+    @staticmethod
+    def _apply(live: Dict[str, Dict[str, Any]], manifest: Dict[str, Any]) -> List[str]:
+        """Apply one manifest to the live files (key -> entry); returns the keys it drops"""
+        added = manifest.get('added', [])
+        if not all(key in live for key in manifest.get('requires', [])):
+            # Its sources were removed first: the manifest never takes effect
+            return [entry['key'] for entry in added]
+
+        added_keys = {entry['key'] for entry in added}
+        dropped = list(manifest.get('removed', []))
+        for prefix in manifest.get('removed_prefixes', []):
+            dropped += [key for key in live if key.startswith(prefix) and key not in added_keys]
+        for key in dropped:
+            live.pop(key, None)
+        for entry in added:
+            live[entry['key']] = entry
+        return dropped
+
+    # -- writing ----------------------------------------------------------
+
+    def ensure_initialized(self):
+        """Checkpoint the current listing if the dataset has no log yet (pre-manifest data)"""
+        if self.live_files() is not None:
+            return
+        files = [{key: f[key] for key in ('key', 'etag', 'size')} for f in self.list_data_files()]
+        self._put(f"{self.prefix}{self.CHECKPOINTS}{_INITIAL_COVERS}-{uuid.uuid4().hex[:12]}.json", {
+            'covers': '',
+            'files': files,
+            'created_at': datetime.now(timezone.utc).isoformat()
+        })
+        logger.info(f"Initialized manifest log for s3://{self.bucket}/{self.prefix} with {len(files)} existing files")
+
+    def commit(self, added: List[Dict[str, Any]], removed: Optional[List[str]] = None,
+               removed_prefixes: Optional[List[str]] = None, requires: Optional[List[str]] = None, **info) -> str:
+        """
+        Atomically add and remove data files; returns the manifest key
+
+        Args:
+            added: Entries {'key', 'etag', 'size', 'rows'} of uploaded files
+            removed: Keys of live files that stop being part of the dataset
+            removed_prefixes: Drop every file under these prefixes that is
+                live when the manifest applies (except added ones)
+            requires: Keys that must all still be live when the manifest
+                applies; otherwise it has no effect (see live_files)
+            **info: Extra fields recorded in the manifest (import id, user, ...)
+        """
+        self.ensure_initialized()
+        now = datetime.now(timezone.utc)
+        key = f"{self.prefix}{self.MANIFESTS}{now.strftime(_TIMESTAMP_FORMAT)}-{uuid.uuid4().hex[:12]}.json"
+        manifest = {
+            'added': added,
+            'removed': list(removed or []),
+            'created_at': now.isoformat(),
+            **info
+        }
+        if removed_prefixes:
+            manifest['removed_prefixes'] = list(removed_prefixes)
+        if requires:
+            manifest['requires'] = list(requires)
+        self._put(key, manifest)
+        logger.info(f"Committed manifest {key}: +{len(added)} / -{len(removed or [])} files")
+        return key
+
+    def vacuum(self, grace_seconds: float = 3600) -> Dict[str, int]:
+        """
+        Checkpoint old manifests and delete files no reader can still need
+
+        Deletes data files that were removed (or never committed) more than
+        grace_seconds ago, then manifests covered by the new checkpoint and
+        older checkpoints.
+        """
+        cutoff = datetime.now(timezone.utc) - timedelta(seconds=grace_seconds)
+        checkpoint, pending, manifests = self._state()
+        stats = {'checkpointed_manifests': 0, 'deleted_files': 0, 'deleted_manifests': 0}
+        if checkpoint is None and not pending:
+            return stats
+
+        # 1. Checkpoint manifests older than the grace period. Newer ones may
+        #    still have concurrent commits landing just before them.
+        settled = [key for key in pending if (_manifest_time(key) or cutoff) < cutoff]
+        live = {}
+        if checkpoint:
+            for entry in self._read(checkpoint)['files']:
+                live[entry['key']] = entry
+        removed_at: Dict[str, datetime] = {}
+        referenced = set(live)
+        for key in manifests:
+            manifest = self._read(key)
+            for entry in manifest.get('added', []):
+                referenced.add(entry['key'])
+            if key not in pending:
+                for removed in manifest.get('removed', []):
+                    removed_at[removed] = _manifest_time(key) or datetime.now(timezone.utc)
+
+        # Replay to find what pending manifests drop (prefix removals, void commits)
+        replay = dict(live)
+        for key in pending:
+            for removed in self._apply(replay, self._read(key)):
+                removed_at[removed] = _manifest_time(key) or datetime.now(timezone.utc)
+
+        for key in settled:
+            self._apply(live, self._read(key))
+
+        if settled:
+            covers = settled[-1]
+            self._put(f"{self.prefix}{self.CHECKPOINTS}{covers.rsplit('/', 1)[-1]}", {
+                'covers': covers,
+                'files': list(live.values()),
+                'created_at': datetime.now(timezone.utc).isoformat()
+            })
+            stats['checkpointed_manifests'] = len(settled)
+
+        # 2. Data files: removed before the cutoff, or never committed and
+        #    older than the cutoff (an import that failed before its manifest)
+        current = {entry['key'] for entry in (self.live_files() or [])}
+        doomed = []
+        for obj in self.list_data_files():
+            if obj['key'] in current:
+                continue
+            if obj['key'] in removed_at:
+                if removed_at[obj['key']] < cutoff:
+                    doomed.append(obj['key'])
+            elif obj['key'] not in referenced and obj['last_modified'] and obj['last_modified'] < cutoff:
+                doomed.append(obj['key'])
+        if doomed:
+            self._delete(doomed)
+            stats['deleted_files'] = len(doomed)
+
+        # 3. Manifests covered by the latest checkpoint, and older checkpoints
+        if settled:
+            checkpoints = sorted(obj['Key'] for obj in self._list(self.prefix + self.CHECKPOINTS) if obj['Key'].endswith('.json'))
+            obsolete = [key for key in manifests if key <= settled[-1]] + checkpoints[:-1]
+            self._delete(obsolete)
+            stats['deleted_manifests'] = len(obsolete)
+
+        logger.info(f"Vacuumed s3://{self.bucket}/{self.prefix}: {stats}")
+        return stats
@@ -0,0 +1,269 @@
+"""
+Purchase Order Dataset - Hive-partitioned Parquet layout on Wasabi S3
+
+Purchase orders are stored under one prefix, partitioned by company and
+calendar month of order_date:
+
+    analytics/purchase_orders/company_code=<code>/year=<yyyy>/month=<m>/part-<id>.parquet
+
+DuckDB reads the dataset with hive_partitioning, so company_code, year and
+month come from the object path and filters on them skip whole files
+instead of scanning every row. Rows without an order_date are kept in
+year=0/month=0.
+
+Ingest is append-only: each import writes one new fragment per partition
+it touches and commits them in a manifest (services/parquet_manifest.py),
+so import time depends only on the new rows. The compact_purchase_orders
+management command merges small fragments and deletes replaced files.
+When a dataset has rollups (services/po_rollups.py), every write also
+updates them.
+
+Every file is written with PO_SCHEMA (partition columns excluded), so files
+from different imports can be scanned together without union_by_name, which
+would open every file up front and defeat partition pruning.
+"""
+
+import io
+import logging
+import re
+import uuid
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from .duckdb_query import HivePartitioning
+from .parquet_manifest import ManifestLog
+from .parquet_writer import PO_DICTIONARY_COLUMNS, PO_SORT_COLUMNS, write_parquet
+
+logger = logging.getLogger(__name__)
+
+PO_DATASET_PREFIX = 'analytics/purchase_orders/'
+
+PO_PARTITIONING = HivePartitioning(
+    {'company_code': 'VARCHAR', 'year': 'INTEGER', 'month': 'INTEGER'},
+    month_column='order_date'
+)
+
+PO_SCHEMA = pa.schema([
+    ('po_number', pa.string()),
+    ('po_payto_id', pa.string()),
+    ('po_payto_name', pa.string()),
+    ('po_company', pa.string()),
+    ('po_branch', pa.string()),
+    ('order_total', pa.float64()),
+    ('order_date', pa.timestamp('us')),
+    ('import_batch_id', pa.string()),
+    ('imported_by', pa.string()),
+    ('imported_at', pa.timestamp('us')),
+])
+
+_COMPANY_CODE = re.compile(r'^[A-Za-z0-9_.-]+$')
+
+PartitionKey = Tuple[str, int, int]
+
+
+def company_path(company_code: str) -> str:
+    """'company_code=X/' (relative to the dataset prefix)"""
+    if not _COMPANY_CODE.match(str(company_code)):
+        raise ValueError(f"Invalid company code for partition path: {company_code}")
+    return f"company_code={company_code}/"
+
+
+def partition_path(company_code: str, year: int, month: int) -> str:
+    """'company_code=X/year=YYYY/month=M/' (relative to the dataset prefix)"""
+    return f"{company_path(company_code)}year={year}/month={month}/"
+
+
+def to_partition_table(df: pd.DataFrame) -> pa.Table:
+    """Cast rows to PO_SCHEMA; missing columns become null, extra columns are dropped"""
+    columns = {}
+    for field in PO_SCHEMA:
+        if field.name not in df.columns:
+            columns[field.name] = pa.nulls(len(df), field.type)
+        elif pa.types.is_string(field.type):
+            values = df[field.name].astype('string').str.strip()
+            columns[field.name] = pa.array(values.where(values.notna(), None).tolist(), field.type)
+        elif pa.types.is_timestamp(field.type):
+            values = pd.to_datetime(df[field.name], errors='coerce')
+            if values.dt.tz is not None:
+                values = values.dt.tz_localize(None)
+            columns[field.name] = pa.array(values, from_pandas=True).cast(field.type, safe=False)
+        else:
+            columns[field.name] = pa.array(pd.to_numeric(df[field.name], errors='coerce'), field.type, from_pandas=True)
+    return pa.table(columns, schema=PO_SCHEMA)
+
+
+def split_partitions(df: pd.DataFrame) -> Iterator[Tuple[PartitionKey, pd.DataFrame]]:
+    """Group rows by (company_code, year, month) of order_date"""
+    order_date = pd.to_datetime(df['order_date'], errors='coerce') if 'order_date' in df.columns else pd.Series(pd.NaT, index=df.index)
+    keys = pd.DataFrame({
+        'company_code': df['company_code'].astype(str),
+        'year': order_date.dt.year.fillna(0).astype(int),
+        'month': order_date.dt.month.fillna(0).astype(int),
+    }, index=df.index)
+
+    for (company_code, year, month), rows in df.groupby([keys['company_code'], keys['year'], keys['month']], sort=True):
+        yield (company_code, int(year), int(month)), rows
+
+
+class PurchaseOrderDataset:
+    """
+    Appends to, replaces and compacts the purchase orders dataset in one bucket
+
+    Args:
+        rollups: Optional PurchaseOrderRollups updated by every write()
+    """
+
+    schema = PO_SCHEMA
+    sort_columns = PO_SORT_COLUMNS
+    dictionary_columns = PO_DICTIONARY_COLUMNS
+
+    def __init__(self, s3_client, bucket: str, prefix: str = PO_DATASET_PREFIX, rollups=None):
+        self.s3_client = s3_client
+        self.bucket = bucket
+        self.prefix = prefix
+        self.log = ManifestLog(s3_client, bucket, prefix)
+        self.rollups = rollups
+
+    @property
+    def uri(self) -> str:
+        """s3:// path of the dataset (what DuckDB and the caches key on)"""
+        return f"s3://{self.bucket}/{self.prefix}"
+
+    def fragment_key(self, company_code: str, year: int, month: int, fragment_id: str) -> str:
+        return f"{self.prefix}{partition_path(company_code, year, month)}part-{fragment_id}.parquet"
+
+    def files(self) -> List[Dict[str, Any]]:
+        """Live data files {'key', 'etag', 'size', ...} (committed fragments)"""
+        live = self.log.live_files()
+        return live if live is not None else self.log.list_data_files()
+
+    def describe(self) -> Dict[str, Any]:
+        """File count, total size and last modification of the live dataset"""
+        live = {entry['key'] for entry in self.files()}
+        objects = [obj for obj in self.log.list_data_files() if obj['key'] in live]
+        return {
+            'files': len(objects),
+            'bytes': sum(obj['size'] for obj in objects),
+            'last_modified': max((obj['last_modified'] for obj in objects if obj['last_modified']), default=None)
+        }
+
+    def _partition_table(self, rows: pd.DataFrame) -> pa.Table:
+        """Fragment contents for the rows of one partition"""
+        return to_partition_table(rows)
+
+    def _merge_fragments(self, tables: List[pa.Table]) -> pa.Table:
+        """Contents of the file that replaces the given fragments of one partition"""
+        return pa.concat_tables(tables)
+
+    def _put_fragment(self, table: pa.Table, key: str) -> Dict[str, Any]:
+        buffer = io.BytesIO()
+        table = write_parquet(table, buffer, sort_columns=self.sort_columns, dictionary_columns=self.dictionary_columns)
+        response = self.s3_client.put_object(
+            Bucket=self.bucket, Key=key, Body=buffer.getvalue(), ContentType='application/octet-stream'
+        )
+        entry = {'key': key, 'etag': response['ETag'].strip('"'), 'size': buffer.tell(), 'rows': table.num_rows}
+        logger.info(f"Wrote fragment {key}: {table.num_rows} rows, {entry['size'] / 1024:.1f} KB")
+        return entry
+
+    def _read_fragment(self, key: str) -> pa.Table:
+        response = self.s3_client.get_object(Bucket=self.bucket, Key=key)
+        return pq.read_table(io.BytesIO(response['Body'].read())).cast(self.schema)
+
+    def write(self, df: pd.DataFrame, mode: str = 'append', batch_id: Optional[str] = None, **info) -> Dict[str, Any]:
+        """
+        Write rows as new fragments, one per partition they fall into
+
+        Existing data is never read or rewritten, so the cost depends only on
+        the size of df. The fragments become visible together when the
+        manifest is committed.
+
+        Args:
+            df: Rows with a company_code column (order_date optional)
+            mode: 'append' adds the rows; 'replace' also removes every file
+                of the companies in df in the same commit
+            batch_id: Names the fragments (part-<batch_id>.parquet)
+            **info: Recorded in the manifest
+
+        Returns:
+            dict: fragments written/removed, rows, bytes, manifest key and
+                rollup manifest key (None without rollups or if they failed)
+        """
+        batch_id = batch_id or uuid.uuid4().hex
+        added = []
+        for (company_code, year, month), rows in split_partitions(df):
+            key = self.fragment_key(company_code, year, month, batch_id)
+            added.append(self._put_fragment(self._partition_table(rows), key))
+
+        removed, companies = [], []
+        if mode == 'replace':
+            companies = [self.prefix + company_path(code) for code in sorted(df['company_code'].astype(str).unique())]
+            new_keys = {entry['key'] for entry in added}
+            removed = [
+                entry['key'] for entry in self.files()
+                if entry['key'] not in new_keys and any(entry['key'].startswith(company) for company in companies)
+            ]
+
+        # removed_prefixes also drops files of these companies committed
+        # after the listing above (e.g. by a concurrent compaction)
+        manifest = self.log.commit(added, removed, removed_prefixes=companies, operation=mode, batch_id=batch_id, **info)
+
+        rollup_manifest = None
+        if self.rollups is not None:
+            # The rows are committed at this point; failing the write would
+            # only invite a duplicate import. Stale rollups are rebuilt with
+            # the build_po_rollups management command.
+            try:
+                rollup_manifest = self.rollups.write(df, mode=mode, batch_id=batch_id, **info)['manifest']
+            except Exception as e:
+                logger.error(f"Rollup update failed for batch {batch_id}; run build_po_rollups: {e}", exc_info=True)
+
+        return {
+            'fragments_written': len(added),
+            'fragments_removed': len(removed),
+            'rows_written': sum(entry['rows'] for entry in added),
+            'bytes_written': sum(entry['size'] for entry in added),
+            'manifest': manifest,
+            'rollup_manifest': rollup_manifest
+        }
+
+    def compact(self, min_fragments: int = 4, small_bytes: int = 64 * 1024 * 1024, company_code: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Merge small fragments of each partition into one file
+
+        A partition is compacted when it has at least min_fragments files
+        smaller than small_bytes. The merged file replaces them in one
+        manifest commit, which only takes effect if all of them are still
+        live; the old files are deleted later by vacuum().
+        """
+        scope = self.prefix + (company_path(company_code) if company_code else '')
+        partitions: Dict[str, List[Dict[str, Any]]] = {}
+        for entry in self.files():
+            if entry['key'].startswith(scope) and entry.get('size', 0) < small_bytes:
+                partitions.setdefault(entry['key'].rsplit('/', 1)[0], []).append(entry)
+
+        stats = {'partitions_compacted': 0, 'fragments_merged': 0, 'rows': 0}
+        for directory, fragments in sorted(partitions.items()):
+            if len(fragments) < min_fragments:
+                continue
+            sources = [entry['key'] for entry in fragments]
+            table = self._merge_fragments([self._read_fragment(key) for key in sources])
+            merged = self._put_fragment(table, f"{directory}/part-compacted-{uuid.uuid4().hex}.parquet")
+            # Void if a replace import (or another compaction) removed a
+            # source meanwhile; the merged file would bring its rows back
+            self.log.commit([merged], sources, requires=sources, operation='compact')
+            if not any(entry['key'] == merged['key'] for entry in self.files()):
+                logger.warning(f"Compaction of {directory} lost to a concurrent commit; merged file discarded")
+                continue
+
+            stats['partitions_compacted'] += 1
+            stats['fragments_merged'] += len(fragments)
+            stats['rows'] += table.num_rows
+
+        return stats
+
+    def vacuum(self, grace_seconds: float = 3600) -> Dict[str, int]:
+        """Delete files removed by replace/compaction more than grace_seconds ago (see ManifestLog.vacuum)"""
+        return self.log.vacuum(grace_seconds)
@@ -0,0 +1,211 @@
+"""
+PO Import Queue - Durable MongoDB job queue for CSV imports
+
+import_csv stores the upload in GridFS (po_import_files) and enqueues a job
+in po_import_jobs instead of starting a thread in the web worker.
+`python manage.py run_po_import_worker` runs a pool of worker processes
+that claim jobs and stream them into purchase_orders.
+
+- Claiming: find_one_and_update sets status 'running' with a lease
+  (lease_id, lease_expires_at). Each checkpoint renews it. An update that
+  no longer matches the lease means another worker took the job over.
+- Per-company limit: a running job holds a slot 0..company_limit-1. The
+  partial unique index on (company_code, slot) for running jobs (created
+  by AnalyticsMongoDBService) makes a second claim of a taken slot fail
+  atomically.
+- Crash recovery: a running job whose lease expired (worker killed or
+  restarted) is claimed again. It resumes from its checkpoint: the byte
+  offset and counters after the last inserted batch.
+- Retries: a failed attempt is queued again after retry_delay * 2^n
+  seconds until max_attempts is reached; crashes count as attempts.
+- Progress is written to po_import_logs by process_csv_import; the queue
+  records queued/retrying/failed there.
+"""
+
+import logging
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, Optional
+
+from decouple import config
+from pymongo import ASCENDING, ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from .analytics_mongodb_service import analytics_mongodb
+
+logger = logging.getLogger(__name__)
+
+
+class JobLeaseLost(Exception):
+    """The job's lease expired and another worker claimed it"""
+
+
+def _now():
+    return datetime.now(timezone.utc)
+
+
+class ImportJobQueue:
+    """Enqueue, claim, checkpoint and finish CSV import jobs"""
+
+    def __init__(self, mongodb=analytics_mongodb):
+        self.mongodb = mongodb
+        self.lease_seconds = config('PO_IMPORT_LEASE_SECONDS', default=300, cast=int)
+        self.max_attempts = config('PO_IMPORT_MAX_ATTEMPTS', default=3, cast=int)
+        self.company_limit = config('PO_IMPORT_COMPANY_CONCURRENCY', default=1, cast=int)
+        self.retry_delay = config('PO_IMPORT_RETRY_DELAY_SECONDS', default=30, cast=int)
+
+    @property
+    def jobs(self):
+        return self.mongodb.import_jobs
+
+    # -- producer ---------------------------------------------------------
+
+    def enqueue(self, chunks: Iterable[bytes], import_batch_id: str, company_code: str, user_email: str,
+                filename: str, skip_rows: int = 0, overwrite_mode: bool = False) -> Dict[str, Any]:
+        """
+        Store the CSV in GridFS chunk by chunk and queue its import job
+
+        Args:
+            chunks: The file contents (e.g. UploadedFile.chunks())
+            import_batch_id: Also the job id and the po_import_logs key
+
+        Returns:
+            dict: The job document
+        """
+        file_size = 0
+        with self.mongodb.import_files.open_upload_stream(
+            filename, metadata={'import_batch_id': import_batch_id, 'company_code': company_code}
+        ) as upload:
+            for chunk in chunks:
+                upload.write(chunk)
+                file_size += len(chunk)
+
+        now = _now()
+        job = {
+            '_id': import_batch_id,
+            'company_code': company_code,
+            'user_email': user_email,
+            'filename': filename,
+            'file_id': upload._id,
+            'file_size': file_size,
+            'skip_rows': skip_rows,
+            'overwrite_mode': overwrite_mode,
+            'status': 'queued',
+            'attempts': 0,
+            'run_after': now,
+            'checkpoint': None,
+            'created_at': now,
+        }
+        self.jobs.insert_one(job)
+        logger.info(f"Queued import {import_batch_id} ({filename}, {file_size:,} bytes) for {company_code}")
+        return job
+
+    # -- workers ----------------------------------------------------------
+
+    def claim(self) -> Optional[Dict[str, Any]]:
+        """Claim the oldest runnable job within its company's limit, or None"""
+        now = _now()
+        candidates = self.jobs.find({
+            '$or': [
+                {'status': 'queued', 'run_after': {'$lte': now}},
+                {'status': 'running', 'lease_expires_at': {'$lt': now}, 'attempts': {'$lt': self.max_attempts}},
+            ]
+        }).sort('created_at', ASCENDING).limit(50)
+
+        for job in candidates:
+            if job['status'] == 'running':
+                # Abandoned by a dead worker; it still holds its slot
+                match = {'_id': job['_id'], 'status': 'running', 'lease_id': job['lease_id']}
+                slots = [job['slot']]
+            else:
+                match = {'_id': job['_id'], 'status': 'queued'}
+                slots = range(self.company_limit)
+
+            for slot in slots:
+                try:
+                    claimed = self.jobs.find_one_and_update(match, {
+                        '$set': {
+                            'status': 'running',
+                            'slot': slot,
+                            'lease_id': uuid.uuid4().hex,
+                            'lease_expires_at': now + timedelta(seconds=self.lease_seconds),
+                            'started_at': now,
+                        },
+                        '$inc': {'attempts': 1}
+                    }, return_document=ReturnDocument.AFTER)
+                except DuplicateKeyError:
+                    continue  # Slot taken by another running job of this company
+                if claimed is None:
+                    break  # Claimed by another worker meanwhile
+                logger.info(f"Claimed import {claimed['_id']} (attempt {claimed['attempts']}, slot {slot})")
+                return claimed
+        return None
+
+    def _update_leased(self, job: Dict[str, Any], update: Dict[str, Any]):
+        result = self.jobs.update_one({'_id': job['_id'], 'status': 'running', 'lease_id': job['lease_id']}, update)
+        if result.matched_count == 0:
+            raise JobLeaseLost(f"Import {job['_id']} was claimed by another worker")
+
+    def checkpoint(self, job: Dict[str, Any], state: Dict[str, Any]):
+        """Record progress after a committed batch and renew the lease"""
+        self._update_leased(job, {'$set': {
+            'checkpoint': state,
+            'lease_expires_at': _now() + timedelta(seconds=self.lease_seconds),
+        }})
+        job['checkpoint'] = state
+
+    def download(self, job: Dict[str, Any], stream):
+        """Write the job's CSV to a binary file object"""
+        self.mongodb.import_files.download_to_stream(job['file_id'], stream)
+
+    def complete(self, job: Dict[str, Any]):
+        self._update_leased(job, {
+            '$set': {'status': 'completed', 'finished_at': _now()},
+            '$unset': {'slot': '', 'lease_id': '', 'lease_expires_at': ''}
+        })
+        self.mongodb.import_files.delete(job['file_id'])
+
+    def release(self, job: Dict[str, Any]):
+        """Put a job back without counting the attempt (worker shutting down)"""
+        self._update_leased(job, {
+            '$set': {'status': 'queued', 'run_after': _now()},
+            '$unset': {'slot': '', 'lease_id': '', 'lease_expires_at': ''},
+            '$inc': {'attempts': -1}
+        })
+        logger.info(f"Released import {job['_id']} at offset {(job.get('checkpoint') or {}).get('offset', 0)}")
+
+    def fail(self, job: Dict[str, Any], error: Exception):
+        """Queue the job again after a backoff, or mark it failed after max_attempts"""
+        final = job['attempts'] >= self.max_attempts
+        update = {
+            '$set': {'status': 'failed' if final else 'queued', 'last_error': str(error)},
+            '$unset': {'slot': '', 'lease_id': '', 'lease_expires_at': ''}
+        }
+        if final:
+            update['$set']['finished_at'] = _now()
+        else:
+            update['$set']['run_after'] = _now() + timedelta(seconds=self.retry_delay * 2 ** (job['attempts'] - 1))
+        self._update_leased(job, update)
+
+        self.mongodb.update_import_log(job['_id'], {
+            'status': 'failed' if final else 'retrying',
+            'error_message': str(error)
+        })
+        logger.error(f"Import {job['_id']} attempt {job['attempts']} failed{'' if final else ', will retry'}: {error}")
+
+    def fail_abandoned(self) -> int:
+        """Mark jobs failed whose last allowed attempt's worker died"""
+        failed = 0
+        for job in self.jobs.find({
+            'status': 'running', 'lease_expires_at': {'$lt': _now()}, 'attempts': {'$gte': self.max_attempts}
+        }):
+            try:
+                self.fail(job, RuntimeError('Import worker stopped responding'))
+                failed += 1
+            except JobLeaseLost:
+                pass
+        return failed
+
+
+# Create singleton instance
+import_job_queue = ImportJobQueue()
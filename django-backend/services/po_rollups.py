@@ -0,0 +1,196 @@
+"""
+Purchase Order Rollups - Daily aggregates maintained at import time
+
+The vendor, branch, monthly and summary endpoints only need sums, counts
+and min/max per vendor, branch and day, so they read a small pre-aggregated
+dataset instead of every purchase order:
+
+    analytics/purchase_order_rollups/daily/company_code=<code>/year=<yyyy>/month=<m>/part-<id>.parquet
+
+One row per (day, po_company, po_branch, po_payto_id, po_payto_name) with
+order_count, total_spent, priced_count (orders with an order_total, the AVG
+denominator), min/max order_total and first/last order_date. Monthly
+figures are sums over a month's partition.
+
+The rollups use the same layout and manifest log as the raw dataset
+(PurchaseOrderRollups is a PurchaseOrderDataset): each import appends one
+rollup fragment per partition it touches, replace imports drop the
+company's rollups in the same commit, and compaction re-aggregates merged
+fragments. Fragments of different imports may repeat a key, so queries
+always aggregate (ROLLUP_AGGREGATES).
+
+Rollups of data written before they existed, or of an import whose rollup
+commit failed, are rebuilt from the raw dataset with
+`python manage.py build_po_rollups`.
+
+Row-level filters (po_number, amount ranges, exact timestamps) cannot be
+answered from rollups; po_search and po_export keep reading raw rows.
+"""
+
+import logging
+import uuid
+from typing import Any, Dict, List, NamedTuple, Optional
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from .duckdb_query import HivePartitioning
+from .po_dataset import PurchaseOrderDataset, company_path, to_partition_table
+
+logger = logging.getLogger(__name__)
+
+PO_ROLLUP_PREFIX = 'analytics/purchase_order_rollups/daily/'
+
+PO_ROLLUP_PARTITIONING = HivePartitioning(
+    {'company_code': 'VARCHAR', 'year': 'INTEGER', 'month': 'INTEGER'},
+    month_column='day'
+)
+
+ROLLUP_DIMENSIONS = ('day', 'po_company', 'po_branch', 'po_payto_id', 'po_payto_name')
+
+PO_ROLLUP_SCHEMA = pa.schema([
+    ('day', pa.date32()),
+    ('po_company', pa.string()),
+    ('po_branch', pa.string()),
+    ('po_payto_id', pa.string()),
+    ('po_payto_name', pa.string()),
+    ('order_count', pa.int64()),
+    ('total_spent', pa.float64()),
+    ('priced_count', pa.int64()),
+    ('min_order', pa.float64()),
+    ('max_order', pa.float64()),
+    ('first_order_date', pa.timestamp('us')),
+    ('last_order_date', pa.timestamp('us')),
+])
+
+
+class Aggregates(NamedTuple):
+    """SQL for the same measures over raw purchase orders or the rollups"""
+    date_column: str
+    order_count: str
+    total: str
+    average: str
+    min_total: str
+    max_total: str
+    first_date: str
+    last_date: str
+
+
+PO_AGGREGATES = Aggregates(
+    date_column='order_date',
+    order_count='COUNT(*)',
+    total='SUM(order_total)',
+    average='AVG(order_total)',
+    min_total='MIN(order_total)',
+    max_total='MAX(order_total)',
+    first_date='MIN(order_date)',
+    last_date='MAX(order_date)',
+)
+
+ROLLUP_AGGREGATES = Aggregates(
+    date_column='day',
+    order_count='CAST(COALESCE(SUM(order_count), 0) AS BIGINT)',
+    total='SUM(total_spent)',
+    average='SUM(total_spent) / NULLIF(SUM(priced_count), 0)',
+    min_total='MIN(min_order)',
+    max_total='MAX(max_order)',
+    first_date='MIN(first_order_date)',
+    last_date='MAX(last_order_date)',
+)
+
+
+_MEASURES = ('order_count', 'total_spent', 'priced_count', 'min_order', 'max_order', 'first_order_date', 'last_order_date')
+
+
+def _group(table: pa.Table, aggregations: List[tuple]) -> pa.Table:
+    """Group by ROLLUP_DIMENSIONS; aggregations are (column, function) in _MEASURES order"""
+    # Null keys form their own group, like GROUP BY in SQL
+    grouped = table.group_by(list(ROLLUP_DIMENSIONS), use_threads=False).aggregate(aggregations)
+    columns = {name: grouped[name] for name in ROLLUP_DIMENSIONS}
+    for measure, (column, function) in zip(_MEASURES, aggregations):
+        columns[measure] = grouped[f"{column}_{function}" if column else function]
+    return pa.table(columns).cast(PO_ROLLUP_SCHEMA)
+
+
+def daily_rollup(table: pa.Table) -> pa.Table:
+    """Aggregate purchase orders (PO_SCHEMA) to PO_ROLLUP_SCHEMA rows"""
+    table = table.append_column('day', pc.cast(table['order_date'], pa.date32()))
+    return _group(table, [
+        ([], 'count_all'),
+        ('order_total', 'sum'),
+        ('order_total', 'count'),
+        ('order_total', 'min'),
+        ('order_total', 'max'),
+        ('order_date', 'min'),
+        ('order_date', 'max'),
+    ])
+
+
+def merge_rollups(table: pa.Table) -> pa.Table:
+    """Re-aggregate rollup rows so each key appears once"""
+    return _group(table, [
+        ('order_count', 'sum'),
+        ('total_spent', 'sum'),
+        ('priced_count', 'sum'),
+        ('min_order', 'min'),
+        ('max_order', 'max'),
+        ('first_order_date', 'min'),
+        ('last_order_date', 'max'),
+    ])
+
+
+class PurchaseOrderRollups(PurchaseOrderDataset):
+    """Daily rollup dataset; write() takes the same raw rows as the purchase orders dataset"""
+
+    schema = PO_ROLLUP_SCHEMA
+    sort_columns = ROLLUP_DIMENSIONS
+    dictionary_columns = ROLLUP_DIMENSIONS[1:]
+
+    def __init__(self, s3_client, bucket: str, prefix: str = PO_ROLLUP_PREFIX):
+        super().__init__(s3_client, bucket, prefix)
+
+    def _partition_table(self, rows: pd.DataFrame) -> pa.Table:
+        return daily_rollup(to_partition_table(rows))
+
+    def _merge_fragments(self, tables: List[pa.Table]) -> pa.Table:
+        return merge_rollups(pa.concat_tables(tables))
+
+    def rebuild(self, source: PurchaseOrderDataset, company_code: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Recompute the rollups from the raw dataset
+
+        Writes one rollup fragment per raw partition and swaps them for the
+        existing rollups (of company_code, or all) in one commit. Rollups an
+        import commits while this runs are kept; run it when no imports are
+        in progress so none is counted twice.
+
+        Returns:
+            dict: partitions, rows read, rollup rows written, manifest key
+        """
+        scope = company_path(company_code) if company_code else ''
+        replaced = [entry['key'] for entry in self.files() if entry['key'].startswith(self.prefix + scope)]
+
+        partitions: Dict[str, List[str]] = {}
+        for entry in source.files():
+            if entry['key'].startswith(source.prefix + scope):
+                relative = entry['key'][len(source.prefix):].rsplit('/', 1)[0]
+                partitions.setdefault(relative, []).append(entry['key'])
+
+        batch_id = f"rebuild-{uuid.uuid4().hex}"
+        added = []
+        rows_read = 0
+        for directory, keys in sorted(partitions.items()):
+            table = pa.concat_tables([source._read_fragment(key) for key in keys])
+            rows_read += table.num_rows
+            added.append(self._put_fragment(daily_rollup(table), f"{self.prefix}{directory}/part-{batch_id}.parquet"))
+
+        manifest = self.log.commit(added, replaced, operation='rebuild', batch_id=batch_id)
+        logger.info(f"Rebuilt {len(added)} rollup partitions from {rows_read:,} rows under {self.uri}")
+
+        return {
+            'partitions': len(added),
+            'rows_read': rows_read,
+            'rollup_rows': sum(entry['rows'] for entry in added),
+            'manifest': manifest
+        }
@@ -8,7 +8,7 @@ abstracting away the ERP communication details.
 import re
 import json
 from typing import List, Dict, Any, Optional
-from .erp_client import erp_client, ERPClientError
+from .erp_client import erp_client, ERPClientError, ERPDeadlineExceeded
 
 class ProductService:
     """
@@ -239,6 +239,9 @@ class ProductService:
                         'error': f'PROD.CLASS update failed: {str(e)}',
                         'attempted_data': existing_prod_class if 'existing_prod_class' in locals() else 'Failed to get existing record'
                     }
+                    if isinstance(e, ERPDeadlineExceeded):
+                        # Keywords were saved; only the override update ran out of time
+                        response2['partial'] = True
 
             return {
                 'success': True,
@@ -0,0 +1,242 @@
+"""
+Token Store Service - Pluggable backends for ERP session token storage
+
+ERPClient keeps ERP session tokens in Redis so every gunicorn worker (and the
+Node.js backend) sees the same token. Two backends are available:
+
+- NativeRedisTokenStore: redis-py over a pooled TCP/TLS connection
+  (REDIS_URL=redis://... or rediss://...). Sub-millisecond lookups; multi-key
+  ops use MGET and pipelined SETEX.
+- UpstashRestTokenStore: the original Upstash REST API over HTTPS
+  (UPSTASH_REDIS_REST_URL / UPSTASH_REDIS_REST_TOKEN). Multi-key ops loop
+  over single-key calls.
+
+When both are configured the native store is used and falls back to the
+REST API if a Redis command fails.
+"""
+
+import logging
+from typing import Optional, Dict, List
+
+import requests
+from decouple import config
+
+logger = logging.getLogger(__name__)
+
+
+class TokenStore:
+    """Interface shared by all token store backends"""
+
+    name = 'none'
+
+    def get(self, key: str) -> Optional[str]:
+        """Get value for key, or None if missing/unavailable"""
+        return None
+
+    def set(self, key: str, value: str, ttl: int = 3600) -> bool:
+        """Set key with TTL in seconds; True on success"""
+        return False
+
+    def delete(self, key: str) -> bool:
+        """Delete key; True on success"""
+        return False
+
+    def get_many(self, keys: List[str]) -> Dict[str, Optional[str]]:
+        """Get several keys (one call per key unless the backend pipelines them)"""
+        return {key: self.get(key) for key in keys}
+
+    def set_many(self, values: Dict[str, str], ttl: int = 3600) -> bool:
+        """Set several keys with the same TTL; True if all were set"""
+        results = [self.set(key, value, ttl) for key, value in values.items()]
+        return all(results)
+
+    @property
+    def configured(self) -> bool:
+        return False
+
+
+class UpstashRestTokenStore(TokenStore):
+    """
+    Upstash Redis REST API backend (same as Node.js backend)
+
+    Uses one pooled requests.Session so the HTTPS connection to Upstash is
+    kept alive between calls.
+    """
+
+    name = 'upstash-rest'
+
+    def __init__(self, rest_url: Optional[str], rest_token: Optional[str], timeout: float = 5):
+        self.rest_url = rest_url
+        self.rest_token = rest_token
+        self.timeout = timeout
+        self._session = requests.Session()
+
+    @property
+    def configured(self) -> bool:
+        return bool(self.rest_url and self.rest_token)
+
+    def _headers(self) -> Dict[str, str]:
+        return {
+            'Authorization': f'Bearer {self.rest_token}',
+            'Content-Type': 'application/json'
+        }
+
+    def get(self, key: str) -> Optional[str]:
+        if not self.configured:
+            return None
+
+        try:
+            response = self._session.get(f"{self.rest_url}/get/{key}", headers=self._headers(), timeout=self.timeout)
+
+            if response.status_code == 200:
+                result = response.json()
+                return result.get('result')
+            return None
+
+        except Exception as e:
+            logger.error(f"Redis GET error for key {key}: {e}")
+            return None
+
+    def set(self, key: str, value: str, ttl: int = 3600) -> bool:
+        if not self.configured:
+            return False
+
+        try:
+            url = f"{self.rest_url}/setex/{key}/{ttl}/{value}"
+            response = self._session.post(url, headers=self._headers(), timeout=self.timeout)
+            return response.status_code == 200
+
+        except Exception as e:
+            logger.error(f"Redis SET error for key {key}: {e}")
+            return False
+
+    def delete(self, key: str) -> bool:
+        if not self.configured:
+            return False
+
+        try:
+            response = self._session.post(f"{self.rest_url}/del/{key}", headers=self._headers(), timeout=self.timeout)
+            return response.status_code == 200
+
+        except Exception as e:
+            logger.error(f"Redis DELETE error for key {key}: {e}")
+            return False
+
+
+class NativeRedisTokenStore(TokenStore):
+    """
+    Native Redis protocol backend using a redis-py connection pool
+
+    Redis errors (connection, timeout, and server replies such as AUTH,
+    READONLY or OOM) are logged and, if a fallback store is given, the same
+    operation is retried there.
+    """
+
+    name = 'redis-native'
+
+    def __init__(
+        self,
+        redis_url: str,
+        max_connections: int = 20,
+        socket_timeout: float = 2,
+        fallback: Optional[TokenStore] = None
+    ):
+        import redis
+
+        self._redis_errors = redis.RedisError
+        self.pool = redis.ConnectionPool.from_url(
+            redis_url,
+            max_connections=max_connections,
+            socket_timeout=socket_timeout,
+            socket_connect_timeout=socket_timeout,
+            health_check_interval=30,
+            decode_responses=True
+        )
+        self.client = redis.Redis(connection_pool=self.pool)
+        self.fallback = fallback if fallback is not None and fallback.configured else None
+
+    @property
+    def configured(self) -> bool:
+        return True
+
+    def _fall_back(self, op: str, error: Exception, *args):
+        if self.fallback is None:
+            logger.error(f"Redis {op} error: {error}")
+            return None
+        logger.warning(f"Redis {op} error: {error}, falling back to {self.fallback.name}")
+        return getattr(self.fallback, op)(*args)
+
+    def get(self, key: str) -> Optional[str]:
+        try:
+            return self.client.get(key)
+        except self._redis_errors as e:
+            return self._fall_back('get', e, key)
+
+    def set(self, key: str, value: str, ttl: int = 3600) -> bool:
+        try:
+            return bool(self.client.setex(key, ttl, value))
+        except self._redis_errors as e:
+            return bool(self._fall_back('set', e, key, value, ttl))
+
+    def delete(self, key: str) -> bool:
+        try:
+            self.client.delete(key)
+            return True
+        except self._redis_errors as e:
+            return bool(self._fall_back('delete', e, key))
+
+    def get_many(self, keys: List[str]) -> Dict[str, Optional[str]]:
+        """Fetch all keys with one MGET"""
+        if not keys:
+            return {}
+        try:
+            return dict(zip(keys, self.client.mget(keys)))
+        except self._redis_errors as e:
+            return self._fall_back('get_many', e, keys) or {key: None for key in keys}
+
+    def set_many(self, values: Dict[str, str], ttl: int = 3600) -> bool:
+        """Set all keys with pipelined SETEX commands in one round trip"""
+        if not values:
+            return True
+        try:
+            pipe = self.client.pipeline(transaction=False)
+            for key, value in values.items():
+                pipe.setex(key, ttl, value)
+            return all(pipe.execute())
+        except self._redis_errors as e:
+            return bool(self._fall_back('set_many', e, values, ttl))
+
+
+def get_token_store() -> TokenStore:
+    """
+    Build the token store from environment configuration
+
+    TOKEN_STORE_BACKEND selects 'redis', 'upstash' or 'auto' (default):
+    auto uses native Redis when REDIS_URL is set, else the Upstash REST API.
+    """
+    backend = config('TOKEN_STORE_BACKEND', default='auto').lower()
+    redis_url = config('REDIS_URL', default=None)
+
+    rest_store = UpstashRestTokenStore(
+        rest_url=config('UPSTASH_REDIS_REST_URL', default=None),
+        rest_token=config('UPSTASH_REDIS_REST_TOKEN', default=None),
+        timeout=config('UPSTASH_REDIS_TIMEOUT', default=5, cast=float)
+    )
+
+    if backend == 'upstash' or (backend == 'auto' and not redis_url):
+        return rest_store
+
+    if not redis_url:
+        logger.warning("TOKEN_STORE_BACKEND=redis but REDIS_URL is not set, using Upstash REST API")
+        return rest_store
+
+    try:
+        return NativeRedisTokenStore(
+            redis_url,
+            max_connections=config('REDIS_MAX_CONNECTIONS', default=20, cast=int),
+            socket_timeout=config('REDIS_SOCKET_TIMEOUT', default=2, cast=float),
+            fallback=rest_store
+        )
+    except Exception as e:
+        logger.error(f"Native Redis token store unavailable ({e}), using Upstash REST API")
+        return rest_store
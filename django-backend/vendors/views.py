@@ -15,7 +15,7 @@ from django.shortcuts import render, redirect
 from django.http import JsonResponse
 from django.views.decorators.http import require_http_methods
 from django.views.decorators.csrf import ensure_csrf_cookie
-from services.erp_client import erp_client, ERPClientError
+from services.erp_client import erp_client, ERPClientError, ERPDeadlineExceeded
 
 logger = logging.getLogger(__name__)
 
@@ -209,42 +209,58 @@ def get_shipfrom_vendors(request, payto_id):
         if not user_id or not company_api_base:
             return JsonResponse({'success': False, 'error': 'Not authenticated'}, status=401)
 
-        # Get vendor by ID to access shipFromLists
-        vendor = erp_client.make_erp_request(
-            user_id=user_id,
-            company_api_base=company_api_base,
-            method='GET',
-            endpoint=f'/Vendors/{payto_id}',
-            port=last_port
-        )
-
-        # Extract ship-from IDs
-        ship_from_ids = [item.get('shipFromId') for item in vendor.get('shipFromLists', []) if item.get('shipFromId')]
-
-        # Fetch each ship-from vendor
-        ship_from_vendors = []
-        for sf_id in ship_from_ids:
-            try:
-                sf_vendor = erp_client.make_erp_request(
-                    user_id=user_id,
-                    company_api_base=company_api_base,
-                    method='GET',
-                    endpoint=f'/Vendors/{sf_id}',
-                    port=last_port
-                )
-                ship_from_vendors.append(sf_vendor)
-            except ERPClientError as e:
-                logger.warning(f"Could not fetch ship-from vendor {sf_id}: {e}")
-                continue
+        # One deadline for the pay-to lookup and every ship-from lookup; any
+        # ship-from vendors that cannot be fetched in time are left out
+        with erp_client.request_budget() as budget:
+            # Get vendor by ID to access shipFromLists
+            vendor = erp_client.make_erp_request(
+                user_id=user_id,
+                company_api_base=company_api_base,
+                method='GET',
+                endpoint=f'/Vendors/{payto_id}',
+                port=last_port
+            )
+
+            # Extract ship-from IDs
+            ship_from_ids = [item.get('shipFromId') for item in vendor.get('shipFromLists', []) if item.get('shipFromId')]
+
+            # Fetch each ship-from vendor
+            ship_from_vendors = []
+            for sf_id in ship_from_ids:
+                try:
+                    sf_vendor = erp_client.make_erp_request(
+                        user_id=user_id,
+                        company_api_base=company_api_base,
+                        method='GET',
+                        endpoint=f'/Vendors/{sf_id}',
+                        port=last_port
+                    )
+                    ship_from_vendors.append(sf_vendor)
+                except ERPDeadlineExceeded:
+                    continue
+                except ERPClientError as e:
+                    logger.warning(f"Could not fetch ship-from vendor {sf_id}: {e}")
+                    continue
+
+        if budget.exhausted:
+            logger.warning(
+                f"Request budget exhausted fetching ship-from vendors for {payto_id}: "
+                f"{len(ship_from_vendors)} of {len(ship_from_ids)} returned"
+            )
 
         # Sort alphabetically by nameIndex
         ship_from_vendors.sort(key=lambda v: v.get('nameIndex', '').lower())
 
         return JsonResponse({
             'success': True,
-            'vendors': ship_from_vendors
+            'vendors': ship_from_vendors,
+            'partial': budget.exhausted,
+            'skipped': budget.skipped
         })
 
+    except ERPDeadlineExceeded as e:
+        logger.error(f"ERP deadline exceeded fetching ship-from vendors: {e}")
+        return JsonResponse({'success': False, 'error': str(e)}, status=504)
     except ERPClientError as e:
         logger.error(f"ERP error fetching ship-from vendors: {e}")
         return JsonResponse({'success': False, 'error': str(e)}, status=500)